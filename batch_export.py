@@ -0,0 +1,420 @@
+#    Copyright (C) 2013 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Export many documents using a pool of worker processes.
+
+The manifest is a JSON file holding a list of entries, each like
+  {"document": "plot.vsz",
+   "pages": [0, 2],
+   "output": "out/plot_%(page)i.png",
+   "options": {"dpi": 200, "color": true}}
+
+"pages" is optional, defaulting to every page in the document. In
+"output", %(page)i is replaced by the page number and %(name)s by the
+name of the document without its extension. "options" are keyword
+arguments of the Export command. Relative filenames are relative to the
+directory of the manifest.
+
+Each worker process keeps its Qt application and recently loaded
+documents between jobs. A JSON summary of the time taken by, or error
+from, each export is written when finished.
+"""
+
+import sys
+import os
+import time
+import json
+import optparse
+import traceback
+import threading
+import Queue
+import multiprocessing
+
+import veusz.qtall as qt4
+
+# worker state: the application and the loaded documents
+_app = None
+_doccache = []
+
+# number of documents each worker keeps loaded
+doccachesize = 4
+
+def initWorker(unsafe, plugins):
+    """Set up a worker process for exporting."""
+    global _app
+
+    if qt4.QApplication.instance() is None:
+        _app = qt4.QApplication([])
+
+    import veusz.setting as setting
+    import veusz.document as document
+    import veusz.widgets
+
+    setting.transient_settings['unsafe_mode'] = bool(unsafe)
+    if plugins:
+        document.Document.loadPlugins(pluginlist=plugins)
+
+def _linkedFileStats(doc):
+    """Get a list of the files linked to doc, with their modification
+    times and sizes (or None if missing)."""
+    stats = []
+    for link in doc.getLinkedFiles():
+        try:
+            st = os.stat(link.filename)
+            stats.append( (link.filename, (st.st_mtime, st.st_size)) )
+        except OSError:
+            stats.append( (link.filename, None) )
+    stats.sort()
+    return stats
+
+def getDocument(filename, text=None):
+    """Get a loaded document for filename, reusing one from the cache
+    if neither the file nor the files linked to the document have been
+    modified since it was loaded.
+
+    If text is given, the document is made by running the script
+    text instead, and filename is only used in error messages.
+
+    Returns (interpreter, time taken to load)
+    """
+    import veusz.document as document
+
+    if text is None:
+        key, mtime = filename, os.stat(filename).st_mtime
+    else:
+        key, mtime = ('text', text), None
+
+    for i, (k, ftime, linkstats, ci) in enumerate(_doccache):
+        if k == key:
+            del _doccache[i]
+            if ( ftime == mtime and
+                 linkstats == _linkedFileStats(ci.document) ):
+                _doccache.insert(0, (k, ftime, linkstats, ci))
+                return ci, 0.
+            break
+
+    start = time.time()
+    doc = document.Document()
+    ci = document.CommandInterpreter(doc)
+    if text is None:
+        ci.Load(filename)
+    else:
+        ci.run(text, filename=filename)
+    _doccache.insert(0, (key, mtime, _linkedFileStats(doc), ci))
+    del _doccache[doccachesize:]
+    return ci, time.time()-start
+
+def _result(filename, page, outfile, seconds, loadtime=0., error=None,
+            worker=None):
+    """Return result dict for the export of a page."""
+    if worker is None:
+        worker = os.getpid()
+    return { 'document': filename, 'page': page, 'output': outfile,
+             'seconds': seconds, 'load_seconds': loadtime,
+             'error': error, 'worker': worker }
+
+def _failedResults(job, seconds, error, worker=None):
+    """Return results for the pages of job, which failed with error.
+    The page is None if all the pages of the document were wanted."""
+    filename, pages, output, options = job
+    if pages is None:
+        pages = [None]
+    return [ _result(filename, page, None, seconds, error=error,
+                     worker=worker)
+             for page in pages ]
+
+def _exportJob(job):
+    """Export the pages of a document listed in job.
+
+    job is (document filename, list of pages or None for all pages,
+            output filename pattern, dict of Export options)
+    Returns a list of result dicts for the pages.
+    """
+    filename, pages, output, options = job
+    name = os.path.splitext(os.path.basename(filename))[0]
+
+    start = time.time()
+    try:
+        ci, loadtime = getDocument(filename)
+        if pages is None:
+            pages = range(ci.document.getNumberPages())
+    except Exception:
+        return _failedResults(job, time.time()-start, traceback.format_exc())
+
+    results = []
+    for page in pages:
+        start = time.time()
+        outfile = None
+        try:
+            outfile = output % {'page': page, 'name': name}
+            outdir = os.path.dirname(outfile)
+            if outdir and not os.path.isdir(outdir):
+                os.makedirs(outdir)
+            ci.interface.Export(outfile, page=page, **options)
+        except Exception:
+            results.append( _result(filename, page, outfile,
+                                    time.time()-start, loadtime,
+                                    traceback.format_exc()) )
+        else:
+            results.append( _result(filename, page, outfile,
+                                    time.time()-start, loadtime) )
+        # only charge the load time to the first page
+        loadtime = 0.
+    return results
+
+def _setMemoryLimit(megabytes):
+    """Limit the address space of this process."""
+    try:
+        import resource
+    except ImportError:
+        # not supported on this platform
+        return
+    limit = int(megabytes*1024*1024)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _workerMain(conn, jobfunc, unsafe, plugins, memlimit):
+    """Main loop of a worker process, running jobfunc on the jobs sent
+    over conn and sending back ('ok', value) or ('error', traceback)."""
+
+    initWorker(unsafe, plugins)
+    if memlimit:
+        _setMemoryLimit(memlimit)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        try:
+            reply = ('ok', jobfunc(job))
+        except Exception:
+            reply = ('error', traceback.format_exc())
+        conn.send(reply)
+
+class WorkerProcess(object):
+    """A worker process, with a pipe to send it jobs.
+
+    jobfunc is the module-level function run on each job. memlimit
+    is an optional limit on the memory used by the process in MB."""
+
+    # held while starting a process, so that no other worker is
+    # forked holding the child end of its pipe
+    startlock = threading.Lock()
+
+    def __init__(self, jobfunc, unsafe, plugins, memlimit=None):
+        with self.startlock:
+            self.conn, child = multiprocessing.Pipe()
+            self.process = multiprocessing.Process(
+                target=_workerMain,
+                args=(child, jobfunc, unsafe, plugins, memlimit))
+            self.process.daemon = True
+            self.process.start()
+            child.close()
+
+    # how often to check whether the process is still alive
+    pollinterval = 0.5
+
+    def run(self, job, timeout):
+        """Run job, returning the reply, or None if it took longer than
+        timeout seconds or the process died."""
+
+        # the pipe may not be closed when the process dies, if another
+        # process has inherited it, so check the process is alive
+        start = time.time()
+        try:
+            self.conn.send(job)
+            while not self.conn.poll(self.pollinterval):
+                if not self.process.is_alive():
+                    return None
+                if timeout is not None and time.time()-start > timeout:
+                    return None
+            return self.conn.recv()
+        except (EOFError, IOError):
+            return None
+
+    def stop(self):
+        """Stop the process."""
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+def readManifest(filename):
+    """Read manifest, returning a list of jobs to pass to _exportJob.
+
+    Listed pages are exported as separate jobs, so the pages of a
+    document can be shared between workers."""
+
+    f = open(filename, 'rU')
+    try:
+        entries = json.load(f)
+    finally:
+        f.close()
+
+    basedir = os.path.dirname(os.path.abspath(filename))
+    jobs = []
+    for entry in entries:
+        docfile = os.path.join(basedir, entry['document'])
+        output = os.path.join(basedir, entry['output'])
+        options = dict( [(str(k), v) for k, v in
+                         entry.get('options', {}).iteritems()] )
+        pages = entry.get('pages')
+        if pages is None:
+            jobs.append( (docfile, None, output, options) )
+        else:
+            for page in pages:
+                jobs.append( (docfile, [int(page)], output, options) )
+    return jobs
+
+def batchExport(jobs, processes=None, unsafe=False, plugins=None,
+                progress=None, timeout=None):
+    """Run export jobs in a pool of processes.
+
+    processes is the number of worker processes (default number of CPUs)
+    progress is an optional function called with each list of results
+    timeout is an optional time limit in seconds for each job. Jobs
+     taking longer, or whose worker dies, are recorded as failed and
+     the worker replaced.
+    Returns a list of result dicts.
+    """
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    results = []
+    if processes <= 1:
+        # no point starting another process
+        initWorker(unsafe, plugins)
+        for job in jobs:
+            res = _exportJob(job)
+            if progress is not None:
+                progress(res)
+            results += res
+        return results
+
+    jobqueue = Queue.Queue()
+    for job in jobs:
+        jobqueue.put(job)
+    lock = threading.Lock()
+
+    def runjobs(worker):
+        """Run jobs from the queue on worker, until none are left."""
+        try:
+            while True:
+                try:
+                    job = jobqueue.get_nowait()
+                except Queue.Empty:
+                    break
+
+                start = time.time()
+                reply = worker.run(job, timeout)
+                if reply is None:
+                    # the worker is stuck or has died, so replace it
+                    res = _failedResults(
+                        job, time.time()-start,
+                        'Export timed out or its worker failed',
+                        worker=worker.process.pid)
+                    worker.stop()
+                    worker = WorkerProcess(_exportJob, unsafe, plugins)
+                elif reply[0] == 'error':
+                    res = _failedResults(job, time.time()-start, reply[1],
+                                         worker=worker.process.pid)
+                else:
+                    res = reply[1]
+
+                with lock:
+                    if progress is not None:
+                        progress(res)
+                    results.extend(res)
+        finally:
+            worker.stop()
+
+    # start the workers one after another before the threads, so
+    # that a worker is not forked while another is being set up
+    workers = [ WorkerProcess(_exportJob, unsafe, plugins)
+                for i in xrange(min(processes, len(jobs))) ]
+
+    # a thread sends jobs to each worker process
+    threads = [ threading.Thread(target=runjobs, args=(w,))
+                for w in workers ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def runbatch(args):
+    """Run batch export from the command line, returning exit status."""
+
+    parser = optparse.OptionParser(
+        usage='%prog --export-batch [options] manifest.json')
+    parser.add_option('--processes', type='int', metavar='N',
+                      help='number of worker processes (default is '
+                      'number of CPUs)')
+    parser.add_option('--summary', metavar='FILE',
+                      help='write JSON summary of exports to this file '
+                      '(default is manifest name with .summary.json)')
+    parser.add_option('--timeout', type='float', metavar='SECS',
+                      help='time limit for each export job')
+    parser.add_option('--unsafe-mode', action='store_true',
+                      help='disable safety checks when running documents')
+    parser.add_option('--plugin', action='append', metavar='FILE',
+                      help='load the plugin from the file given')
+    parser.add_option('--quiet', action='store_true',
+                      help='do not report failures as they happen')
+    options, args = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error('a single manifest file is required')
+
+    manifest = args[0]
+    summaryfile = options.summary
+    if summaryfile is None:
+        summaryfile = os.path.splitext(manifest)[0] + '.summary.json'
+
+    def progress(results):
+        if options.quiet:
+            return
+        for res in results:
+            if res['error']:
+                sys.stderr.write('Failed to export %s page %s:\n%s' % (
+                        res['document'], res['page'], res['error']))
+
+    start = time.time()
+    jobs = readManifest(manifest)
+    results = batchExport(jobs, processes=options.processes,
+                          unsafe=options.unsafe_mode,
+                          plugins=options.plugin, progress=progress,
+                          timeout=options.timeout)
+    failed = len([r for r in results if r['error']])
+
+    summary = { 'manifest': os.path.abspath(manifest),
+                'exports': len(results),
+                'failed': failed,
+                'seconds': time.time()-start,
+                'results': results }
+    f = open(summaryfile, 'w')
+    try:
+        json.dump(summary, f, indent=1)
+    finally:
+        f.close()
+
+    if failed:
+        return 1
+    return 0
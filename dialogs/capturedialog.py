@@ -198,7 +198,7 @@ class CaptureDialog(VeuszDialog):
 
         stream.maxlines = maxlines
         stream.timeout = timeout
-        simpleread.tail = tail
+        simpleread.setStreaming(tail)
         cd = CapturingDialog(self.document, simpleread, stream, self,
                              updateinterval=updateinterval)
         self.mainwindow.showDialog(cd)
@@ -224,6 +224,7 @@ class CapturingDialog(VeuszDialog):
         self.document = document
         self.simpleread = simpleread
         self.stream = stream
+        self.updateinterval = updateinterval
 
         # connect buttons
         self.connect( self.finishButton, qt4.SIGNAL('clicked()'),
@@ -272,6 +273,10 @@ class CapturingDialog(VeuszDialog):
             # stream tells us it's time to finish
             self.streamCaptureFinished( unicode(e) )
 
+        if not self.updateinterval:
+            # keep memory bounded if not updating the document
+            self.simpleread.collectStreams()
+
     def slotDisplayTimer(self):
         """Time to update information about data source."""
         self.statusLabel.setText( self.txt_statusLabel %
@@ -294,16 +299,15 @@ class CapturingDialog(VeuszDialog):
     def slotUpdateTimer(self):
         """Called to update document while data is being captured."""
 
-        # undo any previous update
         if self.updateoperation:
-            self.updateoperation.undo(self.document)
-
-        # create new one
-        self.updateoperation = document.OperationDataCaptureSet(
-            self.simpleread)
-
-        # apply it (bypass history here - urgh)
-        self.updateoperation.do(self.document)
+            # append new data to the datasets in the document
+            self.updateoperation.update(self.document)
+        else:
+            self.updateoperation = document.OperationDataCaptureSet(
+                self.simpleread)
+
+            # apply it (bypass history here - urgh)
+            self.updateoperation.do(self.document)
         self.document.setModified()
 
     def streamCaptureFinished(self, message):
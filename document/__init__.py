@@ -32,3 +32,4 @@ from painthelper import *
 from export import Export
 from dbusinterface import *
 from importparams import *
+from archive import *
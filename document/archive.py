@@ -0,0 +1,162 @@
+#    Copyright (C) 2013 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Documents saved as zip archives.
+
+An archive holds the document script, plus a NPY file for each array of
+the embedded datasets. The arrays are stored uncompressed, so that they
+can be memory-mapped from the archive when it is loaded, rather than
+being read in.
+"""
+
+import os
+import struct
+import tempfile
+import zipfile
+import cStringIO
+
+import numpy as N
+from numpy.lib import format as npyformat
+
+import veusz.plugins as plugins
+
+# filename extension of archived documents
+archive_extension = 'vszz'
+
+# name of script inside archive
+script_member = 'document.vsz'
+
+def isArchive(filename):
+    """Is the file a document archive, rather than a script?"""
+    return zipfile.is_zipfile(filename)
+
+class ArchiveScript(object):
+    """A file-like object to pass to Document.saveToFile, which writes the
+    document to an archive.
+
+    Datasets add their arrays to the archive with addArray, instead of
+    writing them to the script as text. Call close() to finish writing.
+    """
+
+    def __init__(self, filename):
+        # name is used to make import paths relative to the archive
+        self.name = filename
+        self.script = []
+        self.arraycount = 0
+
+        # write to a temporary file, so an existing archive (which
+        # may be mapped by the current document) is replaced cleanly
+        fd, self.tempname = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(filename)), suffix='.tmp')
+        os.close(fd)
+        self.zip = zipfile.ZipFile(self.tempname, 'w', zipfile.ZIP_STORED,
+                                   allowZip64=True)
+
+    def write(self, text):
+        """Add text to the document script."""
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        self.script.append(text)
+
+    def addArray(self, array):
+        """Add numpy array to the archive, returning its member name."""
+        member = 'data/%i.npy' % self.arraycount
+        self.arraycount += 1
+
+        buf = cStringIO.StringIO()
+        npyformat.write_array(buf, N.asarray(array))
+        self.zip.writestr(member, buf.getvalue())
+        return member
+
+    def close(self):
+        """Finish writing the archive."""
+        self.zip.writestr(script_member, ''.join(self.script))
+        self.zip.close()
+
+        try:
+            os.rename(self.tempname, self.name)
+        except OSError:
+            # windows cannot rename over an existing file
+            os.remove(self.name)
+            os.rename(self.tempname, self.name)
+
+    def abort(self):
+        """Give up writing the archive."""
+        self.zip.close()
+        os.remove(self.tempname)
+
+class ArchiveReader(object):
+    """Read the script and arrays from a document archive."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.zip = zipfile.ZipFile(filename, 'r')
+
+    def readScript(self):
+        """Return the text of the document script."""
+        return self.zip.read(script_member)
+
+    def _dataOffset(self, info):
+        """Get the offset in the archive of the data of member info."""
+        f = open(self.filename, 'rb')
+        try:
+            f.seek(info.header_offset)
+            header = f.read(30)
+        finally:
+            f.close()
+
+        # the local header has the lengths of the name and extra field
+        namelen, extralen = struct.unpack('<HH', header[26:30])
+        return info.header_offset + 30 + namelen + extralen
+
+    def getArray(self, member):
+        """Return the array in member.
+
+        Uncompressed numeric arrays are memory-mapped from the
+        archive, so that their values are only read when needed.
+        """
+        info = self.zip.getinfo(member)
+        if info.compress_type == zipfile.ZIP_STORED:
+            offset = self._dataOffset(info)
+            f = open(self.filename, 'rb')
+            try:
+                f.seek(offset)
+                version = npyformat.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran, dtype = npyformat.read_array_header_1_0(f)
+                else:
+                    shape, fortran, dtype = npyformat.read_array_header_2_0(f)
+                offset = f.tell()
+            finally:
+                f.close()
+
+            if not dtype.hasobject:
+                if fortran:
+                    return plugins.memmapArray(
+                        self.filename, dtype, offset=offset,
+                        shape=shape[::-1]).T
+                else:
+                    return plugins.memmapArray(
+                        self.filename, dtype, offset=offset, shape=shape)
+
+        # read the array into memory instead
+        return N.load(cStringIO.StringIO(self.zip.read(member)))
+
+    def close(self):
+        """Finish reading (any mapped arrays remain valid)."""
+        self.zip.close()
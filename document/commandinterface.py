@@ -27,6 +27,8 @@ external programs.
 import os.path
 import traceback
 
+import numpy as N
+
 import veusz.qtall as qt4
 import veusz.setting as setting
 import veusz.embed as embed
@@ -39,6 +41,8 @@ import operations
 import dataset_histo
 import mime
 import export
+import archive
+import fitbatch
 
 class CommandInterface(qt4.QObject):
     """Class provides command interface."""
@@ -52,6 +56,7 @@ class CommandInterface(qt4.QObject):
         'CloneWidget',
         'CreateHistogram',
         'DatasetPlugin',
+        'FitBatch',
         'Get',
         'GetChildren',
         'GetData',
@@ -71,6 +76,7 @@ class CommandInterface(qt4.QObject):
         'Remove',
         'RemoveCustom',
         'Rename',
+        'RenderToBuffer',
         'ResolveReference',
         'Set',
         'SetToReference',
@@ -80,6 +86,7 @@ class CommandInterface(qt4.QObject):
         'SetData2DExpressionXYZ',
         'SetData2DXYFunc',
         'SetDataDateTime',
+        'SetDataArchive',
         'SetDataExpression',
         'SetDataRange',
         'SetDataText',
@@ -106,6 +113,12 @@ class CommandInterface(qt4.QObject):
         self.verbose = False
         self.importpath = []
 
+        # archive.ArchiveReader of document archive being loaded
+        self.archive = None
+
+        # (key, PaintHelper) of page last rendered by RenderToBuffer
+        self.renderhelper = None
+
         self.connect( self.document, qt4.SIGNAL("sigWiped"),
                       self.slotWipedDoc )
 
@@ -283,6 +296,89 @@ class CommandInterface(qt4.QObject):
             print "Used dataset plugin %s to make datasets %s" % (
                 pluginname, ', '.join(outdatasets))
 
+    def FitBatch(self, function, values, tag, xdata, outprefix='fit_',
+                 variable='x', processes=None):
+        """Fit a function separately to each dataset with a tag.
+
+        function: expression to fit, of variable and the parameters
+        values: dict of parameter names to starting values
+        tag: fit to the datasets with this tag
+        xdata: name of dataset with values of variable
+        outprefix: prefix of names of output datasets
+        variable: name of the independent variable in function
+        processes: number of worker processes to fit in (None for
+         the number of CPUs)
+
+        Creates datasets for each parameter, plus chi2, dof and a text
+        dataset of the names of the datasets fitted, with one value for
+        each dataset fitted.
+        """
+
+        doc = self.document
+
+        comp = datasets.exprcache.compile(function, securityonly=False)
+        if comp.checked is not None:
+            raise RuntimeError, "Unsafe fit function '%s'" % function
+        if comp.code is None:
+            raise RuntimeError, comp.error
+
+        names = sorted(values.keys())
+        params = N.array( [float(values[n]) for n in names] )
+        if xdata not in doc.data:
+            raise RuntimeError, "No dataset '%s' for x values" % xdata
+        xvals = doc.data[xdata].data
+
+        dsnames = sorted( [name for name, ds in doc.data.iteritems()
+                           if tag in ds.tags and ds.dimensions == 1 and
+                           ds.datatype == 'numeric' and name != xdata] )
+        if not dsnames:
+            raise RuntimeError, "No datasets with tag '%s'" % tag
+
+        # get values and errors of datasets, the same length as x
+        yvalslist, errorslist = [], []
+        for name in dsnames:
+            ds = doc.data[name]
+            yvals = ds.data
+            errors = ds.serr
+            if errors is None:
+                if ds.perr is not None and ds.nerr is not None:
+                    errors = N.sqrt( 0.5*(ds.perr**2 + ds.nerr**2) )
+                else:
+                    # assume 5% errors, as in fit widget
+                    errors = N.clip(N.abs(yvals)*0.05, 1e-8, N.inf)
+
+            y = N.zeros(len(xvals)) + N.nan
+            e = N.zeros(len(xvals)) + N.nan
+            num = min(len(xvals), len(yvals))
+            y[:num] = yvals[:num]
+            e[:num] = errors[:num]
+            yvalslist.append(y)
+            errorslist.append(e)
+
+        results = fitbatch.fitBatch(
+            doc.allowedCustoms(), function, variable, names, params,
+            xvals, yvalslist, errorslist, processes=processes)
+
+        # make output datasets in one operation
+        ops = []
+        for i, name in enumerate(names):
+            ops.append( operations.OperationDatasetSet(
+                    outprefix+name,
+                    datasets.Dataset(data=[r[0][i] for r in results])) )
+        ops.append( operations.OperationDatasetSet(
+                outprefix+'chi2',
+                datasets.Dataset(data=[r[1] for r in results])) )
+        ops.append( operations.OperationDatasetSet(
+                outprefix+'dof',
+                datasets.Dataset(data=[r[2] for r in results])) )
+        ops.append( operations.OperationDatasetSet(
+                outprefix+'datasets', datasets.DatasetText(dsnames)) )
+        doc.applyOperation( operations.OperationMultiple(
+                ops, descr='batch fit') )
+
+        if self.verbose:
+            print "Fitted %i datasets with tag '%s'" % (len(dsnames), tag)
+
     def Remove(self, name):
         """Remove a widget from the dataset."""
         w = self.document.resolve(self.currentwidget, name)
@@ -360,9 +456,16 @@ class CommandInterface(qt4.QObject):
             return None
 
     def Save(self, filename):
-        """Save the state to a file."""
-        f = open(filename, 'w')
-        self.document.saveToFile(f)
+        """Save the state to a file.
+
+        If the filename has the archive extension, save an archive
+        holding the dataset values in binary form."""
+        ext = os.path.splitext(filename)[1]
+        if ext == '.' + archive.archive_extension:
+            self.document.saveToArchive(filename)
+        else:
+            f = open(filename, 'w')
+            self.document.saveToFile(f)
 
     def Set(self, var, val):
         """Set the value of a setting."""
@@ -400,6 +503,37 @@ class CommandInterface(qt4.QObject):
             print " Negative errors = %s" % str( data.nerr )
             print " Positive errors = %s" % str( data.perr )
 
+    def SetDataArchive(self, name, columns, dstype='1d', xrange=None,
+                       yrange=None):
+        """Set dataset from arrays in the document archive being loaded.
+
+        columns is a dict of dataset columns (data, serr, nerr, perr) to
+        the archive members holding them
+        dstype is '1d', 'date' or '2d'
+        xrange and yrange are the ranges of 2d datasets
+        """
+
+        if self.archive is None:
+            raise RuntimeError("No document archive is being loaded")
+
+        arrays = {}
+        for col, member in columns.iteritems():
+            arrays[col] = self.archive.getArray(member)
+
+        if dstype == '2d':
+            ds = datasets.Dataset2D(arrays['data'], xrange=xrange,
+                                    yrange=yrange)
+        elif dstype == 'date':
+            ds = datasets.DatasetDateTime(arrays['data'])
+        elif len(arrays) == 1 and arrays['data'].dtype != N.float64:
+            # keep values of other types mapped, rather than converting
+            ds = datasets.DatasetMemmap(arrays['data'])
+        else:
+            ds = datasets.Dataset(**arrays)
+
+        op = operations.OperationDatasetSet(name, ds)
+        self.document.applyOperation(op)
+
     def SetDataDateTime(self, name, vals):
         """Set datetime dataset to be values given.
         vals is a list of python datetime objects
@@ -904,6 +1038,33 @@ class CommandInterface(qt4.QObject):
                           pdfdpi=pdfdpi, svgtextastext=svgtextastext)
         e.export()
 
+    def RenderToBuffer(self, page=0, format='png', dpi=100,
+                       antialias=True, quality=85, backcolor='#ffffff00'):
+        """Render page to an image in memory, rather than a file.
+
+        format is 'png', 'jpg', 'bmp', 'tiff' or 'xpm' to return a string
+         holding the image file, or 'rgba' to return a numpy array of
+         the pixels (uint8 values with shape height, width, 4)
+        page is the pagenumber to render
+        dpi is the number of dots per inch of the image
+        antialias antialiases output if True
+        quality is a quality parameter for jpeg output
+        backcolor is the background color, which is a name or
+         a #RRGGBBAA value (red, green, blue, alpha)
+
+        The painted page is kept, so it is not painted again if the
+        document has not changed.
+        """
+
+        e = export.Export(self.document, None, page, bitmapdpi=dpi,
+                          antialias=antialias, quality=quality,
+                          backcolor=backcolor)
+
+        key = (self.document.changeset, page, dpi)
+        if self.renderhelper is None or self.renderhelper[0] != key:
+            self.renderhelper = (key, e.recordPage(dpi))
+        return e.renderToBuffer(format, helper=self.renderhelper[1])
+
     def Rename(self, widget, newname):
         """Rename the widget with the path given to the new name.
 
@@ -47,6 +47,7 @@ import pickle
 import os.path
 
 from commandinterface import CommandInterface
+import archive
 import veusz.utils as utils
 
 class CommandInterpreter(object):
@@ -175,17 +176,31 @@ class CommandInterpreter(object):
     def Load(self, filename):
         """Replace the document with a new one from the filename."""
 
-        f = open(filename, 'rU')
-        self.document.wipe()
-        self.interface.To('/')
-        oldfile = self.globals['__file__']
-        self.globals['__file__'] = os.path.abspath(filename)
-
-        self.interface.importpath.append(
-            os.path.dirname(os.path.abspath(filename)))
-        self.runFile(f)
-        self.interface.importpath.pop()
-        self.globals['__file__'] = oldfile
+        reader = None
+        if archive.isArchive(filename):
+            reader = archive.ArchiveReader(filename)
+        try:
+            if reader is not None:
+                f = reader.readScript()
+            else:
+                f = open(filename, 'rU')
+            self.document.wipe()
+            self.interface.To('/')
+            oldfile = self.globals['__file__']
+            self.globals['__file__'] = os.path.abspath(filename)
+
+            self.interface.importpath.append(
+                os.path.dirname(os.path.abspath(filename)))
+            self.interface.archive = reader
+            try:
+                self.runFile(f)
+            finally:
+                self.interface.archive = None
+                self.interface.importpath.pop()
+                self.globals['__file__'] = oldfile
+        finally:
+            if reader is not None:
+                reader.close()
         self.document.setModified()
         self.document.setModified(False)
         self.document.clearHistory()
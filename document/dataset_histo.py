@@ -17,7 +17,8 @@
 ###############################################################################
 
 import numpy as N
-from datasets import Dataset, simpleEvalExpression
+from datasets import Dataset, simpleEvalExpression, exprDatasetNames, \
+    DatasetInputTracker
 import veusz.qtall as qt4
 
 def _(text, disambiguation=None, context="Datasets"):
@@ -40,7 +41,10 @@ class DatasetHistoGenerator(object):
         errors = True/False
         """
 
-        self.changeset = -1
+        # increased when the input data are reevaluated
+        self.changeset = 0
+        self.inputs = DatasetInputTracker()
+        self.bindataset = self.valuedataset = None
 
         self.document = document
         self.inexpr = inexpr
@@ -52,9 +56,12 @@ class DatasetHistoGenerator(object):
 
     def getData(self):
         """Get data from input expression, caching result."""
-        if self.document.changeset != self.changeset:
+        if self.inputs.isOutOfDate(self.document):
             self._cacheddata = simpleEvalExpression(self.document, self.inexpr)
-            self.changeset = self.document.changeset
+            self.changeset += 1
+            self.inputs.setEvaluated(
+                self.document, exprDatasetNames(self.inexpr),
+                (self.bindataset, self.valuedataset))
         return self._cacheddata
 
     def binLocations(self):
@@ -206,16 +213,20 @@ class DatasetHistoBins(Dataset):
         self.generator = generator
         self.document = document
         self.linked = None
-        self._invalidpoints = None
         self.changeset = -1
 
     def getData(self):
         """Get bin positions, caching results."""
-        if self.changeset != self.generator.document.changeset:
+        self.generator.getData()
+        if self.changeset != self.generator.changeset:
             self.datacache = self.generator.getBinLocations()
-            self.changeset = self.generator.document.changeset
+            self.changeset = self.generator.changeset
         return self.datacache
 
+    def refresh(self):
+        """Recompute histogram if input data have changed."""
+        self.getData()
+
     def saveToFile(self, fileobj, name):
         """Save dataset (counterpart does this)."""
         pass
@@ -239,16 +250,20 @@ class DatasetHistoValues(Dataset):
         self.generator = generator
         self.document = document
         self.linked = None
-        self._invalidpoints = None
         self.changeset = -1
 
     def getData(self):
         """Get bin heights, caching results."""
-        if self.changeset != self.generator.document.changeset:
+        self.generator.getData()
+        if self.changeset != self.generator.changeset:
             self.datacache = self.generator.getBinVals()
-            self.changeset = self.generator.document.changeset
+            self.changeset = self.generator.changeset
         return self.datacache
 
+    def refresh(self):
+        """Recompute histogram if input data have changed."""
+        self.getData()
+
     def saveToFile(self, fileobj, name):
         """Save dataset and its counterpart to a file."""
         self.generator.saveToFile(fileobj)
@@ -20,7 +20,9 @@
 """Classes to represent datasets."""
 
 import re
+import math
 from itertools import izip
+from collections import OrderedDict
 
 import numpy as N
 
@@ -28,6 +30,8 @@ import veusz.qtall as qt4
 import veusz.utils as utils
 import veusz.setting as setting
 
+import archive
+
 def _(text, disambiguation=None, context="Datasets"):
     """Translate text."""
     return unicode(
@@ -126,6 +130,160 @@ class DatasetException(Exception):
     """Raised with dataset errors."""
     pass
 
+class DatasetStats(object):
+    """Statistics of the values of a dataset, which are calculated when
+    first needed and then kept.
+
+    DatasetBase.stats() returns the same object until the values of
+    the dataset change, so that the statistics can be shared by the
+    widgets using the dataset. The arrays returned should not be
+    modified.
+    """
+
+    # number of bins in histogram sketch
+    histobins = 64
+
+    def __init__(self, data, serr=None, nerr=None, perr=None):
+        self.data = data
+        self.serr = serr
+        self.nerr = nerr
+        self.perr = perr
+        self.cache = {}
+
+    def _cached(self, name, calcfn):
+        """Return cached value name, calling calcfn() if missing."""
+        try:
+            return self.cache[name]
+        except KeyError:
+            val = self.cache[name] = calcfn()
+            return val
+
+    def finiteData(self):
+        """Finite data values, as a 1D array."""
+        def calc():
+            d = N.ravel(self.data)
+            return d[N.isfinite(d)]
+        return self._cached('finite', calc)
+
+    def numFinite(self):
+        """Number of finite data values."""
+        return len(self.finiteData())
+
+    def dataRange(self):
+        """Range of finite data values, ignoring errors.
+        Returns None if there are none."""
+        def calc():
+            d = self.finiteData()
+            if len(d) == 0:
+                return None
+            return d.min(), d.max()
+        return self._cached('datarange', calc)
+
+    def invalidPoints(self):
+        """Bool array which is True for data points where any value
+        is not finite."""
+        def calc():
+            invalid = N.logical_not(N.isfinite(self.data))
+            for error in self.serr, self.perr, self.nerr:
+                if error is not None:
+                    invalid = N.logical_or(invalid,
+                                           N.logical_not(N.isfinite(error)))
+            return invalid
+        return self._cached('invalid', calc)
+
+    def pointRanges(self):
+        """Finite minimum and maximum coordinates of the points,
+        including errors, as (minima, maxima)."""
+        def calc():
+            minvals = self.data.copy()
+            maxvals = self.data.copy()
+
+            if self.serr is not None:
+                minvals -= self.serr
+                maxvals += self.serr
+            if self.nerr is not None:
+                minvals += self.nerr
+            if self.perr is not None:
+                maxvals += self.perr
+
+            return ( minvals[N.isfinite(minvals)],
+                     maxvals[N.isfinite(maxvals)] )
+        return self._cached('pointranges', calc)
+
+    def range(self):
+        """Range of coordinates, including errors.
+        Returns None if there are no finite values."""
+        def calc():
+            if ( self.serr is None and self.nerr is None and
+                 self.perr is None ):
+                return self.dataRange()
+            minvals, maxvals = self.pointRanges()
+            if len(minvals) > 0 and len(maxvals) > 0:
+                return minvals.min(), maxvals.max()
+            return None
+        return self._cached('range', calc)
+
+    def sortedData(self):
+        """Sorted copy of the finite data values."""
+        def calc():
+            d = self.finiteData().copy()
+            d.sort()
+            return d
+        return self._cached('sorted', calc)
+
+    def kthValue(self, k):
+        """The k-th smallest finite value, counting from 0."""
+        return self.sortedData()[k]
+
+    def percentile(self, perc):
+        """Percentile perc of the finite values, interpolating between
+        values. Returns nan if there are none."""
+        num = self.numFinite()
+        if num == 0:
+            return N.nan
+        frac, index = math.modf(perc * 0.01 * (num-1))
+        index = int(index)
+        val = self.kthValue(index)
+        if frac > 0:
+            val = (1-frac)*val + frac*self.kthValue(min(index+1, num-1))
+        return val
+
+    def mean(self):
+        """Mean of the finite values."""
+        return self._cached('mean', lambda: N.mean(self.finiteData()))
+
+    def std(self):
+        """Standard deviation of the finite values."""
+        return self._cached('std', lambda: N.std(self.finiteData()))
+
+    def lastBelow(self, val):
+        """Largest finite value less than val, or None if there is none."""
+        d = self.sortedData()
+        idx = N.searchsorted(d, val)
+        if idx == 0:
+            return None
+        return d[idx-1]
+
+    def valuesOutside(self, minval, maxval):
+        """Sorted finite values less than minval or greater than maxval."""
+        d = self.sortedData()
+        return d[ (d < minval) | (d > maxval) ]
+
+    def histogram(self):
+        """A coarse histogram of the finite values, to estimate their
+        distribution. Returns (counts, bin edges) or None if there are
+        no finite values."""
+        def calc():
+            drange = self.dataRange()
+            if drange is None:
+                return None
+            minval, maxval = drange
+            if minval == maxval:
+                minval, maxval = minval-0.5, maxval+0.5
+            return N.histogram(self.finiteData(), bins=self.histobins,
+                               range=(minval, maxval))
+        return self._cached('histogram', calc)
+
 class DatasetBase(object):
     """A base dataset class."""
 
@@ -151,6 +309,14 @@ class DatasetBase(object):
     # changeset
     isstable = False
 
+    # class of object returned by stats()
+    statsclass = DatasetStats
+
+    # incremented if the values of the dataset are modified in place
+    statschangeset = 0
+    # cached (statschangeset, arrays, DatasetStats)
+    _statscache = None
+
     def __init__(self, linked=None):
         """Initialise common members."""
         # document member set when this dataset is set in document
@@ -183,6 +349,43 @@ class DatasetBase(object):
                 return name
         raise ValueError('Could not find self in document.data')
 
+    def _addColumnsToArchive(self, archivescript):
+        """Add the arrays of the dataset to an archive.ArchiveScript,
+        returning a dict of the archive member for each column."""
+        members = {}
+        for col in self.columns:
+            array = getattr(self, col)
+            if array is not None:
+                members[col] = archivescript.addArray(array)
+        return members
+
+    def _statsArrays(self):
+        """Return arrays to calculate DatasetStats for."""
+        return [self.data]
+
+    def _statsKey(self):
+        """Return list of objects which are replaced if the values of
+        the dataset change, other than by modification in place."""
+        return self._statsArrays()
+
+    def stats(self):
+        """Return DatasetStats for the current values of the dataset."""
+        key = self._statsKey()
+        cache = self._statscache
+        if ( cache is None or cache[0] != self.statschangeset or
+             len(cache[1]) != len(key) or
+             [a for a, b in izip(cache[1], key) if a is not b] ):
+            # values have been modified or replaced since last time
+            cache = self._statscache = (
+                self.statschangeset, key,
+                self.statsclass(*self._statsArrays()) )
+        return cache[2]
+
+    def invalidateStats(self):
+        """Forget DatasetStats after the values are modified in place.
+        This is called by Document.modifiedData."""
+        self.statschangeset += 1
+
     def userSize(self):
         """Return dimensions of dataset for user."""
         return ""
@@ -261,6 +464,11 @@ class DatasetBase(object):
         """Is it possible to rename this dataset?"""
         return self.linked is None
 
+    def refresh(self):
+        """Bring dataset up to date, if it is computed from other
+        datasets. Does nothing otherwise."""
+        pass
+
     def datasetAsText(self, fmt='%g', join='\t'):
         """Return dataset as text (for use by user)."""
         return ''
@@ -322,6 +530,14 @@ class Dataset2D(DatasetBase):
         if self.linked is not None:
             return
 
+        if isinstance(fileobj, archive.ArchiveScript):
+            # put the values in the archive rather than the script
+            fileobj.write("SetDataArchive(%s, %s, dstype='2d', "
+                          "xrange=%s, yrange=%s)\n" % (
+                    repr(name), repr({'data': fileobj.addArray(self.data)}),
+                    repr(tuple(self.xrange)), repr(tuple(self.yrange))))
+            return
+
         fileobj.write("ImportString2D(%s, '''\n" % repr(name))
         fileobj.write("xrange %e %e\n" % self.xrange)
         fileobj.write("yrange %e %e\n" % self.yrange)
@@ -418,8 +634,6 @@ class Dataset(DatasetBase):
                 raise DatasetException('Lengths of error data do not match data')
 
         # finally assign data
-        self._invalidpoints = None
-
         try:
             if not hasattr(self, 'data'):
                 self.data = data
@@ -454,17 +668,13 @@ class Dataset(DatasetBase):
             text += _(' linked to %s') % self.linked.filename
         return text
 
+    def _statsArrays(self):
+        """Return arrays to calculate DatasetStats for."""
+        return [self.data, self.serr, self.nerr, self.perr]
+
     def invalidDataPoints(self):
         """Return a numpy bool detailing which datapoints are invalid."""
-        if self._invalidpoints is None:
-            # recalculate valid points
-            self._invalidpoints = N.logical_not(N.isfinite(self.data))
-            for error in self.serr, self.perr, self.nerr:
-                if error is not None:
-                    self._invalidpoints = N.logical_or(self._invalidpoints,
-                                                       N.logical_not(N.isfinite(error)))
-
-        return self._invalidpoints
+        return self.stats().invalidPoints()
     
     def hasErrors(self):
         '''Whether errors on dataset'''
@@ -474,30 +684,11 @@ class Dataset(DatasetBase):
     def getPointRanges(self):
         '''Get range of coordinates for each point in the form
         (minima, maxima).'''
-
-        minvals = self.data.copy()
-        maxvals = self.data.copy()
-
-        if self.serr is not None:
-            minvals -= self.serr
-            maxvals += self.serr
-
-        if self.nerr is not None:
-            minvals += self.nerr
-
-        if self.perr is not None:
-            maxvals += self.perr
-
-        return ( minvals[N.isfinite(minvals)],
-                 maxvals[N.isfinite(maxvals)] )
+        return self.stats().pointRanges()
 
     def getRange(self):
         '''Get total range of coordinates. Returns None if empty.'''
-        minvals, maxvals = self.getPointRanges()
-        if len(minvals) > 0 and len(maxvals) > 0:
-            return ( minvals.min(), maxvals.max() )
-        else:
-            return None
+        return self.stats().range()
 
     def empty(self):
         '''Is the data defined?'''
@@ -508,7 +699,6 @@ class Dataset(DatasetBase):
 
         thetype == data | serr | perr | nerr
         """
-        self._invalidpoints = None
         if thetype in self.columns:
             setattr(self, thetype, vals)
         else:
@@ -530,6 +720,12 @@ class Dataset(DatasetBase):
         if self.linked is not None:
             return
 
+        if isinstance(fileobj, archive.ArchiveScript):
+            # put the values in the archive rather than the script
+            fileobj.write( "SetDataArchive(%s, %s)\n" % (
+                    repr(name), repr(self._addColumnsToArchive(fileobj))) )
+            return
+
         # build up descriptor
         descriptor = datasetNameToDescriptorName(name) + '(numeric)'
         if self.serr is not None:
@@ -589,6 +785,15 @@ class Dataset(DatasetBase):
 
         self.document.modifiedData(self)
 
+    def appendRows(self, ds):
+        """Append the rows of dataset ds, which has the same columns."""
+        for col in self.columns:
+            coldata = getattr(self, col)
+            if coldata is not None:
+                setattr(self, col, N.concatenate( (coldata, getattr(ds, col)) ))
+
+        self.document.modifiedData(self)
+
     def returnCopy(self):
         """Return version of dataset with no linking."""
         return Dataset(data = _copyOrNone(self.data),
@@ -596,6 +801,269 @@ class Dataset(DatasetBase):
                        perr = _copyOrNone(self.perr),
                        nerr = _copyOrNone(self.nerr))
 
+# number of values to examine at once in memory-mapped datasets
+_mmapblocksize = 1<<20
+
+def _memmapBlocks(a):
+    """Yield successive parts of array a along its first axis, as flat
+    float64 arrays of around _mmapblocksize values.
+
+    This avoids converting a large memory-mapped array all at once."""
+    rowsize = max(1, a.size // max(1, a.shape[0]))
+    step = max(1, _mmapblocksize // rowsize)
+    for i in xrange(0, a.shape[0], step):
+        yield N.array(a[i:i+step], dtype=N.float64).ravel()
+
+def _memmapStats(a):
+    """Get (number, total, minimum, maximum) of finite values in array a,
+    working through it in blocks. Returns None if no finite values."""
+    num, total, minval, maxval = 0, 0., N.inf, -N.inf
+    for block in _memmapBlocks(a):
+        block = block[N.isfinite(block)]
+        if len(block) > 0:
+            num += len(block)
+            total += block.sum()
+            minval = min(minval, block.min())
+            maxval = max(maxval, block.max())
+    if num == 0:
+        return None
+    return num, total, minval, maxval
+
+def _memmapPreviewHelper(a, stats):
+    """Get preview of memory-mapped numpy data a without reading it all,
+    given stats from _memmapStats."""
+    size = a.size
+    if size <= 6:
+        line1 = ', '.join( ['%.3g' % x for x in a.flat] )
+    else:
+        line1 = ', '.join( ['%.3g' % x for x in a.flat[:3]] +
+                           [ '...' ] +
+                           ['%.3g' % x for x in a.flat[size-3:size]] )
+
+    if stats is None:
+        return line1
+    line2 = _('mean: %.3g, min: %.3g, max: %.3g') % (
+        stats[1] / stats[0], stats[2], stats[3])
+    return line1 + '\n' + line2
+
+class MemmapDatasetStats(DatasetStats):
+    """Statistics of a memory-mapped dataset, worked out by going
+    through the values in blocks, so that the whole file is never
+    copied into memory or sorted.
+
+    Arrays of the finite or sorted values are not available. Order
+    statistics are found by narrowing down a histogram of the values
+    until the candidates fit in a block.
+    """
+
+    # number of bins used to narrow down order statistics
+    selectbins = 1024
+
+    def summary(self):
+        """Return _memmapStats of the data, (number, total, minimum,
+        maximum) of the finite values, or None if there are none."""
+        return self._cached('summary', lambda: _memmapStats(self.data))
+
+    def finiteData(self):
+        raise DatasetException(
+            _('Cannot read all values of memory-mapped dataset'))
+
+    sortedData = pointRanges = finiteData
+
+    def numFinite(self):
+        """Number of finite data values."""
+        summ = self.summary()
+        if summ is None:
+            return 0
+        return summ[0]
+
+    def dataRange(self):
+        """Range of finite data values.
+        Returns None if there are none."""
+        summ = self.summary()
+        if summ is None:
+            return None
+        return summ[2], summ[3]
+
+    def range(self):
+        """Range of coordinates (there are no errors)."""
+        return self.dataRange()
+
+    def invalidPoints(self):
+        """Bool array which is True for data points which are
+        not finite."""
+        def calc():
+            invalid = N.zeros(self.data.shape, dtype=N.bool_)
+            if self.data.dtype.kind == 'f':
+                step = _mmapblocksize
+                for i in xrange(0, len(self.data), step):
+                    invalid[i:i+step] = N.logical_not(
+                        N.isfinite(self.data[i:i+step]))
+            return invalid
+        return self._cached('invalid', calc)
+
+    def mean(self):
+        """Mean of the finite values."""
+        summ = self.summary()
+        if summ is None:
+            return N.nan
+        return summ[1] / summ[0]
+
+    def std(self):
+        """Standard deviation of the finite values."""
+        def calc():
+            mean = self.mean()
+            total = 0.
+            for block in _memmapBlocks(self.data):
+                block = block[N.isfinite(block)]
+                total += ((block-mean)**2).sum()
+            return N.sqrt(total / max(self.numFinite(), 1))
+        return self._cached('std', calc)
+
+    def kthValue(self, k):
+        """The k-th smallest finite value, counting from 0."""
+        return self._cached(('kth', k), lambda: self._select(k))
+
+    def _select(self, k):
+        """Find the k-th smallest finite value."""
+        minval, maxval = self.dataRange()
+        # number of finite values below minval
+        below = 0
+        while minval < maxval:
+            # histogram values between minval and maxval inclusive,
+            # keeping them if there are few enough
+            edges = N.linspace(minval, maxval, self.selectbins+1)
+            counts = N.zeros(self.selectbins, dtype=N.int64)
+            kept, numkept = [], 0
+            numminval = 0
+            for block in _memmapBlocks(self.data):
+                block = block[(block >= minval) & (block <= maxval)]
+                numminval += N.sum(block == minval)
+                if kept is not None:
+                    kept.append(block)
+                    numkept += len(block)
+                    if numkept > _mmapblocksize:
+                        kept = None
+                bins = N.searchsorted(edges, block, side='right') - 1
+                bins = N.clip(bins, 0, self.selectbins-1)
+                counts += N.bincount(bins, minlength=self.selectbins)
+
+            if kept is not None:
+                kept = N.concatenate(kept)
+                kept.sort()
+                return kept[k-below]
+            if k-below < numminval:
+                return minval
+
+            # narrow down to the bin holding the value
+            cumul = N.cumsum(counts)
+            i = N.searchsorted(cumul, k-below, side='right')
+            below += cumul[i] - counts[i]
+            if edges[i] == minval and edges[i+1] == maxval:
+                # cannot be narrowed any more, so only maxval is left
+                return maxval
+            minval, maxval = edges[i], edges[i+1]
+        return minval
+
+    def lastBelow(self, val):
+        """Largest finite value less than val, or None if there is none."""
+        def calc():
+            best = None
+            for block in _memmapBlocks(self.data):
+                block = block[block < val]
+                if len(block) > 0:
+                    bmax = block.max()
+                    if best is None or bmax > best:
+                        best = bmax
+            return best
+        return self._cached(('below', val), calc)
+
+    def valuesOutside(self, minval, maxval):
+        """Sorted finite values less than minval or greater than maxval."""
+        parts = [N.zeros(0)]
+        for block in _memmapBlocks(self.data):
+            parts.append( block[(block < minval) | (block > maxval)] )
+        vals = N.concatenate(parts)
+        vals.sort()
+        return vals
+
+    def histogram(self):
+        """A coarse histogram of the finite values.
+        Returns (counts, bin edges) or None if there are none."""
+        def calc():
+            drange = self.dataRange()
+            if drange is None:
+                return None
+            minval, maxval = drange
+            if minval == maxval:
+                minval, maxval = minval-0.5, maxval+0.5
+            counts = N.zeros(self.histobins, dtype=N.int64)
+            for block in _memmapBlocks(self.data):
+                c, edges = N.histogram(block[N.isfinite(block)],
+                                       bins=self.histobins,
+                                       range=(minval, maxval))
+                counts += c
+            return counts, edges
+        return self._cached('histogram', calc)
+
+class DatasetMemmap(Dataset):
+    """A 1D dataset whose values are a read-only view of a memory-mapped
+    file, rather than being read into memory.
+
+    Values keep the type they have in the file. Only the parts of the
+    dataset which are taken (e.g. for plotting) are converted to
+    floating point. Statistics, ranges and invalid points are worked
+    out in blocks when first needed.
+    """
+
+    dstype = _('1D mapped')
+    statsclass = MemmapDatasetStats
+
+    def __init__(self, data, linked=None):
+        """data is a 1D numpy array, usually a view of a numpy.memmap."""
+        Dataset.__init__(self, data=[], linked=linked)
+        if data.ndim != 1:
+            raise ValueError, "Only 1-dimensional arrays allowed"
+        self.data = data
+
+    def _statsArrays(self):
+        """Return arrays to calculate DatasetStats for."""
+        return [self.data]
+
+    def userPreview(self):
+        """Preview of data."""
+        return _memmapPreviewHelper(self.data, self.stats().summary())
+
+    def __getitem__(self, key):
+        """Return an in-memory floating point dataset for part of
+        this dataset."""
+        return Dataset(**self._getItemHelper(key))
+
+class Dataset2DMemmap(Dataset2D):
+    """A 2D dataset whose values are a read-only view of a memory-mapped
+    file, rather than being read into memory."""
+
+    dstype = _('2D mapped')
+    statsclass = MemmapDatasetStats
+
+    def __init__(self, data, xrange=None, yrange=None):
+        """data is a 2D numpy array, usually a view of a numpy.memmap.
+        xrange and yrange are as for Dataset2D."""
+        Dataset2D.__init__(self, [[]])
+        if data.ndim != 2:
+            raise ValueError, "Only 2-dimensional arrays allowed"
+        self.data = data
+        self.xrange = (0, data.shape[1])
+        self.yrange = (0, data.shape[0])
+        if xrange:
+            self.xrange = xrange
+        if yrange:
+            self.yrange = yrange
+
+    def userPreview(self):
+        """Return preview of data."""
+        return _memmapPreviewHelper(self.data, self.stats().summary())
+
 class DatasetDateTime(Dataset):
     """Dataset holding dates and times."""
 
@@ -640,6 +1108,12 @@ class DatasetDateTime(Dataset):
             # do not save if linked to a file
             return
 
+        if isinstance(fileobj, archive.ArchiveScript):
+            # put the values in the archive rather than the script
+            fileobj.write( "SetDataArchive(%s, %s, dstype='date')\n" % (
+                    repr(name), repr(self._addColumnsToArchive(fileobj))) )
+            return
+
         descriptor = datasetNameToDescriptorName(name) + '(date)'
         fileobj.write( "ImportString(%s,'''\n" % repr(descriptor) )
         fileobj.write( self.datasetAsText() )
@@ -655,6 +1129,132 @@ class DatasetDateTime(Dataset):
         """Returns version of dataset with no linking."""
         return DatasetDateTime(data=N.array(self.data))
 
+class _DatasetStream(object):
+    """Shared methods for datasets which values are streamed into.
+
+    The latest values of each column are held in a preallocated buffer
+    of twice the capacity, and new values are appended in place. When
+    the buffer fills, the values kept are moved back to its start, so
+    appending takes constant time on average and the columns are
+    always contiguous numpy arrays.
+    """
+
+    # initial buffer size if the capacity is unlimited
+    initialsize = 1024
+
+    def __init__(self, capacity, columns):
+        """capacity is the number of values to keep (None to keep all)
+        columns is a list of the names of the columns held."""
+        self.capacity = capacity
+        self.totallength = 0
+        size = 2*(capacity or self.initialsize)
+        self._buffers = dict( [(c, N.empty(size)) for c in columns] )
+        self._start = self._end = 0
+
+    def _getColumn(self, col):
+        buf = self._buffers.get(col)
+        if buf is None:
+            return None
+        return buf[self._start:self._end]
+
+    def _setColumn(self, col, vals):
+        """Replace the values of a column (e.g. if edited by the user)."""
+        if vals is None and col not in self._buffers:
+            return
+        if col not in self._buffers or len(vals) != self._end-self._start:
+            raise DatasetException('Cannot change the shape of a '
+                                   'streamed dataset')
+        self._buffers[col][self._start:self._end] = vals
+        self.invalidateStats()
+
+    def _statsKey(self):
+        # the columns are views recreated on each access, so the
+        # statistics are instead invalidated when values are changed
+        return []
+
+    data = property(lambda self: self._getColumn('data'),
+                    lambda self, v: self._setColumn('data', v))
+    serr = property(lambda self: self._getColumn('serr'),
+                    lambda self, v: self._setColumn('serr', v))
+    nerr = property(lambda self: self._getColumn('nerr'),
+                    lambda self, v: self._setColumn('nerr', v))
+    perr = property(lambda self: self._getColumn('perr'),
+                    lambda self, v: self._setColumn('perr', v))
+
+    def appendValues(self, vals):
+        """Append values, discarding the oldest beyond the capacity.
+
+        vals is a dict of column names to numpy arrays of the same length
+        """
+
+        num = len(vals['data'])
+        if self.capacity is not None and num > self.capacity:
+            vals = dict( [(c, v[-self.capacity:])
+                          for c, v in vals.iteritems()] )
+            num = self.capacity
+
+        # number of existing values to keep
+        keep = self._end - self._start
+        if self.capacity is not None:
+            keep = min(keep, self.capacity - num)
+
+        bufsize = len(self._buffers['data'])
+        if self._end + num > bufsize:
+            # move the values kept to the start (growing the buffer
+            # if there is no capacity limit)
+            size = bufsize
+            while self.capacity is None and 2*(keep+num) > size:
+                size *= 2
+            for col, buf in self._buffers.items():
+                kept = buf[self._end-keep:self._end].copy()
+                if size != bufsize:
+                    buf = self._buffers[col] = N.empty(size)
+                buf[:keep] = kept
+            self._end = keep
+        self._start = self._end - keep
+
+        for col, buf in self._buffers.iteritems():
+            buf[self._end:self._end+num] = vals[col]
+        self._end += num
+        self.totallength += num
+
+        # the column views are recreated on each access, so tell the
+        # statistics cache directly
+        self.invalidateStats()
+        if self.document is not None:
+            self.document.modifiedData(self)
+
+    def deleteRows(self, row, numrows):
+        pass
+
+    def insertRows(self, row, numrows, rowdata):
+        pass
+
+class DatasetStream(_DatasetStream, Dataset):
+    """1D dataset which values are streamed into, e.g. by a capture."""
+
+    def __init__(self, capacity=None, columns=('data',), linked=None):
+        """capacity is the number of values to keep (None to keep all)
+        columns is a list of the dataset columns to hold."""
+        _DatasetStream.__init__(self, capacity, columns)
+        Dataset.__init__(self, data=[], linked=linked)
+
+    def __getitem__(self, key):
+        """Return a normal dataset based on part of this dataset."""
+        return Dataset(**self._getItemHelper(key))
+
+class DatasetDateTimeStream(_DatasetStream, DatasetDateTime):
+    """Date-time dataset which values are streamed into."""
+
+    def __init__(self, capacity=None, linked=None):
+        """capacity is the number of values to keep (None to keep all)."""
+        _DatasetStream.__init__(self, capacity, ('data',))
+        DatasetDateTime.__init__(self, data=[], linked=linked)
+
+    def __getitem__(self, key):
+        """Return a normal dataset based on part of this dataset."""
+        return DatasetDateTime(**self._getItemHelper(key))
+
 class DatasetText(DatasetBase):
     """Represents a text dataset: holding an array of strings."""
 
@@ -741,6 +1341,12 @@ class DatasetText(DatasetBase):
 
         self.document.modifiedData(self)
 
+    def appendRows(self, ds):
+        """Append the rows of dataset ds."""
+        self.data += ds.data
+
+        self.document.modifiedData(self)
+
     def returnCopy(self):
         """Returns version of dataset with no linking."""
         return DatasetText(self.data)
@@ -806,7 +1412,152 @@ def _evaluateDataset(datasets, dsname, dspart):
         raise DatasetExpressionException(
             'Internal error - invalid dataset part')
 
-_safeexpr = set()
+def exprDatasetNames(expression):
+    """Return the names in the expression which could refer to
+    datasets, whether or not the datasets currently exist."""
+
+    names = set()
+    for bit in dataexpr_split_re.split(expression):
+        if dataexpr_quote_re.match(bit):
+            bit = bit[1:-1]
+        names.add(bit)
+
+        bitbits = bit.split('_')
+        if len(bitbits) > 1 and bitbits[-1] in dataexpr_columns:
+            names.add( '_'.join(bitbits[:-1]) )
+
+    names.discard('')
+    return names
+
+class CompiledExpression(object):
+    """An expression compiled to a code object, with the result of
+    checking it for unsafe code (in checked, None if okay)."""
+
+    def __init__(self, expr, securityonly=True):
+        self.expr = expr
+        self.checked = utils.checkCode(expr, securityonly=securityonly)
+        try:
+            self.code = compile(expr, '<string>', 'eval')
+            self.error = None
+        except Exception, e:
+            # raise the error when evaluated, as eval would
+            self.code = None
+            self.error = e
+
+    def evaluate(self, environment):
+        """Evaluate the expression in the environment dict."""
+        if self.code is None:
+            raise self.error
+        return eval(self.code, environment)
+
+class ExpressionCache(object):
+    """A size-limited cache of compiled expressions, shared between the
+    datasets and widgets evaluating them. The least recently used
+    entries are discarded when the cache is full."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def _lookup(self, key, makeentry):
+        """Return entry for key, calling makeentry() if not present."""
+        try:
+            entry = self.entries.pop(key)
+        except KeyError:
+            entry = makeentry()
+            if len(self.entries) >= self.maxsize:
+                self.entries.popitem(last=False)
+        self.entries[key] = entry
+        return entry
+
+    def compile(self, expr, securityonly=True):
+        """Return a CompiledExpression for the text expr."""
+        return self._lookup(
+            ('expr', expr, securityonly),
+            lambda: CompiledExpression(expr, securityonly=securityonly))
+
+    def compileDatasetExpr(self, datasets, expr, part):
+        """Return a CompiledExpression for expr, with the names of
+        datasets in it replaced by calls to _DS_ to get part.
+
+        Returns (compiled, list of dataset names substituted)
+        """
+
+        # the substitution depends only on which of the names in the
+        # expression are datasets
+        names = self._lookup( ('names', expr),
+                              lambda: exprDatasetNames(expr) )
+        present = frozenset( [n for n in names if n in datasets] )
+
+        def makeentry():
+            substexpr, dslist = _substituteDatasets(datasets, expr, part)
+            return self.compile(substexpr), dslist
+
+        return self._lookup( ('dataset', expr, part, present), makeentry )
+
+# cache used by document and widgets
+exprcache = ExpressionCache()
+
+class DatasetInputTracker(object):
+    """Keep track of the datasets a derived dataset is computed from,
+    so that it is only recomputed when one of these inputs changes.
+
+    An input which is itself derived is brought up to date before it
+    is checked, so chains of derived datasets are updated in
+    dependency order.
+    """
+
+    def __init__(self):
+        # document changeset when inputs were last checked
+        self.checkedchangeset = -1
+        # document customs changeset at last evaluation
+        self.customchangeset = -1
+        # list of (name, changeset) of inputs at last evaluation
+        self.inputs = None
+
+    def isOutOfDate(self, doc):
+        """Does the derived dataset need recomputing?"""
+
+        # nothing can have changed (this also stops loops of datasets
+        # which refer to each other)
+        if self.checkedchangeset == doc.changeset:
+            return False
+        self.checkedchangeset = doc.changeset
+
+        if self.inputs is None or self.customchangeset != doc.customchangeset:
+            return True
+
+        for name, changeset in self.inputs:
+            ds = doc.data.get(name)
+            if ds is not None:
+                ds.refresh()
+            if doc.datachangesets.get(name, 0) != changeset:
+                return True
+        return False
+
+    def setEvaluated(self, doc, inputnames, outputs):
+        """Record that evaluation was done using the inputs named.
+
+        outputs is a list of the datasets which were computed. Their
+        changesets are updated so that datasets derived from them
+        are recomputed in turn.
+        """
+
+        self.checkedchangeset = doc.changeset
+        self.customchangeset = doc.customchangeset
+        self.inputs = [ (name, doc.datachangesets.get(name, 0))
+                        for name in set(inputnames) ]
+
+        for name, ds in doc.data.iteritems():
+            for out in outputs:
+                if ds is out:
+                    doc.datachangesets[name] += 1
+
+    def reset(self):
+        """Force recomputation next time."""
+        self.checkedchangeset = -1
+        self.inputs = None
+
 def simpleEvalExpression(doc, expr, part='data'):
     """Evaluate expression and return data.
 
@@ -814,16 +1565,12 @@ def simpleEvalExpression(doc, expr, part='data'):
     dataset parts which are evaluated by the expression
     """
 
-    expr = _substituteDatasets(doc.data, expr, part)[0]
-
-    if expr not in _safeexpr:
-        if ( not setting.transient_settings['unsafe_mode'] and
-             utils.checkCode(expr, securityonly=True) ):
-            doc.log("Unsafe expression: %s\n" % expr)
-            return N.array([])
+    comp = exprcache.compileDatasetExpr(doc.data, expr, part)[0]
 
-    # for speed, track safe expressions
-    _safeexpr.add(expr)
+    if ( not setting.transient_settings['unsafe_mode'] and
+         comp.checked ):
+        doc.log("Unsafe expression: %s\n" % comp.expr)
+        return N.array([])
 
     env = doc.eval_context.copy()
     def evaluateDataset(dsname, dspart):
@@ -831,7 +1578,7 @@ def simpleEvalExpression(doc, expr, part='data'):
 
     env['_DS_'] = evaluateDataset
     try:
-        evalout = eval(expr, env)
+        evalout = comp.evaluate(env)
     except Exception, ex:
         doc.log(unicode(ex))
         return N.array([])
@@ -859,9 +1606,7 @@ class DatasetExpression(Dataset):
         self.expr['perr'] = perr
         self.parametric = parametric
 
-        self.cachedexpr = {}
-
-        self.docchangeset = -1
+        self.inputs = DatasetInputTracker()
         self.evaluated = {}
 
     def evaluateDataset(self, dsname, dspart):
@@ -874,17 +1619,15 @@ class DatasetExpression(Dataset):
                     
     def _evaluatePart(self, expr, part):
         """Evaluate expression expr for part part."""
-        # replace dataset names with calls
-        expr = _substituteDatasets(self.document.data, expr, part)[0]
+        # replace dataset names with calls, compiling the result
+        comp = exprcache.compileDatasetExpr(self.document.data, expr, part)[0]
 
-        # check expression for nasties if it has changed
-        if self.cachedexpr.get(part) != expr:
-            if ( not setting.transient_settings['unsafe_mode'] and
-                 utils.checkCode(expr, securityonly=True) ):
-                raise DatasetExpressionException(
-                    _("Unsafe expression '%s' in %s part of dataset") % (
-                        self.expr[part], part))
-            self.cachedexpr[part] = expr
+        # check expression for nasties
+        if ( not setting.transient_settings['unsafe_mode'] and
+             comp.checked ):
+            raise DatasetExpressionException(
+                _("Unsafe expression '%s' in %s part of dataset") % (
+                    self.expr[part], part))
 
         # set up environment to evaluate expressions in
         environment = self.document.eval_context.copy()
@@ -904,7 +1647,7 @@ class DatasetExpression(Dataset):
 
         # actually evaluate the expression
         try:
-            result = eval(expr, environment)
+            result = comp.evaluate(environment)
             evalout = N.array(result, N.float64)
 
             if len(evalout.shape) > 1:
@@ -936,28 +1679,34 @@ class DatasetExpression(Dataset):
         """Update evaluation of parts of dataset.
         Throws DatasetExpressionException if error
         """
-        if self.docchangeset != self.document.changeset:
-            # avoid infinite recursion!
-            self.docchangeset = self.document.changeset
-
+        if self.inputs.isOutOfDate(self.document):
             # zero out previous values
             for part in self.columns:
                 self.evaluated[part] = None
 
             # update all parts
-            for part in self.columns:
-                expr = self.expr[part]
-                if expr is not None and expr.strip() != '':
-                    self._evaluatePart(expr, part)
-
-    def _propValues(self, part):
-        """Check whether expressions need reevaluating,
-        and recalculate if necessary."""
+            names = set()
+            try:
+                for part in self.columns:
+                    expr = self.expr[part]
+                    if expr is not None and expr.strip() != '':
+                        names.update( exprDatasetNames(expr) )
+                        self._evaluatePart(expr, part)
+            finally:
+                self.inputs.setEvaluated(self.document, names, (self,))
+
+    def refresh(self):
+        """Reevaluate expressions if inputs have changed."""
         try:
             self.updateEvaluation()
         except DatasetExpressionException, ex:
             self.document.log(unicode(ex))
 
+    def _propValues(self, part):
+        """Check whether expressions need reevaluating,
+        and recalculate if necessary."""
+        self.refresh()
+
         # catch case where error in setting data, need to return "real" data
         if self.evaluated['data'] is None:
             self.evaluated['data'] = N.array([])
@@ -1141,17 +1890,15 @@ class Dataset2DXYZExpression(Dataset2D):
         Parameters are mathematical expressions based on datasets."""
         Dataset2D.__init__(self, None)
 
-        self.lastchangeset = -1
+        self.inputs = DatasetInputTracker()
         self.cacheddata = None
+        self._xrange = self._yrange = (0., 1.)
         
         # copy parameters
         self.exprx = exprx
         self.expry = expry
         self.exprz = exprz
 
-        # cache x y and z expressions
-        self.cachedexpr = {}
-
     def evaluateDataset(self, dsname, dspart):
         """Return the dataset given.
         
@@ -1162,10 +1909,34 @@ class Dataset2DXYZExpression(Dataset2D):
                     
     def evalDataset(self):
         """Return the evaluated dataset."""
-        # return cached data if document unchanged
-        if self.document.changeset == self.lastchangeset:
+        # return cached data if inputs unchanged
+        if not self.inputs.isOutOfDate(self.document):
             return self.cacheddata
 
+        try:
+            self._evalDatasetXYZ()
+        except DatasetExpressionException:
+            # try again next time
+            self.inputs.reset()
+            raise
+
+        names = set()
+        for expr in (self.exprx, self.expry, self.exprz):
+            names.update( exprDatasetNames(expr) )
+        self.inputs.setEvaluated(self.document, names, (self,))
+
+        return self.cacheddata
+
+    def refresh(self):
+        """Reevaluate dataset if inputs have changed."""
+        try:
+            self.evalDataset()
+        except DatasetExpressionException, ex:
+            self.document.log(unicode(ex))
+
+    def _evalDatasetXYZ(self):
+        """Evaluate the expressions to make the dataset."""
+
         evaluated = {}
 
         environment = self.document.eval_context.copy()
@@ -1173,24 +1944,22 @@ class Dataset2DXYZExpression(Dataset2D):
 
         # evaluate the x, y and z expressions
         for name in ('exprx', 'expry', 'exprz'):
-            expr = _substituteDatasets(self.document.data, getattr(self, name),
-                                       'data')[0]
+            comp = exprcache.compileDatasetExpr(
+                self.document.data, getattr(self, name), 'data')[0]
 
-            # check expression if not checked before
-            if self.cachedexpr.get(name) != expr:
-                if ( not setting.transient_settings['unsafe_mode'] and
-                     utils.checkCode(expr, securityonly=True) ):
-                    raise DatasetExpressionException(
-                        "Unsafe expression '%s'" % (
-                            expr))
-                self.cachedexpr[name] = expr
+            # check expression for nasties
+            if ( not setting.transient_settings['unsafe_mode'] and
+                 comp.checked ):
+                raise DatasetExpressionException(
+                    "Unsafe expression '%s'" % (
+                        comp.expr))
 
             try:
-                evaluated[name] = eval(expr, environment)
+                evaluated[name] = comp.evaluate(environment)
             except Exception, e:
                 raise DatasetExpressionException(
                     "Error evaluating expression: %s\n"
-                    "Error: %s" % (expr, unicode(e)) )
+                    "Error: %s" % (comp.expr, unicode(e)) )
 
         minx, maxx, stepx, stepsx = getSpacing(evaluated['exprx'])
         miny, maxy, stepy, stepsy = getSpacing(evaluated['expry'])
@@ -1212,11 +1981,6 @@ class Dataset2DXYZExpression(Dataset2D):
                 "Shape mismatch when constructing dataset\n"
                 "Error: %s" % unicode(e) )
 
-        # update changeset
-        self.lastchangeset = self.document.changeset
-
-        return self.cacheddata
-
     @property
     def xrange(self):
         """Get x range of data as a tuple (min, max)."""
@@ -1279,10 +2043,10 @@ class Dataset2DExpression(Dataset2D):
         Dataset2D.__init__(self, None)
 
         self.expr = expr
-        self.lastchangeset = -1
-        self.cachedexpr = None
+        self.inputs = DatasetInputTracker()
+        self._cacheddata = N.array([[]]), [0., 1.], [0., 1.]
 
-        if utils.checkCode(expr, securityonly=True) is not None:
+        if exprcache.compile(expr).checked is not None:
             raise DatasetExpressionException("Unsafe expression '%s'" % expr)
         
     @property
@@ -1315,9 +2079,30 @@ class Dataset2DExpression(Dataset2D):
     def evalDataset(self):
         """Do actual evaluation."""
 
-        if self.document.changeset == self.lastchangeset:
+        if not self.inputs.isOutOfDate(self.document):
             return self._cacheddata
 
+        try:
+            self._evalDataset2D()
+        except DatasetExpressionException:
+            # try again next time
+            self.inputs.reset()
+            raise
+
+        self.inputs.setEvaluated(self.document, exprDatasetNames(self.expr),
+                                 (self,))
+        return self._cacheddata
+
+    def refresh(self):
+        """Reevaluate dataset if inputs have changed."""
+        try:
+            self.evalDataset()
+        except DatasetExpressionException, ex:
+            self.document.log(unicode(ex))
+
+    def _evalDataset2D(self):
+        """Evaluate the expression, updating the cached data."""
+
         environment = self.document.eval_context.copy()
 
         def getdataset(dsname, dspart):
@@ -1325,26 +2110,24 @@ class Dataset2DExpression(Dataset2D):
             return _evaluateDataset(self.document.data, dsname, dspart)
         environment['_DS_'] = getdataset
 
-        # substituted expression
-        expr, datasets = _substituteDatasets(self.document.data, self.expr,
-                                             'data')
+        # substituted and compiled expression
+        comp, datasets = exprcache.compileDatasetExpr(
+            self.document.data, self.expr, 'data')
 
-        # check expression if not checked before
-        if self.cachedexpr != expr:
-            if ( not setting.transient_settings['unsafe_mode'] and
-                 utils.checkCode(expr, securityonly=True) ):
-                raise DatasetExpressionException(
-                    _("Unsafe expression '%s'") % (
-                        expr))
-            self.cachedexpr = expr
+        # check expression for nasties
+        if ( not setting.transient_settings['unsafe_mode'] and
+             comp.checked ):
+            raise DatasetExpressionException(
+                _("Unsafe expression '%s'") % (
+                    comp.expr))
 
         # do evaluation
         try:
-            evaluated = eval(expr, environment)
+            evaluated = comp.evaluate(environment)
         except Exception, e:
             raise DatasetExpressionException(
                 _("Error evaluating expression: %s\n"
-                  "Error: %s") % (expr, str(e)) )
+                  "Error: %s") % (comp.expr, str(e)) )
 
         # find 2d dataset dimensions
         dsdim = None
@@ -1362,9 +2145,7 @@ class Dataset2DExpression(Dataset2D):
             rangex = dsdim.xrange
             rangey = dsdim.yrange
 
-        self.lastchangeset = self.document.changeset
         self._cacheddata = evaluated, rangex, rangey
-        return self._cacheddata
 
     def saveToFile(self, fileobj, name):
         '''Save expression to file.'''
@@ -1401,7 +2182,7 @@ class Dataset2DXYFunc(Dataset2D):
         self.ystep = ystep
         self.expr = expr
 
-        if utils.checkCode(expr, securityonly=True) is not None:
+        if exprcache.compile(expr).checked is not None:
             raise DatasetExpressionException(_("Unsafe expression '%s'") % expr)
         
         self.xrange = (self.xstep[0] - self.xstep[2]*0.5,
@@ -1409,7 +2190,9 @@ class Dataset2DXYFunc(Dataset2D):
         self.yrange = (self.ystep[0] - self.ystep[2]*0.5,
                        self.ystep[1] + self.ystep[2]*0.5)
 
-        self.lastchangeset = -1
+        # this only depends on the custom definitions
+        self.inputs = DatasetInputTracker()
+        self.cacheddata = N.array([[]])
 
     @property
     def data(self):
@@ -1423,7 +2206,7 @@ class Dataset2DXYFunc(Dataset2D):
     def evalDataset(self):
         """Evaluate the 2d dataset."""
 
-        if self.document.changeset == self.lastchangeset:
+        if not self.inputs.isOutOfDate(self.document):
             return self.cacheddata
 
         env = self.document.eval_context.copy()
@@ -1439,8 +2222,10 @@ class Dataset2DXYFunc(Dataset2D):
         env['x'] = xstep
         env['y'] = ystep
         try:
-            data = eval(self.expr, env)
+            data = exprcache.compile(self.expr).evaluate(env)
         except Exception, e:
+            # try again next time
+            self.inputs.reset()
             raise DatasetExpressionException(
                 _("Error evaluating expression: %s\n"
                   "Error: %s") % (self.expr, str(e)) )
@@ -1449,9 +2234,16 @@ class Dataset2DXYFunc(Dataset2D):
         data = data + xstep*0
 
         self.cacheddata = data
-        self.lastchangeset = self.document.changeset
+        self.inputs.setEvaluated(self.document, (), (self,))
         return data
 
+    def refresh(self):
+        """Reevaluate dataset if custom definitions have changed."""
+        try:
+            self.evalDataset()
+        except DatasetExpressionException, ex:
+            self.document.log(unicode(ex))
+
     def saveToFile(self, fileobj, name):
         '''Save expressions to file.
         '''
@@ -1479,6 +2271,10 @@ class _DatasetPlugin(object):
         self.pluginmanager.update()
         return getattr(self.pluginds, attr)
 
+    def refresh(self):
+        """Rerun plugin if its inputs have changed."""
+        self.pluginmanager.update()
+
     def linkedInformation(self):
         """Return information about how this dataset was created."""
 
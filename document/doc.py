@@ -34,6 +34,7 @@ import veusz.qtall as qt4
 import widgetfactory
 import datasets
 import painthelper
+import archive
 
 import veusz.utils as utils
 import veusz.setting as setting
@@ -61,6 +62,71 @@ function_re = re.compile(r'''
 (?: [ ]* ,? [ ]* \*\*[A-Za-z_][A-Za-z0-9_]* )? # **kwargs
 )\)$                           # endargs''', re.VERBOSE)
 
+def baseEvalContext():
+    """Return a new context for evaluating expressions, holding the
+    safe numpy functions and constants."""
+
+    c = {}
+    # we try to avoid various bits and pieces for safety
+    for name, val in N.__dict__.iteritems():
+        if ( (callable(val) or type(val)==float) and
+             name not in __builtins__ and
+             name[:1] != '_' and name[-1:] != '_' ):
+            c[name] = val
+
+    # safe functions
+    c['os_path_join'] = os.path.join
+    c['os_path_dirname'] = os.path.dirname
+    c['veusz_markercodes'] = tuple(utils.MarkerCodes)
+    return c
+
+def addCustomFuncOrConst(context, ctype, name, val):
+    """Add a custom function or constant to the context.
+    Raises ValueError if there is a problem."""
+
+    if ctype == 'constant':
+        if not identifier_re.match(name):
+            raise ValueError( _("Invalid constant name '%s'") % name )
+        defn = val
+    elif ctype == 'function':
+        m = function_re.match(name)
+        if not m:
+            raise ValueError(
+                _("Invalid function specification '%s'") % name )
+        name = m.group(1)
+        args = m.group(2)
+        defn = 'lambda %s: %s' % (args, val)
+
+    # evaluate, but we ignore any unsafe commands or exceptions
+    checked = utils.checkCode(defn)
+    if checked is not None:
+        raise ValueError( _("Expression '%s' failed safe code test") %
+                          defn )
+    try:
+        context[name] = eval(defn, context)
+    except Exception, e:
+        raise ValueError( _("Error evaluating '%s': '%s'") %
+                          (name, unicode(e)) )
+
+def makeEvalContext(customs):
+    """Make a context for evaluating expressions from the list of
+    custom definitions given by Document.allowedCustoms, without a
+    document. Definitions with errors are skipped."""
+
+    c = baseEvalContext()
+    for ctype, name, val in customs:
+        if ctype == 'import':
+            try:
+                exec 'from %s import %s' % (name, val) in c
+            except Exception:
+                pass
+        else:
+            try:
+                addCustomFuncOrConst(c, ctype, name, val)
+            except ValueError:
+                pass
+    return c
+
 def getSuitableParent(widgettype, initialwidget):
     """Find the nearest relevant parent for the widgettype given."""
 
@@ -96,6 +162,9 @@ class Document( qt4.QObject ):
         self.datachangeset = 0        # increased whan any dataset changes
         self.datachangesets = dict()  # each ds has an associated change set
 
+        # change tracking of custom definitions
+        self.customchangeset = 0      # increased when customs change
+
         # map tags to dataset names
         self.datasettags = defaultdict(list)
 
@@ -299,6 +368,7 @@ class Document( qt4.QObject ):
 
     def modifiedData(self, dataset):
         """The named dataset was modified"""
+        dataset.invalidateStats()
         for name, ds in self.data.iteritems():
             if ds is dataset:
                 self.datachangesets[name] += 1
@@ -351,6 +421,8 @@ class Document( qt4.QObject ):
     def deleteDataset(self, name):
         """Remove the selected dataset."""
         del self.data[name]
+        self.datachangesets[name] += 1
+        self.datachangeset += 1
         self.setModified()
 
     def renameDataset(self, oldname, newname):
@@ -358,8 +430,14 @@ class Document( qt4.QObject ):
         d = self.data[oldname]
         del self.data[oldname]
         self.data[newname] = d
-        # transfer change set to new name
-        self.datachangesets[newname] = self.datachangesets[oldname]
+
+        # transfer change set to new name, making sure that datasets
+        # derived from either name see a change
+        self.datachangesets[newname] = max(
+            self.datachangesets.get(newname, 0),
+            self.datachangesets[oldname]) + 1
+        self.datachangesets[oldname] += 1
+        self.datachangeset += 1
 
         self.setModified()
 
@@ -512,6 +590,18 @@ class Document( qt4.QObject ):
         
         self.setModified(False)
 
+    def saveToArchive(self, filename):
+        """Save the document to a zip archive, with the arrays of embedded
+        datasets held as NPY files rather than as text."""
+
+        script = archive.ArchiveScript(filename)
+        try:
+            self.saveToFile(script)
+        except:
+            script.abort()
+            raise
+        script.close()
+
     def exportStyleSheet(self, fileobj):
         """Export the StyleSheet to a file."""
 
@@ -752,51 +842,21 @@ class Document( qt4.QObject ):
     def _updateEvalContextFuncOrConst(self, ctype, name, val):
         """Update a function or constant in eval function context."""
 
-        if ctype == 'constant':
-            if not identifier_re.match(name):
-                self.log( _("Invalid constant name '%s'") % name )
-                return
-            defn = val
-        elif ctype == 'function':
-            m = function_re.match(name)
-            if not m:
-                self.log( _("Invalid function specification '%s'") % name )
-                return
-            name = m.group(1)
-            args = m.group(2)
-            defn = 'lambda %s: %s' % (args, val)
-
-        # evaluate, but we ignore any unsafe commands or exceptions
-        checked = utils.checkCode(defn)
-        if checked is not None:
-            self.log( _("Expression '%s' failed safe code test") %
-                      defn )
-            return
         try:
-            self.eval_context[name] = eval(defn, self.eval_context)
-        except Exception, e:
-            self.log( _("Error evaluating '%s': '%s'") %
-                      (name, unicode(e)) )
+            addCustomFuncOrConst(self.eval_context, ctype, name, val)
+        except ValueError, e:
+            self.log( unicode(e) )
 
     def updateEvalContext(self):
         """To be called after custom constants or functions are changed.
         This sets up a safe environment where things can be evaluated
         """
         
-        self.eval_context = c = {}
-
-        # add numpy things
-        # we try to avoid various bits and pieces for safety
-        for name, val in N.__dict__.iteritems():
-            if ( (callable(val) or type(val)==float) and
-                 name not in __builtins__ and
-                 name[:1] != '_' and name[-1:] != '_' ):
-                c[name] = val
-        
-        # safe functions
-        c['os_path_join'] = os.path.join
-        c['os_path_dirname'] = os.path.dirname
-        c['veusz_markercodes'] = tuple(utils.MarkerCodes)
+        self.eval_context = baseEvalContext()
+        self.customchangeset += 1
+
+        # colormaps may be redefined, so forget their lookup tables
+        self.colormapluts = {}
 
         # custom definitions
         for ctype, name, val in self.customs:
@@ -810,6 +870,23 @@ class Document( qt4.QObject ):
             else:
                 raise ValueError, 'Invalid custom type'
 
+    def allowedCustoms(self):
+        """Return the custom constants, functions and imports, with
+        only the symbols allowed to be imported, so that the context
+        can be made again elsewhere with makeEvalContext."""
+
+        out = []
+        for ctype, name, val in self.customs:
+            name = name.strip()
+            if ctype == 'constant' or ctype == 'function':
+                out.append( (ctype, name, val.strip()) )
+            elif ctype == 'import' and module_re.match(name):
+                symbols = self._processSafeImports(
+                    name, identifier_split_re.findall(val))
+                if symbols:
+                    out.append( (ctype, name, ', '.join(symbols)) )
+        return out
+
     def customDict(self):
         """Return a dictionary mapping custom names to (idx, type, value)."""
         retn = {}
@@ -865,3 +942,15 @@ class Document( qt4.QObject ):
         if invert:
             return cmap[::-1]
         return cmap
+
+    def getColormapLUT(self, name, invert, trans=0):
+        """Get a lookup table (utils.ColorMapLUT) for the colormap with
+        name given, inverted if requested and with transparency trans.
+
+        The tables are kept until the custom definitions change."""
+        key = (name, bool(invert), trans)
+        lut = self.colormapluts.get(key)
+        if lut is None:
+            lut = self.colormapluts[key] = utils.ColorMapLUT(
+                self.getColormap(name, invert), trans)
+        return lut
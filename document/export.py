@@ -22,6 +22,8 @@ import os.path
 import random
 import math
 
+import numpy as N
+
 import veusz.qtall as qt4
 import veusz.utils as utils
 
@@ -129,16 +131,30 @@ class Export(object):
         painter.restore()
         painter.end()
 
-    def exportBitmap(self, format):
-        """Export to a bitmap format."""
+    def recordPage(self, dpi):
+        """Paint the page at the dpi given to a PaintHelper, which
+        records it, so that it can be rendered more than once."""
+        size = self.doc.pageSize(self.pagenumber, dpi=(dpi,dpi))
+        helper = painthelper.PaintHelper(size, dpi=(dpi,dpi))
+        self.doc.paintTo(helper, self.pagenumber)
+        return helper
+
+    def renderBitmap(self, format, helper=None):
+        """Render the page to a QImage for the bitmap format given.
+
+        If helper is set to a PaintHelper from recordPage, the page
+        recorded in it is rendered, rather than painting the page."""
 
         # get size for bitmap's dpi
         dpi = self.bitmapdpi
-        size = self.doc.pageSize(self.pagenumber, dpi=(dpi,dpi))
+        if helper is not None:
+            size = helper.pagesize
+        else:
+            size = self.doc.pageSize(self.pagenumber, dpi=(dpi,dpi))
 
         # create real output image
         backqcolor = utils.extendedColorToQColor(self.backcolor)
-        if format == '.png':
+        if format in ('.png', '.rgba'):
             # transparent output
             image = qt4.QImage(size[0], size[1],
                                qt4.QImage.Format_ARGB32_Premultiplied)
@@ -159,13 +175,18 @@ class Export(object):
         painter = qt4.QPainter(image)
         painter.setRenderHint(qt4.QPainter.Antialiasing, self.antialias)
         painter.setRenderHint(qt4.QPainter.TextAntialiasing, self.antialias)
-        self.renderPage(size, (dpi,dpi), painter)
+        if helper is not None:
+            helper.renderToPainter(painter)
+            painter.end()
+        else:
+            self.renderPage(size, (dpi,dpi), painter)
+        return image
+
+    def writeBitmap(self, image, format, writer):
+        """Write image in bitmap format using the QImageWriter."""
 
-        # write image to disk
-        writer = qt4.QImageWriter()
         # format below takes extension without dot
         writer.setFormat(qt4.QByteArray(format[1:]))
-        writer.setFileName(self.filename)
 
         if format == 'png':
             # min quality for png as it makes no difference to output
@@ -176,6 +197,51 @@ class Export(object):
 
         writer.write(image)
 
+    def exportBitmap(self, format):
+        """Export to a bitmap format."""
+
+        image = self.renderBitmap(format)
+
+        # write image to disk
+        writer = qt4.QImageWriter()
+        writer.setFileName(self.filename)
+        self.writeBitmap(image, format, writer)
+
+    def renderToBuffer(self, format, helper=None):
+        """Render the page in bitmap format given, returning a string
+        with the contents of the file, or for format 'rgba', a numpy
+        array of the pixels (uint8 of shape height, width, 4).
+
+        helper is an optional PaintHelper from recordPage."""
+
+        format = '.' + format.lower()
+        if format not in ('.png', '.jpg', '.jpeg', '.bmp', '.tiff',
+                          '.xpm', '.rgba'):
+            raise RuntimeError, "Format '%s' not supported" % format[1:]
+
+        image = self.renderBitmap(format, helper=helper)
+
+        if format == '.rgba':
+            # convert 32 bit ARGB values into bytes
+            image = image.convertToFormat(qt4.QImage.Format_ARGB32)
+            width, height = image.width(), image.height()
+            argb = N.fromstring( image.bits().asstring(image.byteCount()),
+                                 dtype=N.uint32 ).reshape(height, width)
+            rgba = N.empty( (height, width, 4), dtype=N.uint8 )
+            rgba[:,:,0] = (argb >> 16) & 0xff
+            rgba[:,:,1] = (argb >> 8) & 0xff
+            rgba[:,:,2] = argb & 0xff
+            rgba[:,:,3] = argb >> 24
+            return rgba
+
+        buf = qt4.QBuffer()
+        buf.open(qt4.QIODevice.WriteOnly)
+        writer = qt4.QImageWriter()
+        writer.setDevice(buf)
+        self.writeBitmap(image, format, writer)
+        buf.close()
+        return str(buf.data())
+
     def exportPS(self, ext):
         """Export to EPS or PDF format."""
 
@@ -0,0 +1,157 @@
+#    Copyright (C) 2013 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Fitting an expression to many datasets in worker processes.
+
+The workers are new Python processes, rather than being forked from
+the process running Qt, which is not safe. They are sent the text of
+the function, the custom definitions of the document and the arrays to
+fit as a pickle on their standard input, and write a pickled list of
+results to their standard output.
+"""
+
+import os
+import sys
+import cPickle
+import subprocess
+import multiprocessing
+
+import numpy as N
+
+import veusz
+import veusz.utils as utils
+
+import datasets
+import doc
+
+# command run by worker processes
+_workercmd = 'from veusz.document.fitbatch import workerMain; workerMain()'
+
+def makeFitFunction(context, function, variable, names):
+    """Return a function for fitLM evaluating the expression function
+    in context, given the parameters (with names given) and the values
+    of variable."""
+
+    comp = datasets.exprcache.compile(function, securityonly=False)
+    if comp.code is None:
+        raise RuntimeError, comp.error
+    code = comp.code
+
+    def evalfunc(params, xvals):
+        fenv = context.copy()
+        fenv[variable] = xvals
+        fenv.update( zip(names, params) )
+        try:
+            return eval(code, fenv) + xvals*0.
+        except Exception:
+            return N.nan
+    return evalfunc
+
+def _fitJob(job):
+    """Do the fits described by job, returning a list of results."""
+    customs, function, variable, names, params, xvals, \
+        yvalslist, errorslist = job
+    func = makeFitFunction(doc.makeEvalContext(customs), function,
+                           variable, names)
+    return utils.fitLMBatch(func, params, xvals, yvalslist, errorslist)
+
+def _binaryStream(stream):
+    """Return stream, set to binary mode on Windows."""
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.setmode(stream.fileno(), os.O_BINARY)
+    return stream
+
+def workerMain():
+    """Main function of a worker process."""
+
+    instream = _binaryStream(sys.stdin)
+    outstream = _binaryStream(sys.stdout)
+    # keep anything printed out of the results
+    sys.stdout = sys.stderr
+
+    results = _fitJob( cPickle.load(instream) )
+    cPickle.dump(results, outstream, cPickle.HIGHEST_PROTOCOL)
+    outstream.flush()
+
+def _startWorker():
+    """Start a worker process, returning the Popen object."""
+
+    # make sure the worker can import this copy of veusz
+    env = os.environ.copy()
+    moddir = os.path.dirname(os.path.dirname(os.path.abspath(
+                veusz.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [moddir] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    # other workers should not inherit the pipes of this one
+    return subprocess.Popen( [sys.executable, '-c', _workercmd],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             close_fds=(sys.platform != 'win32'),
+                             env=env )
+
+def fitBatch(customs, function, variable, names, params, xvals,
+             yvalslist, errorslist, processes=None):
+    """Fit function separately to each of the y values and errors.
+
+    customs: custom definitions from Document.allowedCustoms
+    function: text of expression to fit
+    variable: name of the variable in function with values xvals
+    names: names of the parameters, with starting values params
+    processes: number of worker processes (None for the number of CPUs)
+
+    The fits are done in this process if only one process is asked
+    for, or a new Python process cannot be started (e.g. in a frozen
+    application). Returns a list of (params, chi2, dof) for each fit.
+    """
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(yvalslist))
+
+    def job(start, end):
+        return ( customs, function, variable, names, params, xvals,
+                 yvalslist[start:end], errorslist[start:end] )
+
+    if processes <= 1 or getattr(sys, 'frozen', False):
+        return _fitJob( job(0, len(yvalslist)) )
+
+    # split fits into contiguous chunks, one for each worker
+    edges = N.linspace(0, len(yvalslist), processes+1).astype(N.intp)
+    workers = []
+    try:
+        for start, end in zip(edges[:-1], edges[1:]):
+            w = _startWorker()
+            workers.append(w)
+            cPickle.dump( job(start, end), w.stdin,
+                          cPickle.HIGHEST_PROTOCOL )
+            w.stdin.close()
+
+        results = []
+        for w in workers:
+            try:
+                results += cPickle.load(w.stdout)
+            except EOFError:
+                raise RuntimeError, "Fitting worker process failed"
+            w.wait()
+        return results
+    finally:
+        for w in workers:
+            if w.poll() is None:
+                w.kill()
+                w.wait()
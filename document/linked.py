@@ -20,9 +20,117 @@
 """Classes for linked files"""
 
 import sys
+import os
+import io
+import codecs
+import StringIO
 
 import veusz.utils as utils
 
+class FileAppendState(object):
+    """Records the state of a file read by an import, so that lines
+    appended to the file later can be read without reading the whole
+    file again."""
+
+    # number of bytes at the start and end of the data read which are
+    # compared to see whether the file has been changed
+    checksize = 4096
+
+    def __init__(self, filename, encoding):
+        """Record the state of the file before it is read."""
+        self.filename = filename
+        self.offset = None
+
+        # encodings with byte order marks cannot be read from the middle
+        name = codecs.lookup(encoding).name
+        if name.startswith('utf-16') or name.startswith('utf-32'):
+            self.stat = None
+        else:
+            self.stat = self._stat()
+
+    def _stat(self):
+        """Return size and modification time of file, or None."""
+        try:
+            s = os.stat(self.filename)
+        except EnvironmentError:
+            return None
+        return (s.st_size, s.st_mtime)
+
+    def _readChecks(self, f, offset):
+        """Read bytes used to check for changes before offset."""
+        f.seek(0)
+        head = f.read( min(offset, self.checksize) )
+        start = max(0, offset-self.checksize)
+        f.seek(start)
+        tail = f.read(offset-start)
+        return head, tail
+
+    def finishRead(self):
+        """Call after the file has been read fully.
+
+        Returns True if data appended later can be read incrementally.
+        This is not possible if the file changed while being read or
+        does not end with a complete line.
+        """
+        if self.stat is None or self._stat() != self.stat:
+            return False
+
+        size = self.stat[0]
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                self.checks = self._readChecks(f, size)
+            finally:
+                f.close()
+        except EnvironmentError:
+            return False
+
+        if size > 0 and self.checks[1][-1:] != '\n':
+            return False
+
+        self.offset = size
+        return True
+
+    def readAppended(self):
+        """Return the complete lines appended to the file since it was
+        last read, as a byte string.
+
+        None is returned if the previously read part of the file has
+        changed.
+        """
+
+        stat = self._stat()
+        if self.offset is None or stat is None or stat[0] < self.offset:
+            return None
+        if stat == self.stat:
+            # unchanged
+            return ''
+
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                if self._readChecks(f, self.offset) != self.checks:
+                    return None
+                f.seek(self.offset)
+                data = f.read(stat[0]-self.offset)
+            finally:
+                f.close()
+        except EnvironmentError:
+            return None
+
+        # leave any incomplete line at the end for next time
+        data = data[:data.rfind('\n')+1]
+
+        self.offset += len(data)
+        head, tail = self.checks
+        if len(head) < self.checksize:
+            head = (head + data)[:self.checksize]
+        tail = (tail + data)[-self.checksize:]
+        self.checks = (head, tail)
+        self.stat = stat
+
+        return data
+
 class LinkedFileBase(object):
     """A base class for linked files containing common routines."""
 
@@ -30,6 +138,10 @@ class LinkedFileBase(object):
         """Save parameters."""
         self.params = params
 
+        # reader and file state used to read appended data
+        self.reader = None
+        self.appendstate = None
+
     def createOperation(self):
         """Return operation to recreate self."""
         return None
@@ -77,9 +189,81 @@ class LinkedFileBase(object):
                 ds.linked = self
         return read
 
+    def setReadState(self, reader, appendstate):
+        """After reading the file, remember the reader and the state
+        of the file, so that data appended to the file can be read
+        incrementally when reloading."""
+
+        if appendstate.finishRead():
+            reader.clearData()
+            self.reader = reader
+            self.appendstate = appendstate
+        else:
+            self.reader = self.appendstate = None
+
+    def _readAppendedData(self, tempdoc, data):
+        """Read the appended data (a byte string) into tempdoc using
+        the reader. Returns dict of errors. Override this."""
+
+    def _reloadAppended(self, document):
+        """Read data appended to the file since it was last read,
+        adding them to the end of the linked datasets.
+
+        Returns (read, errors) or None if the whole file needs to be
+        reloaded.
+        """
+
+        data = self.appendstate.readAppended()
+        if data is None:
+            return None
+
+        # read new data into a temporary document
+        tempdoc = document.__class__()
+        errors = {}
+        if data:
+            try:
+                errors = self._readAppendedData(tempdoc, data)
+            except Exception:
+                return None
+
+        # the new datasets must match existing linked datasets
+        linkedds = dict( [(name, ds) for name, ds in document.data.iteritems()
+                          if ds.linked is self] )
+        for name, ds in tempdoc.data.iteritems():
+            existing = linkedds.get(name)
+            if existing is None or type(existing) is not type(ds):
+                return None
+            for col in ds.columns:
+                if ( (getattr(existing, col) is None) !=
+                     (getattr(ds, col) is None) ):
+                    return None
+
+        # readers differ in how they handle columns of different
+        # lengths, so only append if the datasets stay the same length
+        lengths = set()
+        for name, ds in linkedds.iteritems():
+            newds = tempdoc.data.get(name)
+            lengths.add( len(ds.data) +
+                         (len(newds.data) if newds is not None else 0) )
+        if len(lengths) > 1:
+            return None
+
+        for name, ds in tempdoc.data.iteritems():
+            if len(ds.data) > 0:
+                linkedds[name].appendRows(ds)
+
+        return (sorted(linkedds.keys()), errors)
+
     def reloadLinks(self, document):
         """Reload links using an operation"""
 
+        # try to read only data appended to the file
+        if self.appendstate is not None:
+            retn = self._reloadAppended(document)
+            if retn is not None:
+                return retn
+            self.reader = self.appendstate = None
+
         # get the operation for reloading
         op = self.createOperation()(self.params)
 
@@ -98,6 +282,14 @@ class LinkedFileBase(object):
                            if ds.linked is self])
             return ([], errors)
 
+        # keep the reading state of the new link object, as the datasets
+        # are linked to this object instead
+        for ds in tempdoc.data.itervalues():
+            if ds.linked is not None:
+                self.reader = ds.linked.reader
+                self.appendstate = ds.linked.appendstate
+                break
+
         # delete datasets which are linked and imported here
         self._deleteLinkedDatasets(document)
         # move datasets into document
@@ -143,6 +335,19 @@ class LinkedFile(LinkedFileBase):
 
         fileobj.write("ImportFile(%s)\n" % (", ".join(params)))
 
+    def _readAppendedData(self, tempdoc, data):
+        """Read the appended data into tempdoc."""
+        import simpleread
+
+        p = self.params
+        text = data.decode(p.encoding, 'ignore')
+        self.reader.readMoreData( simpleread.FileStream(io.StringIO(text)) )
+        self.reader.setInDocument(tempdoc, linkedfile=self,
+                                  prefix=p.prefix, suffix=p.suffix)
+        errors = self.reader.getInvalidConversions()
+        self.reader.clearData()
+        return errors
+
 class LinkedFile2D(LinkedFileBase):
     """Class representing a file linked to a 2d dataset."""
 
@@ -212,6 +417,13 @@ class LinkedFileCSV(LinkedFileBase):
 
         fileobj.write("ImportFileCSV(%s)\n" % (", ".join(paramsout)))
 
+    def _readAppendedData(self, tempdoc, data):
+        """Read the appended data into tempdoc."""
+        self.reader.readMoreData( StringIO.StringIO(data) )
+        self.reader.setData(tempdoc, linkedfile=self)
+        self.reader.clearData()
+        return {}
+
 class LinkedFilePlugin(LinkedFileBase):
     """Represent a file linked using an import plugin."""
 
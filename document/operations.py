@@ -906,6 +906,12 @@ class OperationDataImport(OperationDataImportBase):
         """
 
         p = self.params
+
+        # remember state of linked file before reading, so that data
+        # appended later can be read incrementally
+        if p.linked and p.filename is not None:
+            appendstate = linked.FileAppendState(p.filename, p.encoding)
+
         # open stream to import data from
         if p.filename is not None:
             stream = simpleread.FileStream(
@@ -931,6 +937,9 @@ class OperationDataImport(OperationDataImportBase):
             document, linkedfile=LF, prefix=p.prefix, suffix=p.suffix)
         self.outinvalids = self.simpleread.getInvalidConversions()
 
+        if LF is not None and not p.useblocks:
+            LF.setReadState(self.simpleread, appendstate)
+
 class OperationDataImportCSV(OperationDataImportBase):
     """Import data from a CSV file."""
 
@@ -939,16 +948,27 @@ class OperationDataImportCSV(OperationDataImportBase):
     def doImport(self, document):
         """Do the data import."""
         
-        csvr = readcsv.ReadCSV(self.params)
+        p = self.params
+
+        # remember state of linked file before reading, so that data
+        # appended later can be read incrementally
+        if p.linked:
+            appendstate = linked.FileAppendState(p.filename, p.encoding)
+
+        csvr = readcsv.ReadCSV(p)
         csvr.readData()
 
         LF = None
-        if self.params.linked:
-            LF = linked.LinkedFileCSV(self.params)
+        if p.linked:
+            LF = linked.LinkedFileCSV(p)
         
         # set the data
         self.outdatasets = csvr.setData(document, linkedfile=LF)
 
+        if ( LF is not None and not p.readrows and
+             csvr.fileiter is not None ):
+            LF.setReadState(csvr, appendstate)
+
 class OperationDataImport2D(OperationDataImportBase):
     """Import a 2D matrix from a file."""
     
@@ -1117,6 +1137,11 @@ class OperationDataImportPlugin(OperationDataImportBase):
             if isinstance(d, plugins.Dataset1D):
                 ds = datasets.Dataset(data=d.data, serr=d.serr, perr=d.perr,
                                       nerr=d.nerr)
+            elif isinstance(d, plugins.Dataset1DMemmap):
+                ds = datasets.DatasetMemmap(d.data)
+            elif isinstance(d, plugins.Dataset2DMemmap):
+                ds = datasets.Dataset2DMemmap(d.data, xrange=d.rangex,
+                                              yrange=d.rangey)
             elif isinstance(d, plugins.Dataset2D):
                 ds = datasets.Dataset2D(data=d.data, xrange=d.rangex,
                                         yrange=d.rangey)
@@ -1178,6 +1203,18 @@ class OperationDataCaptureSet(object):
             if name in databackup:
                 self.olddata[name] = databackup[name]
 
+    def update(self, document):
+        """Set data read since the operation was done (or last updated)
+        in the document, without undoing it first.
+
+        This is efficient if the reader streams data into datasets."""
+        databackup = dict(document.data)
+        for name in self.simplereadobject.setInDocument(document):
+            if name not in self.nameschanged:
+                self.nameschanged.append(name)
+                if name in databackup:
+                    self.olddata[name] = databackup[name]
+
     def undo(self, document):
         """Undo the results of the capture."""
 
@@ -1282,6 +1319,9 @@ class OperationDatasetSetVal(object):
         """Set the value."""
         ds = document.data[self.datasetname]
         datacol = getattr(ds, self.columnname)
+        if isinstance(datacol, N.ndarray) and not datacol.flags.writeable:
+            # copy values which are mapped read-only from a file
+            datacol = N.array(datacol, dtype=N.float64)
         self.oldval = datacol[self.row]
         datacol[self.row] = self.val
         ds.changeValues(self.columnname, datacol)
@@ -1308,6 +1348,9 @@ class OperationDatasetSetVal2D(object):
     def do(self, document):
         """Set the value."""
         ds = document.data[self.datasetname]
+        if not ds.data.flags.writeable:
+            # copy values which are mapped read-only from a file
+            ds.data = N.array(ds.data, dtype=N.float64)
         self.oldval = ds.data[self.row, self.col]
         ds.data[self.row, self.col] = self.val
         document.modifiedData(ds)
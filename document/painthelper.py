@@ -50,6 +50,42 @@ class DrawState(object):
         # list of child widgets states
         self.children = []
 
+class LayerCache(object):
+    """Keeps the recorded layers of widgets between paints.
+
+    Layers are stored by (widget, fingerprint), where the fingerprint
+    is returned by the widget's getLayerFingerprint method. Layers
+    which were not used in the last paint are thrown away.
+    """
+
+    def __init__(self):
+        self.previous = {}
+        self.current = {}
+
+    def nextPaint(self):
+        """Start a new paint, dropping layers not used in the last one."""
+        self.previous = self.current
+        self.current = {}
+
+    def lookup(self, key):
+        """Return (found, state) for the key given.
+        state can be None if the widget drew nothing."""
+        for layers in (self.current, self.previous):
+            if key in layers:
+                state = layers[key]
+                self.current[key] = state
+                return True, state
+        return False, None
+
+    def store(self, key, state):
+        """Keep state for the key given."""
+        self.current[key] = state
+
+    def clear(self):
+        """Remove all cached layers."""
+        self.previous = {}
+        self.current = {}
+
 class PaintHelper(object):
     """Helper used when painting widgets.
 
@@ -59,19 +95,27 @@ class PaintHelper(object):
     """
 
     def __init__(self, pagesize, scaling=1., dpi=(100, 100),
-                 directpaint=None):
+                 directpaint=None, layercache=None, interactive=False):
         """Initialise using page size (tuple of pixelw, pixelh).
 
         If directpaint is set to a painter, use this directly rather
         than creating separate layers for rendering later. The user
         will need to call restore() on the painter before ending, if
         using this mode, however.
+
+        If layercache is set to a LayerCache object, layers of widgets
+        which have not changed since the last paint using the cache
+        are reused rather than being drawn again.
+
+        interactive should be set if painting for display in the
+        program, where widgets can choose faster approximations.
         """
 
         self.dpi = dpi
         self.scaling = scaling
         self.pixperpt = self.dpi[1] / 72.
         self.pagesize = ( max(pagesize[0], 1), max(pagesize[1], 1) )
+        self.interactive = interactive
 
         # keep track of states of all widgets
         self.states = {}
@@ -86,6 +130,14 @@ class PaintHelper(object):
         # state for root widget
         self.rootstate = None
 
+        # recorded layers kept between paints (not used if painting
+        # directly)
+        if directpaint:
+            layercache = None
+        self.layercache = layercache
+        if layercache is not None:
+            layercache.nextPaint()
+
     @property
     def maxsize(self):
         """Return maximum page dimension (using PaintHelper's DPI)."""
@@ -135,6 +187,39 @@ class PaintHelper(object):
 
         return p
 
+    def drawWidget(self, widget, parentposn, outerbounds=None):
+        """Draw widget within parentposn.
+
+        If a layer cache is in use and the widget's fingerprint is
+        unchanged since the last paint, its old layer is reused
+        instead of calling the widget's draw method.
+        """
+
+        if self.layercache is not None:
+            fingerprint = widget.getLayerFingerprint(
+                parentposn, self, outerbounds)
+        else:
+            fingerprint = None
+
+        if fingerprint is None:
+            widget.draw(parentposn, self, outerbounds=outerbounds)
+            return
+
+        key = (widget, fingerprint)
+        found, state = self.layercache.lookup(key)
+        if found:
+            if state is not None:
+                self.states[widget] = state
+                self.states[widget.parent].children.append(state)
+        else:
+            oldstate = self.states.get(widget)
+            widget.draw(parentposn, self, outerbounds=outerbounds)
+            state = self.states.get(widget)
+            if state is oldstate:
+                # widget did not ask for a painter
+                state = None
+            self.layercache.store(key, state)
+
     def setControlGraph(self, widget, cgis):
         """Records the control graph list for the widget given."""
         self.states[widget].cgis = cgis
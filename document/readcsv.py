@@ -23,6 +23,7 @@ import re
 import numpy as N
 
 import datasets
+from simpleread import DataColumn
 import veusz.utils as utils
 import veusz.qtall as qt4
 
@@ -90,12 +91,93 @@ typecodes = (
     ('(number)', 'float'),
     )
 
+class _ColumnChunk(object):
+    """A chunk of lines read from the file, examined column by column
+    to see which values can be read in bulk."""
+
+    def __init__(self, lines, numre, decimalpoint):
+        self.lines = lines
+        self.numre = numre
+        self.decimalpoint = decimalpoint
+        self.lengths = N.array([len(l) for l in lines])
+        self.numcols = self.lengths.max()
+
+        self._cells = {}
+        self._floats = {}
+        self._stops = {}
+
+    def cells(self, colnum):
+        """Return list of text values in column."""
+        try:
+            return self._cells[colnum]
+        except KeyError:
+            cells = []
+            for l in self.lines:
+                if colnum < len(l):
+                    cells.append(l[colnum])
+                else:
+                    cells.append(u'')
+            self._cells[colnum] = cells
+            return cells
+
+    def floats(self, colnum):
+        """Convert column to floats in bulk.
+
+        Returns array of values (nan where invalid or blank), array
+        which is True for blank values and array which is True for
+        values which could not be converted.
+        """
+        try:
+            return self._floats[colnum]
+        except KeyError:
+            pass
+
+        matches = map(self.numre.match, self.cells(colnum))
+        bad = N.array([m is None for m in matches], dtype=N.bool_)
+        blank = N.array([m is not None and m.group(1) is None
+                         for m in matches], dtype=N.bool_)
+        numbers = [(m and m.group(1)) or 'nan' for m in matches]
+        if self.decimalpoint != '.':
+            numbers = [n.replace(self.decimalpoint, '.') for n in numbers]
+        vals = N.array(numbers, dtype=N.float64)
+
+        retn = self._floats[colnum] = (vals, blank, bad)
+        return retn
+
+    def nextStop(self, kind, colnum, start):
+        """Return the first row from start which cannot be read in
+        bulk for a column of the kind given ('float', 'string' or None
+        for a column not yet in use)."""
+
+        try:
+            stops = self._stops[(kind, colnum)]
+        except KeyError:
+            short = self.lengths <= colnum
+            if kind == 'float':
+                stops = self.floats(colnum)[2] | short
+            elif kind == 'string':
+                stops = short
+            else:
+                nonblank = N.array([c.strip() != ''
+                                    for c in self.cells(colnum)],
+                                   dtype=N.bool_)
+                stops = nonblank & (~short)
+            stops = self._stops[(kind, colnum)] = N.nonzero(stops)[0]
+
+        idx = N.searchsorted(stops, start)
+        if idx < len(stops):
+            return stops[idx]
+        return len(self.lines)
+
 class _NextValue(Exception):
     """A class to be raised to move to next value."""
 
 class ReadCSV(object):
     """A class to import data from CSV files."""
 
+    # number of lines to read at once
+    chunklines = 4096
+
     def __init__(self, params):
         """Initialise the reader.
         params is a ParamsCSV object
@@ -106,9 +188,19 @@ class ReadCSV(object):
         self.datere = re.compile(
             utils.dateStrToRegularExpression(params.dateformat))
 
-        # created datasets. Each name is associated with a list
+        # simple numbers (or blanks) which can be converted in bulk
+        self.decimalpoint = unicode(self.numericlocale.decimalPoint())
+        dp = re.escape(self.decimalpoint)
+        self.numre = re.compile(
+            r'(?:([+-]?(?:[0-9]+(?:%s[0-9]*)?|%s[0-9]+)(?:[eE][+-]?[0-9]+)?)'
+            r'|\s*)$' % (dp, dp), re.UNICODE)
+
+        # created datasets. Each name is associated with a DataColumn
         self.data = {}
 
+        # iterator over lines (or columns) of file being read
+        self.fileiter = None
+
     def _generateName(self, column):
         """Generate a name for a column."""
         if self.params.readrows:
@@ -166,7 +258,7 @@ class ReadCSV(object):
         self.colignore[colnum] = self.params.headerignore
         self.colblanks[colnum] = 0
         if colname not in self.data:
-            self.data[colname] = []
+            self.data[colname] = DataColumn()
 
     def _guessType(self, val):
         """Guess type for new dataset."""
@@ -290,6 +382,85 @@ class ReadCSV(object):
             # conversion succeeded - append number to data
             self.data[self.colnames[colnum]].append(v)
 
+    def _readLine(self, line):
+        """Read a line, handling values one by one."""
+        for colnum, col in enumerate(line):
+            try:
+                self._handleVal(colnum, col)
+            except _NextValue:
+                pass
+
+    def _readBulk(self, chunk, start):
+        """Read values in the chunk in bulk from row start, until
+        the point where they need to be handled one by one.
+
+        Returns the row where bulk reading stopped.
+        """
+
+        end = len(chunk.lines)
+        bulkcols = []
+        names = set()
+        for colnum in xrange(chunk.numcols):
+            if colnum not in self.colnames:
+                # blank values are ignored in unused columns
+                kind = None
+            elif ( self.colignore[colnum] > 0 or
+                   self.coltypes[colnum] not in ('float', 'string') ):
+                return start
+            else:
+                kind = self.coltypes[colnum]
+                name = self.colnames[colnum]
+                # values of columns with the same name are interleaved
+                if name in names:
+                    return start
+                names.add(name)
+                bulkcols.append( (colnum, kind, name) )
+
+            end = min(end, chunk.nextStop(kind, colnum, start))
+            if end == start:
+                return start
+
+        for colnum, kind, name in bulkcols:
+            if kind == 'float':
+                vals, blank, bad = chunk.floats(colnum)
+                vals = vals[start:end]
+                if not self.params.blanksaredata:
+                    # skip blanks
+                    vals = vals[~blank[start:end]]
+                self.data[name].extend(vals)
+            else:
+                self.data[name].extend( chunk.cells(colnum)[start:end] )
+
+        return end
+
+    def _readChunk(self, lines):
+        """Read a chunk of lines, converting columns in bulk where
+        possible."""
+
+        chunk = _ColumnChunk(lines, self.numre, self.decimalpoint)
+        row = 0
+        while row < len(lines):
+            row = self._readBulk(chunk, row)
+            if row < len(lines):
+                self._readLine(lines[row])
+                row += 1
+
+    def _readLines(self, it):
+        """Read lines (or columns) from the iterator given."""
+
+        # iterate over each line (or column), in chunks
+        while True:
+            lines = []
+            try:
+                while len(lines) < self.chunklines:
+                    lines.append( it.next() )
+            except StopIteration:
+                pass
+            if not lines:
+                break
+
+            self._readChunk(lines)
+
     def readData(self):
         """Read the data into the document."""
 
@@ -326,19 +497,26 @@ class ReadCSV(object):
         # type detection
         self.colblanks = {}
 
-        # iterate over each line (or column)
-        while True:
-            try:
-                line = it.next()
-            except StopIteration:
-                break
+        self.fileiter = it
+        self._readLines(it)
 
-            # iterate over items on line
-            for colnum, col in enumerate(line):
-                try:
-                    self._handleVal(colnum, col)
-                except _NextValue:
-                    pass
+    def readMoreData(self, fileobj):
+        """Read further lines from the (binary) file object given,
+        continuing from the state at the end of the last read. The
+        datasets must have been read from columns, not rows."""
+
+        par = self.params
+        self.fileiter.csvreader = utils.UnicodeCSVReader(
+            fileobj,
+            delimiter=par.delimiter,
+            quotechar=par.textdelimiter,
+            encoding=par.encoding )
+        self._readLines(self.fileiter)
+
+    def clearData(self):
+        """Forget the data read, but keep the state of the reader."""
+        for name in self.data:
+            self.data[name] = DataColumn()
 
     def setData(self, document, linkedfile=None):
         """Set the read-in datasets in the document."""
@@ -357,7 +535,10 @@ class ReadCSV(object):
             # get data and errors (if any)
             data = []
             for k in (name, name+'\0+-', name+'\0+', name+'\0-'):
-                data.append( self.data.get(k, None) )
+                if k in self.data:
+                    data.append( self.data[k].getValues() )
+                else:
+                    data.append(None)
 
             # make them have a maximum length by adding NaNs
             maxlen = max([len(x) for x in data if x is not None])
@@ -42,6 +42,7 @@ x +- y + -
 
 import re
 import cStringIO
+import itertools
 
 import numpy as N
 
@@ -67,6 +68,9 @@ range_re = re.compile(r'''^
  \]
 $''', re.VERBOSE)
 
+# stop index used for ranges without an end
+openstopindex = 999999999
+
 def interpretDescriptor(descr):
     """Get a descriptor and create a set of descriptor objects."""
 
@@ -114,7 +118,7 @@ def interpretDescriptor(descr):
             if m.group(2):
                 stopindex = int(m.group(2))
             else:
-                stopindex = 999999999
+                stopindex = openstopindex
             idxrange = (startindex, stopindex)
             continue
 
@@ -194,6 +198,61 @@ def guessDataType(val):
     # assume string otherwise
     return 'string'
 
+class DataColumn(object):
+    """Values read for a column of data.
+
+    Values can be appended one at a time, or added in chunks as lists
+    or numpy arrays of floats.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, val):
+        """Add a single value."""
+        if not self.chunks or not isinstance(self.chunks[-1], list):
+            self.chunks.append([])
+        self.chunks[-1].append(val)
+        self.length += 1
+
+    def extend(self, vals):
+        """Add a list of values or a numpy array of floats."""
+        self.chunks.append(vals)
+        self.length += len(vals)
+
+    def truncate(self, length):
+        """Remove values after length."""
+        while self.length > length:
+            excess = self.length - length
+            last = self.chunks[-1]
+            if len(last) <= excess:
+                del self.chunks[-1]
+                self.length -= len(last)
+            else:
+                self.chunks[-1] = last[:len(last)-excess]
+                self.length = length
+
+    def getValues(self, tail=None):
+        """Return the values (or last tail values).
+
+        A list is returned, unless any values were added as numpy
+        arrays, in which case a numpy array is returned."""
+
+        if len(self.chunks) == 1 and isinstance(self.chunks[0], list):
+            vals = self.chunks[0]
+        elif all([isinstance(c, list) for c in self.chunks]):
+            vals = list(itertools.chain(*self.chunks))
+        else:
+            vals = N.concatenate( [N.array(c, dtype=N.float64)
+                                   for c in self.chunks] )
+        if tail is not None:
+            vals = vals[-tail:]
+        return vals
+
 class DescriptorPart(object):
     """Represents part of a descriptor."""
 
@@ -246,7 +305,7 @@ class DescriptorPart(object):
                 try:
                     dataset = thedatasets[fullname]
                 except KeyError:
-                    dataset = thedatasets[fullname] = []
+                    dataset = thedatasets[fullname] = DataColumn()
 
                 if not self.datatype:
                     # try to guess type of data
@@ -278,10 +337,63 @@ class DescriptorPart(object):
                 # add data into dataset
                 dataset.append(dat)
 
+    def _streamValues(self, thedatasets, name, streams, capacity):
+        """Move values read for name into the streamed dataset for it
+        in streams (creating it if needed). Returns the dataset."""
+
+        cols = {}
+        for col, suffix in (('data', '\0D'), ('serr', '\0+-'),
+                            ('perr', '\0+'), ('nerr', '\0-')):
+            if name+suffix in thedatasets:
+                cols[col] = thedatasets[name+suffix]
+
+        # make sure components are the same length
+        minlength = min([len(c) for c in cols.itervalues()])
+        vals = {}
+        for col, column in cols.iteritems():
+            column.truncate(minlength)
+            vals[col] = N.array(column.getValues(), dtype=N.float64)
+            column.truncate(0)
+        if 'serr' in vals: vals['serr'] = N.abs(vals['serr'])
+        if 'perr' in vals: vals['perr'] = N.abs(vals['perr'])
+        if 'nerr' in vals: vals['nerr'] = -N.abs(vals['nerr'])
+
+        try:
+            ds = streams[name]
+        except KeyError:
+            if self.datatype == 'date':
+                ds = datasets.DatasetDateTimeStream(capacity)
+            else:
+                ds = datasets.DatasetStream(capacity,
+                                            columns=sorted(vals.keys()))
+            streams[name] = ds
+
+        if minlength > 0:
+            ds.appendValues(vals)
+        return ds
+
+    def collectStreams(self, thedatasets, streams, capacity):
+        """Move values read into the streamed datasets in streams."""
+
+        if self.datatype not in ('float', 'date'):
+            return
+        for index in xrange(self.startindex, self.stopindex+1):
+            if self.single:
+                name = self.name
+            else:
+                name = '%s_%i' % (self.name, index)
+            if name+'\0D' not in thedatasets:
+                break
+            self._streamValues(thedatasets, name, streams, capacity)
+
     def setInDocument(self, thedatasets, document, block=None,
                       linkedfile=None,
-                      prefix="", suffix="", tail=None):
-        """Set the read-in data in the document."""
+                      prefix="", suffix="", tail=None, streams=None):
+        """Set the read-in data in the document.
+
+        If streams is a dict, numeric and date values are appended to
+        the streamed datasets in it, rather than making new datasets.
+        """
 
         # we didn't read any data
         if self.datatype is None:
@@ -298,7 +410,17 @@ class DescriptorPart(object):
                 name += '_%i' % block
 
             # does the dataset exist?
-            if name+'\0D' in thedatasets:
+            if ( streams is not None and name+'\0D' in thedatasets and
+                 self.datatype in ('float', 'date') ):
+                ds = self._streamValues(thedatasets, name, streams, tail)
+
+                # datasets are only set if not already in the document
+                finalname = prefix + name + suffix
+                if document.data.get(finalname) is not ds:
+                    ds.linked = linkedfile
+                    document.setData( finalname, ds )
+                names.append(finalname)
+            elif name+'\0D' in thedatasets:
                 vals = thedatasets[name+'\0D']
                 pos = neg = sym = None
 
@@ -314,14 +436,13 @@ class DescriptorPart(object):
                         minlength = len(ds)
                 for ds in vals, pos, neg, sym:
                     if ds is not None and len(ds) != minlength:
-                        del ds[minlength:]
+                        ds.truncate(minlength)
 
                 # only remember last N values
-                if tail is not None:
-                    vals = vals[-tail:]
-                    if sym is not None: sym = sym[-tail:]
-                    if pos is not None: pos = pos[-tail:]
-                    if neg is not None: neg = neg[-tail:]
+                vals = vals.getValues(tail)
+                if sym is not None: sym = sym.getValues(tail)
+                if pos is not None: pos = pos.getValues(tail)
+                if neg is not None: neg = neg.getValues(tail)
 
                 # create the dataset
                 if self.datatype == 'float':
@@ -416,12 +537,28 @@ class FileStream(Stream):
         """File can be any iterator-like object."""
         Stream.__init__(self)
         self.file = file
+        # lines put back to be read again (in reverse order)
+        self.pushedback = []
 
     def readLine(self):
         """Read the next line of the data source.
         StopIteration is raised if there is no more data."""
+        if self.pushedback:
+            return self.pushedback.pop()
         return self.file.next()
 
+    def readLines(self, num):
+        """Read up to num raw lines from the data source.
+        Fewer lines are returned at the end of the data."""
+        lines = self.pushedback[::-1][:num]
+        del self.pushedback[len(self.pushedback)-len(lines):]
+        lines += list( itertools.islice(self.file, num-len(lines)) )
+        return lines
+
+    def pushBack(self, lines):
+        """Put raw lines back to be read again."""
+        self.pushedback += lines[::-1]
+
 class StringStream(FileStream):
     '''For reading data from a string.'''
     
@@ -430,6 +567,9 @@ class StringStream(FileStream):
         
         FileStream.__init__( self, cStringIO.StringIO(text) )
 
+# characters which mean lines cannot be split simply on whitespace
+fastreject_re = re.compile( r'''[`'"#!%;\\]|descriptor''' )
+
 class SimpleRead(object):
     '''Class to read in datasets from a stream.
 
@@ -437,8 +577,12 @@ class SimpleRead(object):
     Read the docstring for this module for information
 
     tail attribute if set says to only use last tail data points when setting
+    (see also setStreaming)
     '''
 
+    # number of lines to read at once if data are purely numeric
+    fastblocklines = 4096
+
     def __init__(self, descriptor):
         # convert descriptor to part objects
         descriptor = descriptor.strip()
@@ -455,6 +599,28 @@ class SimpleRead(object):
         self.datasets = {}
         self.blocks = None
         self.tail = None
+        self.streams = None
+
+    def setStreaming(self, capacity=None):
+        """Stream numeric and date values into datasets held by the
+        reader, keeping the last capacity values (or all if None).
+
+        Values read are moved into the datasets by setInDocument or
+        collectStreams, so setting the data in the document again only
+        appends the new values. Memory use is bounded by capacity.
+        """
+        self.streams = {}
+        self.tail = capacity
+
+    def collectStreams(self):
+        """Move values read so far into the streamed datasets, without
+        setting them in the document."""
+        for part in self.parts:
+            part.collectStreams(self.datasets, self.streams, self.tail)
+
+    def clearData(self):
+        """Forget the data read, but keep the state of the reader."""
+        self.datasets = {}
 
     def _parseDescriptor(self, descriptor):
         """Take a descriptor, and parse it into its individual parts."""
@@ -474,13 +640,129 @@ class SimpleRead(object):
         else:
             self._readDataUnblocked(stream, ignoretext)
 
-    def _readDataUnblocked(self, stream, ignoretext):
-        """Read in that data from the stream."""
+    def _canReadFast(self):
+        """Can the current descriptor be read in numeric blocks?"""
+        for p in self.parts:
+            if ( p.datatype not in (None, 'float') or
+                 p.stopindex == openstopindex ):
+                return False
+        return True
 
-        allparts = list(self.parts)
+    def _readFastBlock(self, stream, allparts):
+        """Read a block of purely numeric lines from the stream
+        directly into numpy arrays.
+
+        Returns None at the end of the stream, True if the block was
+        read, or False if the block was put back in the stream to be
+        read line by line.
+        """
+
+        lines = stream.readLines(self.fastblocklines)
+        if not lines:
+            return None
+
+        # the lines must be simple whitespace-separated items, with
+        # the same number of items on each line (ignoring blank lines)
+        rows = None
+        if not fastreject_re.search( ''.join(lines) ):
+            rows = [l.split() for l in lines]
+            rows = [r for r in rows if r]
+            if not rows:
+                return True
+            numitems = len(rows[0])
+            for r in rows:
+                if len(r) != numitems:
+                    rows = None
+                    break
+
+        if rows is not None:
+            # automatically create parts for extra items
+            parts = list(self.parts)
+            if self.autodescr:
+                numcols = sum( [len(p.columns) for p in parts] )
+                while numcols < numitems:
+                    parts.append( DescriptorPart(
+                            str(len(parts)+1), None, 'D', None ) )
+                    numcols += 1
+
+            # work out which item each column comes from, checking
+            # parts without a type look numeric
+            columns = []
+            numeric = True
+            for p in parts:
+                if ( p.datatype is None and len(columns) < numitems and
+                     guessDataType(rows[0][len(columns)]) != 'float' ):
+                    numeric = False
+                for index in xrange(p.startindex, p.stopindex+1):
+                    for col in p.columns:
+                        columns.append( (p, index, col) )
+
+        if rows is not None and numeric and len(columns) <= numitems:
+            if len(columns) < numitems:
+                rows = [r[:len(columns)] for r in rows]
+            try:
+                data = N.array(rows, dtype=N.float64)
+            except ValueError:
+                # conversion errors are counted when read line by line
+                data = None
+        else:
+            data = None
+
+        if data is None:
+            stream.pushBack(lines)
+            return False
+
+        # store data for each column
+        for i, (p, index, col) in enumerate(columns):
+            if p.single:
+                name = p.name
+            else:
+                name = '%s_%i' % (p.name, index)
+            fullname = '%s\0%s' % (name, col)
+            try:
+                dataset = self.datasets[fullname]
+            except KeyError:
+                dataset = self.datasets[fullname] = DataColumn()
+            dataset.extend( data[:,i].copy() )
+            p.datatype = 'float'
+
+        for p in parts[len(self.parts):]:
+            self.parts.append(p)
+            allparts.append(p)
+
+        return True
+
+    def readMoreData(self, stream):
+        """Read further data from the stream, continuing from the
+        state at the end of the last read (which must be unblocked).
+        """
+        allparts = self.parts
+        self.parts = self.readparts
+        self._readDataUnblocked(stream, self.ignoretext, allparts=allparts)
+
+    def _readDataUnblocked(self, stream, ignoretext, allparts=None):
+        """Read in that data from the stream.
+        allparts is the list of parts read previously, if continuing."""
+
+        if allparts is None:
+            allparts = list(self.parts)
+
+        # if reading from a file, purely numeric data are read in
+        # blocks of lines where possible
+        fast = isinstance(stream, FileStream)
 
         # loop over lines
-        while stream.newLine():
+        while True:
+            if fast and not stream.pushedback and self._canReadFast():
+                readblock = self._readFastBlock(stream, allparts)
+                if readblock is None:
+                    break
+                elif readblock:
+                    continue
+
+            if not stream.newLine():
+                break
+
             if stream.remainingline[:1] == ['descriptor']:
                 # a change descriptor statement
                 descriptor =  ' '.join(stream.remainingline[1:])
@@ -511,6 +793,8 @@ class SimpleRead(object):
 
             stream.flushLine()
 
+        # keep parts of the current descriptor for reading more data
+        self.readparts = self.parts
         self.parts = allparts
         self.blocks = None
 
@@ -569,6 +853,9 @@ class SimpleRead(object):
         for name, data in self.datasets.iteritems():
             if name[-2:] == '\0D':
                 out[name[:-2]] = len(data)
+        if self.streams:
+            for name, ds in self.streams.iteritems():
+                out[name] = out.get(name, 0) + ds.totallength
         return out
 
     def setInDocument(self, document, linkedfile=None,
@@ -596,7 +883,7 @@ class SimpleRead(object):
                     block=block,
                     linkedfile=linkedfile,
                     prefix=prefix, suffix=suffix,
-                    tail=self.tail)
+                    tail=self.tail, streams=self.streams)
 
         return names
 
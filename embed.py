@@ -48,11 +48,195 @@ import new
 import cPickle
 import socket
 import subprocess
+import tempfile
 import time
 import uuid
 
 # check remote process has this API version
-API_VERSION = 1
+API_VERSION = 2
+
+# numpy arrays with at least this many bytes are passed between the
+# processes in a temporary file (in shared memory if possible), rather
+# than being pickled and sent through the socket
+sharedarraysize = 65536
+
+# tuples describing arrays in temporary files start with this
+sharedarraymarker = '__veusz_shared_array__'
+sharedarrayprefix = 'veusz_embed_'
+
+def isLargeArray(obj):
+    """Is obj a numpy array which should be sent via a temporary file?"""
+    return ( type(obj).__module__ == 'numpy' and
+             hasattr(obj, 'nbytes') and obj.nbytes >= sharedarraysize and
+             not obj.dtype.hasobject )
+
+def writeSharedArray(array):
+    """Write the numpy array to a temporary file, returning a tuple
+    describing it to be pickled instead."""
+
+    tempdir = None
+    if os.path.isdir('/dev/shm'):
+        # memory-based filesystem on linux
+        tempdir = '/dev/shm'
+    fd, filename = tempfile.mkstemp(prefix=sharedarrayprefix, dir=tempdir)
+    f = os.fdopen(fd, 'wb')
+    try:
+        array.tofile(f)
+    finally:
+        f.close()
+    return (sharedarraymarker, filename, array.dtype.str, array.shape)
+
+def isSharedArray(obj):
+    """Is obj a tuple describing an array in a temporary file?"""
+    return ( type(obj) is tuple and len(obj) == 4 and
+             obj[0] == sharedarraymarker )
+
+def readSharedArray(desc):
+    """Return the array described by desc and remove its file.
+
+    The file is memory-mapped copy-on-write, so the values are not
+    copied until they are modified."""
+
+    import numpy
+    filename, dtype, shape = desc[1:]
+    if not os.path.basename(filename).startswith(sharedarrayprefix):
+        raise ValueError("Invalid shared array filename")
+
+    try:
+        if sys.platform == 'win32' or numpy.prod(shape) == 0:
+            # windows cannot delete mapped files
+            array = numpy.fromfile(filename, dtype=dtype).reshape(shape)
+        else:
+            array = numpy.memmap(filename, dtype=dtype, mode='c',
+                                 shape=shape).view(numpy.ndarray)
+    finally:
+        os.unlink(filename)
+    return array
+
+def removeSharedArray(desc):
+    """Remove the file of the array described by desc, if it still
+    exists."""
+    filename = desc[1]
+    if os.path.basename(filename).startswith(sharedarrayprefix):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+
+def encodeArrays(vals):
+    """Replace large arrays in the list or tuple vals by descriptions
+    of temporary files holding them."""
+    out = []
+    for v in vals:
+        if isLargeArray(v):
+            v = writeSharedArray(v)
+        out.append(v)
+    return type(vals)(out)
+
+def encodeCommand(cmdtuple):
+    """Pass large arrays in the arguments of the command in temporary
+    files."""
+    window, cmd, args, args2 = cmdtuple
+    args2 = dict(args2)
+    for key, val in args2.iteritems():
+        if isLargeArray(val):
+            args2[key] = writeSharedArray(val)
+    return (window, cmd, encodeArrays(args), args2)
+
+def encodeResult(retval):
+    """Pass a large array, or large arrays in a tuple, returned by a
+    command in temporary files."""
+    if isLargeArray(retval):
+        return writeSharedArray(retval)
+    elif isinstance(retval, tuple):
+        return encodeArrays(retval)
+    return retval
+
+def decodeResult(retval):
+    """Get arrays returned in temporary files."""
+    if isSharedArray(retval):
+        return readSharedArray(retval)
+    elif isinstance(retval, tuple):
+        return decodeArrays(retval)
+    return retval
+
+def decodeArrays(vals):
+    """Replace descriptions of arrays in vals with the arrays."""
+    out = []
+    for v in vals:
+        if isSharedArray(v):
+            v = readSharedArray(v)
+        out.append(v)
+    return type(vals)(out)
+
+class CommandFuture(object):
+    """Result of a command queued in a batch.
+
+    The result is available once the batch has been sent."""
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self._done = False
+        self._value = self._error = None
+
+    def _set(self, value=None, error=None):
+        self._done = True
+        self._value, self._error = value, error
+
+    def done(self):
+        """Has the command been run (or failed)?"""
+        return self._done
+
+    def result(self):
+        """Return the value returned by the command, or raise its
+        exception."""
+        if not self._done:
+            raise RuntimeError("Batch containing %s has not been sent" %
+                               self.cmd)
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+class CommandBatch(object):
+    """Context manager to queue commands to an embedded window, sending
+    them in one go when the block ends.
+
+    with g.Batch():
+        g.Set('x/label', 'Foo')
+        ...
+
+    Queued commands return CommandFuture objects, rather than their
+    results. The remote process runs the commands with updates of the
+    document suspended, stopping at the first exception, which is
+    raised when the block ends.
+
+    Commands which only query the document (Embedded.querycmds) are
+    not queued. The commands queued before them are sent first, so
+    that the query returns the current value.
+    """
+
+    def __init__(self, embedded):
+        self.embedded = embedded
+
+    def __enter__(self):
+        e = self.embedded
+        if e._batch is None:
+            e._batch = []
+        e._batchdepth += 1
+        return self
+
+    def __exit__(self, exctype, excval, tb):
+        e = self.embedded
+        e._batchdepth -= 1
+        if e._batchdepth > 0:
+            return False
+
+        queued, e._batch = e._batch, None
+        if exctype is not None:
+            # do not run the commands if the block failed
+            return False
+        e._sendBatch(queued)
+        return False
 
 def Bind1st(function, arg):
     """Bind the first argument of a given function to the given
@@ -81,6 +265,11 @@ class Embedded(object):
 
     remote = None
 
+    # commands returning information, which are run at once in a batch
+    querycmds = frozenset( ('Get', 'GetChildren', 'GetData', 'GetDataType',
+                            'GetDatasets', 'NodeChildren', 'NodeType',
+                            'ResolveReference', 'SettingType', 'WidgetType') )
+
     def __init__(self, name = 'Veusz', copyof = None):
         """Initialse the embedded veusz window.
 
@@ -88,6 +277,10 @@ class Embedded(object):
         This method creates a new thread to run Qt if necessary
         """
 
+        # commands being queued by Batch
+        self._batch = None
+        self._batchdepth = 0
+
         if not Embedded.remote:
             Embedded.startRemote()
 
@@ -127,6 +320,33 @@ class Embedded(object):
         """
         return Embedded(name=name, copyof=self)
 
+    def Batch(self):
+        """Return a context manager which queues commands to this
+        window until the end of the block, then sends them together.
+
+        The commands return CommandFuture objects in the block."""
+        return CommandBatch(self)
+
+    def _sendBatch(self, queued):
+        """Send the queued (command, future) pairs of a batch, setting
+        the results of the futures. The exception of a failing command
+        is raised."""
+
+        if not queued:
+            return
+        results, error = self.sendCommand(
+            (-1, '_Batch', ([encodeCommand(q[0]) for q in queued],), {}) )
+        for (cmd, future), value in zip(queued, results):
+            future._set(value=decodeResult(value))
+        if error is not None:
+            # the failing command stops the batch
+            queued[len(results)][1]._set(error=error)
+            for cmd, future in queued[len(results)+1:]:
+                future._set(error=RuntimeError(
+                        "%s not run after earlier failure in batch" %
+                        future.cmd))
+            raise error
+
     def WaitForClose(self):
         """Wait for the window to close."""
 
@@ -281,7 +501,7 @@ class Embedded(object):
     def sendCommand(cls, cmd):
         """Send the command to the remote process."""
 
-        outs = cPickle.dumps(cmd)
+        outs = cPickle.dumps(cmd, cPickle.HIGHEST_PROTOCOL)
 
         cls.writeToSocket( cls.serv_socket, struct.pack('<I', len(outs)) )
         cls.writeToSocket( cls.serv_socket, outs )
@@ -293,12 +513,25 @@ class Embedded(object):
         if isinstance(retobj, Exception):
             raise retobj
         else:
-            return retobj
+            # large arrays are returned in temporary files
+            return decodeResult(retobj)
 
     def runCommand(self, cmd, *args, **args2):
         """Execute the given function in the Qt thread with the arguments
         given."""
-        return self.sendCommand( (self.winno, cmd, args[1:], args2) )
+
+        cmdtuple = (self.winno, cmd, args[1:], args2)
+        if self._batch is not None:
+            if cmd in self.querycmds:
+                # send the commands so far, then run the query
+                queued, self._batch = self._batch, []
+                self._sendBatch(queued)
+            else:
+                future = CommandFuture(cmd)
+                self._batch.append( (cmdtuple, future) )
+                return future
+
+        return self.sendCommand( encodeCommand(cmdtuple) )
 
     @classmethod
     def exitQt(cls):
@@ -308,6 +541,72 @@ class Embedded(object):
         cls.serv_socket.close()
         cls.serv_socket, cls.from_pipe = -1, -1
 
+class RenderClient(object):
+    """Client for a render server started with veusz --render-server.
+
+    c = RenderClient()
+    png = c.Render(document='plot.vsz', datasets={'y': yvals})
+    """
+
+    def __init__(self, address=None):
+        """Connect to the server listening on the socket filename
+        address (default ~/.veusz_render_socket)."""
+
+        if address is None:
+            address = os.path.join(os.path.expanduser('~'),
+                                   '.veusz_render_socket')
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(address)
+
+    def _readLen(self, length):
+        """Read length bytes from the server."""
+        s = ''
+        while len(s) < length:
+            part = self.socket.recv(length-len(s))
+            if not part:
+                raise RuntimeError('Connection to render server closed')
+            s += part
+        return s
+
+    def Render(self, document=None, text=None, datasets=None, page=0,
+               format='png', timeout=None, **options):
+        """Render a page of a document, returning the image.
+
+        document is the filename of the document, or text the
+         text of its script
+        datasets is an optional dict of dataset names to values,
+         which replace those in the document while rendering. Values
+         are arrays, tuples of arrays (values and errors), or 2D arrays.
+        page, format and options are as for RenderToBuffer
+        timeout is the time in seconds after which the job is abandoned
+        """
+
+        if datasets:
+            datasets = dict(datasets)
+            for name, val in datasets.iteritems():
+                if isLargeArray(val):
+                    datasets[name] = writeSharedArray(val)
+
+        job = { 'document': document, 'text': text, 'datasets': datasets,
+                'page': page, 'format': format, 'options': options }
+        if document is None:
+            del job['document']
+        if timeout is not None:
+            job['timeout'] = timeout
+
+        data = cPickle.dumps(job, cPickle.HIGHEST_PROTOCOL)
+        self.socket.sendall(struct.pack('<I', len(data)) + data)
+
+        length = struct.unpack('<I', self._readLen(struct.calcsize('<I')))[0]
+        status, result = cPickle.loads(self._readLen(length))
+        if status != 'ok':
+            raise RuntimeError('Render failed:\n' + result)
+        return decodeResult(result)
+
+    def Close(self):
+        """Close the connection to the server."""
+        self.socket.close()
+
 ############################################################################
 # Tree-based interface to Veusz widget tree below
 
@@ -332,6 +631,13 @@ class Node(object):
         return "<%s at %s (type %s)>" % (self.__class__.__name__,
                                          self._path, self._type)
 
+    def _checkNotBatch(self, action):
+        """Raise an exception if commands are being queued in a batch,
+        as the result of the command for action is needed."""
+        if getattr(self._ci, '_batch', None) is not None:
+            raise RuntimeError("Cannot %s using Nodes inside a Batch" %
+                               action)
+
     def fromPath(self, path):
         """Return a new Node for the path given."""
         wtype = self._ci.NodeType(path)
@@ -528,6 +834,7 @@ class WidgetNode(Node):
         """Add a widget of the type given, returning the Node instance.
         """
 
+        self._checkNotBatch('add a widget')
         args_opt['widget'] = self._path
         name = self._ci.Add(widgettype, *args, **args_opt)
         return WidgetNode( self._ci, 'widget', self._joinPath(name) )
@@ -553,6 +860,7 @@ class WidgetNode(Node):
         """Clone widget, placing at newparent. Uses newname if given.
 
         Returns new node."""
+        self._checkNotBatch('clone a widget')
         path = self._ci.CloneWidget(self._path, newparent._path,
                                     newname=newname)
         return WidgetNode( self._ci, 'widget', path )
@@ -24,11 +24,12 @@ import socket
 import veusz.qtall as qt4
 from veusz.windows.simplewindow import SimpleWindow
 import veusz.document as document
+import veusz.embed as embed
 
 """Program to be run by embedding interface to run Veusz commands."""
 
 # embed.py module checks this is the same as its version number
-API_VERSION = 1
+API_VERSION = 2
 
 class EmbeddedClient(object):
     """An object for each instance of embedded window with document."""
@@ -210,13 +211,80 @@ class EmbedApplication(qt4.QApplication):
 
     def writeOutput(self, output):
         """Send output back to embed process."""
+        # large arrays are returned in temporary files
+        output = embed.encodeResult(output)
+
         # format return data
-        outstr = cPickle.dumps(output)
+        outstr = cPickle.dumps(output, cPickle.HIGHEST_PROTOCOL)
 
         # send return data to stdout
         self.writeToSocket( self.socket, struct.pack('<I', len(outstr)) )
         self.writeToSocket( self.socket, outstr )
 
+    def decodeArgs(self, args, argsv):
+        """Map any arrays passed in temporary files."""
+        args = embed.decodeArrays(args)
+        for key, val in argsv.iteritems():
+            if embed.isSharedArray(val):
+                argsv[key] = embed.readSharedArray(val)
+        return args, argsv
+
+    def runClientCommand(self, window, cmd, args, argsv):
+        """Run the command of the client window with the arguments."""
+        interpreter = self.clients[window].ci
+        if cmd not in interpreter.cmds:
+            raise AttributeError, "No Veusz command %s" % cmd
+        return interpreter.cmds[cmd](*args, **argsv)
+
+    def removeArgs(self, args, argsv):
+        """Remove the temporary files of any arrays not decoded."""
+        for val in list(args) + argsv.values():
+            if embed.isSharedArray(val):
+                embed.removeSharedArray(val)
+
+    def runBatch(self, cmds):
+        """Run a list of (window, cmd, args, argsv) commands, with
+        updates to their documents suspended until all are done.
+
+        Returns (list of results, exception or None), stopping at the
+        first command raising an exception.
+        """
+
+        # get all the arrays first, so their files are removed even if
+        # a command fails
+        decoded = []
+        error = None
+        for i, (window, cmd, args, argsv) in enumerate(cmds):
+            try:
+                decoded.append( (window, cmd) +
+                                self.decodeArgs(args, argsv) )
+            except Exception, e:
+                # the commands before this one are run, then this
+                # one fails
+                error = e
+                for window, cmd, args, argsv in cmds[i:]:
+                    self.removeArgs(args, argsv)
+                break
+
+        results = []
+        docs = []
+        try:
+            for window, cmd, args, argsv in decoded:
+                doc = self.clients[window].document
+                if doc is not None and doc not in docs:
+                    doc.suspendUpdates()
+                    docs.append(doc)
+
+                retval = self.runClientCommand(window, cmd, args, argsv)
+                results.append( embed.encodeResult(retval) )
+        except Exception, e:
+            return results, e
+        finally:
+            for doc in docs:
+                doc.enableUpdates()
+
+        return results, error
+
     def slotDataToRead(self, socketfd):
         self.notifier.setEnabled(False)
         self.socket.setblocking(1)
@@ -234,15 +302,13 @@ class EmbedApplication(qt4.QApplication):
             # one specified
             retval = self.makeNewClient( args[0],
                                          doc=self.clients[args[1]].document )
+        elif cmd == '_Batch':
+            retval = self.runBatch(args[0])
         else:
-            interpreter = self.clients[window].ci
-
             # window commands
             try:
-                if cmd not in interpreter.cmds:
-                    raise AttributeError, "No Veusz command %s" % cmd
-
-                retval = interpreter.cmds[cmd](*args, **argsv)
+                args, argsv = self.decodeArgs(args, argsv)
+                retval = self.runClientCommand(window, cmd, args, argsv)
             except Exception, e:
                 retval = e
 
@@ -19,10 +19,12 @@
 #include <QPointF>
 #include <QPen>
 #include <cmath>
+#include <algorithm>
 
 #include <polylineclip.h>
 
 using std::fabs;
+using std::floor;
 
 // Cohen-Sutherland line clipping algorithm
 
@@ -257,3 +259,33 @@ void plotClippedPolyline(QPainter& painter,
   if( pout.size() >= 2 )
     painter.drawPolyline(pout);
 }
+
+void decimatePolyline(QPolygonF& poly,
+		      const double* x, const double* y, int npts)
+{
+  int i = 0;
+  while( i < npts )
+    {
+      // find run of points in the same pixel column, keeping track
+      // of the minimum and maximum points
+      const double col = floor(x[i]);
+      int imin = i, imax = i;
+      int j = i+1;
+      for( ; j < npts && floor(x[j]) == col; ++j )
+	{
+	  if( y[j] < y[imin] )
+	    imin = j;
+	  if( y[j] > y[imax] )
+	    imax = j;
+	}
+
+      // add first, extreme and last points in their original order
+      int idx[4] = { i, imin, imax, j-1 };
+      std::sort(idx, idx+4);
+      for( int k = 0; k < 4; ++k )
+	if( k == 0 || idx[k] != idx[k-1] )
+	  poly << QPointF(x[idx[k]], y[idx[k]]);
+
+      i = j;
+    }
+}
@@ -36,4 +36,9 @@ void plotClippedPolyline(QPainter& painter,
 // if is in region or false if not
 bool clipLine(const QRectF& clip, QPointF& pt1, QPointF& pt2);
 
+// add the npts points in x and y to poly, keeping only the first,
+// last, minimum and maximum y points in each pixel column
+void decimatePolyline(QPolygonF& poly,
+		      const double* x, const double* y, int npts);
+
 #endif
@@ -20,6 +20,7 @@
 
 """Plugins for creating datasets."""
 
+import os
 import numpy as N
 from itertools import izip
 import field
@@ -114,6 +115,75 @@ class Dataset2D(object):
         import veusz.document as document
         return document.Dataset2DPlugin(manager, self)
 
+def memmapArray(filename, dtype, offset=0, shape=(-1,), strides=None):
+    """Return a read-only numpy array which is a view of values in a
+    memory-mapped file, without reading them into memory.
+
+    filename: file to map
+    dtype: numpy datatype of values, including byte order
+    offset: offset of first value in file in bytes
+    shape: shape of array; if the first dimension is -1 (or
+           negative), use as many values as fit in the file
+    strides: tuple of bytes between values in each dimension
+             (default is packed values in C order)
+    """
+
+    dtype = N.dtype(dtype)
+    shape = list(shape)
+    if strides is None:
+        strides = [dtype.itemsize]
+        for dim in shape[:0:-1]:
+            strides.insert(0, strides[0]*dim)
+    strides = list(strides)
+
+    # bytes taken up by a single value along the first axis
+    extent = dtype.itemsize
+    for dim, stride in izip(shape[1:], strides[1:]):
+        extent += (dim-1)*stride
+
+    filesize = os.path.getsize(filename)
+    available = filesize - offset
+    if shape[0] < 0:
+        shape[0] = 0
+        if available >= extent:
+            shape[0] = (available-extent) // strides[0] + 1
+    elif shape[0] > 0 and (shape[0]-1)*strides[0] + extent > available:
+        raise ValueError("File is too short for the requested size")
+
+    if shape[0] == 0 or filesize == 0:
+        # mmap cannot map an empty region
+        return N.zeros(shape, dtype=dtype)
+
+    mapped = N.memmap(filename, dtype=N.uint8, mode='r')
+    return N.ndarray(shape, dtype=dtype, buffer=mapped, offset=offset,
+                     strides=strides)
+
+class Dataset1DMemmap(object):
+    """1D dataset for ImportPlugin, which is a read-only view of values in
+    a memory-mapped file, rather than a copy in memory."""
+    def __init__(self, name, data):
+        """1D mapped dataset
+        name: name of dataset
+        data: 1D numpy array from a memory-mapped file (see memmapArray)
+        """
+        self.name = name
+        self.data = data
+
+class Dataset2DMemmap(object):
+    """2D dataset for ImportPlugin, which is a read-only view of values in
+    a memory-mapped file, rather than a copy in memory."""
+    def __init__(self, name, data, rangex=None, rangey=None):
+        """2D mapped dataset
+        name: name of dataset
+        data: 2D numpy array from a memory-mapped file (see memmapArray)
+        rangex: optional tuple with X range of data (min, max)
+        rangey: optional tuple with Y range of data (min, max)
+        """
+        self.name = name
+        self.data = data
+        self.rangex = rangex
+        self.rangey = rangey
+
 class DatasetDateTime(object):
     """Date-time dataset for ImportPlugin or DatasetPlugin."""
 
@@ -202,6 +272,9 @@ class DatasetPluginHelper(object):
         """Construct helper object to pass to DatasetPlugins."""
         self._doc = doc
 
+        # names of datasets requested by the plugin
+        self._inputnames = set()
+
     @property
     def datasets1d(self):
         """Return list of existing 1D numeric datasets"""
@@ -232,6 +305,8 @@ class DatasetPluginHelper(object):
         part is 'data', 'serr', 'perr' or 'nerr' - these are the
         dataset parts which are evaluated by the expression
         """
+        import veusz.document as document
+        self._inputnames.update( document.exprDatasetNames(expr) )
         return self._doc.evalDatasetExpression(expr, part=part)
 
     def getDataset(self, name, dimensions=1):
@@ -245,6 +320,7 @@ class DatasetPluginHelper(object):
         dimensions not right: raise a DatasetPluginException
         """
         import veusz.document as document
+        self._inputnames.add(name)
         try:
             ds = self._doc.data[name]
         except KeyError:
@@ -279,6 +355,7 @@ class DatasetPluginHelper(object):
         name not found: raise a DatasetPluginException
         """
 
+        self._inputnames.add(name)
         try:
             ds = self._doc.data[name]
         except KeyError:
@@ -299,11 +376,13 @@ class DatasetPluginManager(object):
         fields - fields to pass to plugin
         """
         
+        import veusz.document as document
+
         self.plugin = plugin
         self.document = doc
         self.helper = DatasetPluginHelper(doc)
         self.fields = dict(fields)
-        self.changeset = -1
+        self.inputs = document.DatasetInputTracker()
 
         self.fixMissingFields()
         self.setupDatasets()
@@ -361,11 +440,12 @@ class DatasetPluginManager(object):
         when updating the dataset
         """
 
-        if self.document.changeset == self.changeset:
+        # only rerun if any datasets used by the plugin have changed
+        if not self.inputs.isOutOfDate(self.document):
             return
-        self.changeset = self.document.changeset
 
         # run the plugin with its parameters
+        self.helper._inputnames = set()
         try:
             self.plugin.updateDatasets(self.fields, self.helper)
         except DatasetPluginException, ex:
@@ -376,6 +456,9 @@ class DatasetPluginManager(object):
             # otherwise if there's an error, then log and null outputs
             self.document.log( unicode(ex) )
             self.nullDatasets()
+        finally:
+            self.inputs.setEvaluated(self.document, self.helper._inputnames,
+                                     self.veuszdatasets)
 
 class DatasetPlugin(object):
     """Base class for defining dataset plugins."""
@@ -442,6 +442,16 @@ def cnvtImportNumpyArray(name, val, errorsin2d=True):
         val.shape
     except AttributeError:
         raise ImportPluginException(_("Not the correct format file"))
+
+    if ( isinstance(val, N.memmap) and val.dtype.kind in 'iuf' and
+         (val.ndim == 1 or (val.ndim == 2 and not
+                            (errorsin2d and val.shape[1] in (2, 3)))) ):
+        # keep mapped arrays in the file, rather than copying them
+        if val.ndim == 1:
+            return datasetplugin.Dataset1DMemmap(name, val)
+        else:
+            return datasetplugin.Dataset2DMemmap(name, val)
+
     try:
         val + 0.
         val = val.astype(N.float64)
@@ -466,6 +476,15 @@ def cnvtImportNumpyArray(name, val, errorsin2d=True):
     else:
         raise ImportPluginException(_("Unsupported dataset shape"))
 
+def loadNpyMapped(filename):
+    """Load a NPY file, memory-mapping it if possible so that the data
+    are not read into memory."""
+    try:
+        return N.load(filename, mmap_mode='r')
+    except ValueError:
+        # object arrays cannot be mapped
+        return N.load(filename)
+
 class ImportPluginNpy(ImportPlugin):
     """For reading single datasets from NPY numpy saved files."""
 
@@ -490,7 +509,7 @@ class ImportPluginNpy(ImportPlugin):
         Returns (text, okaytoimport)
         """
         try:
-            retn = N.load(params.filename)
+            retn = loadNpyMapped(params.filename)
         except Exception:
             return _("Cannot read file"), False
 
@@ -512,7 +531,7 @@ class ImportPluginNpy(ImportPlugin):
             raise ImportPluginException(_("Please provide a name for the dataset"))
 
         try:
-            retn = N.load(params.filename)
+            retn = loadNpyMapped(params.filename)
         except Exception, e:
             raise ImportPluginException(_("Error while reading file: %s") %
                                         unicode(e))
@@ -603,7 +622,9 @@ class ImportPluginBinary(ImportPlugin):
             field.FieldCombo("endian", descr=_("Endian (byte order)"),
                              items = ("little", "big"), editable=False),
             field.FieldInt("offset", descr=_("Offset (bytes)"), default=0, minval=0),
-            field.FieldInt("length", descr=_("Length (values)"), default=-1)
+            field.FieldInt("length", descr=_("Length (values)"), default=-1),
+            field.FieldInt("stride", descr=_("Stride (bytes, 0 if packed)"),
+                           default=0, minval=0),
             ]
 
     def getNumpyDataType(self, params):
@@ -615,13 +636,14 @@ class ImportPluginBinary(ImportPlugin):
     def getPreview(self, params):
         """Preview of data files."""
         try:
+            length = os.path.getsize(params.filename)
             f = open(params.filename, "rb")
-            data = f.read()
+            data = f.read(65536)
             f.close()
         except EnvironmentError, e:
             return _("Cannot read file (%s)") % utils.decodeDefault(e.strerror), False
 
-        text = [_('File length: %i bytes') % len(data)]
+        text = [_('File length: %i bytes') % length]
 
         def filtchr(c):
             """Filtered character to ascii range."""
@@ -648,24 +670,27 @@ class ImportPluginBinary(ImportPlugin):
         if not name:
             raise ImportPluginException(_("Please provide a name for the dataset"))
 
+        # stride is missing from documents saved by older versions
+        stride = params.field_results.get("stride", 0)
+        strides = None
+        if stride > 0:
+            strides = (stride,)
+
         try:
-            f = open(params.filename, "rb")
-            f.seek( params.field_results["offset"] )
-            retn = f.read()
-            f.close()
+            data = datasetplugin.memmapArray(
+                params.filename, self.getNumpyDataType(params),
+                offset=params.field_results["offset"],
+                shape=(params.field_results["length"],),
+                strides=strides)
         except EnvironmentError, e:
             raise ImportPluginException(_("Error while reading file '%s'\n\n%s") %
                                         (params.filename, utils.decodeDefault(e.strerror)))
-
-        try:
-            data = N.fromstring(retn, dtype=self.getNumpyDataType(params),
-                                count=params.field_results["length"])
         except ValueError, e:
             raise ImportPluginException(_("Error converting data for file '%s'\n\n%s") %
                                         (params.filename, unicode(e)))
 
-        data = data.astype(N.float64)
-        return [ datasetplugin.Dataset1D(name, data) ]
+        # the data are mapped from the file, rather than read in
+        return [ datasetplugin.Dataset1DMemmap(name, data) ]
 
 importpluginregistry += [
     ImportPluginNpy,
@@ -0,0 +1,249 @@
+#    Copyright (C) 2013 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Server rendering documents to images for clients on a local socket.
+
+The server keeps a pool of worker processes, each with Qt and the
+widgets already imported and its recently used documents loaded. Jobs
+are sent by embed.RenderClient as dicts with the keys
+  document: filename of document to render, or
+  text: text of document script to render
+  datasets: optional dict of dataset names to values, replacing the
+            datasets of the document while rendering
+  page, format, options: arguments to the RenderToBuffer command
+  timeout: optional time limit in seconds for the job
+
+Jobs taking too long are abandoned and their worker replaced. A memory
+limit can be set for the workers on systems supporting it.
+"""
+
+import os
+import stat
+import socket
+import struct
+import cPickle
+import optparse
+import Queue
+import SocketServer
+import multiprocessing
+
+import veusz.embed as embed
+import veusz.batch_export as batch_export
+
+# default name of socket in home directory
+socketname = '.veusz_render_socket'
+
+def _removeSharedArrays(job):
+    """Remove any temporary files of shared arrays left in job."""
+    for val in (job.get('datasets') or {}).itervalues():
+        if embed.isSharedArray(val):
+            embed.removeSharedArray(val)
+
+def _renderJob(job):
+    """Render a job in a worker, returning the image."""
+
+    import veusz.document as document
+
+    # read arrays passed in temporary files first, so that the files
+    # are removed even if the document cannot be loaded
+    overrides = {}
+    try:
+        for name, val in (job.get('datasets') or {}).iteritems():
+            if embed.isSharedArray(val):
+                val = embed.readSharedArray(val)
+            overrides[name] = val
+    finally:
+        _removeSharedArrays(job)
+
+    ci, loadtime = batch_export.getDocument(
+        job.get('document', '<string>'), text=job.get('text'))
+    doc = ci.document
+
+    # temporarily replace datasets with values in job (not using
+    # operations, so the cached document does not gather history)
+    original = {}
+    try:
+        for name, val in overrides.iteritems():
+            original[name] = doc.data.get(name)
+            if isinstance(val, tuple):
+                # values and errors
+                ds = document.Dataset(*val)
+            elif getattr(val, 'ndim', 1) == 2:
+                ds = document.Dataset2D(val)
+            else:
+                ds = document.Dataset(val)
+            doc.setData(name, ds)
+
+        return ci.interface.RenderToBuffer(
+            page=job.get('page', 0), format=job.get('format', 'png'),
+            **job.get('options', {}))
+
+    finally:
+        for name, ds in original.iteritems():
+            if ds is None:
+                doc.deleteData(name)
+            else:
+                doc.setData(name, ds)
+
+def _workerJob(job):
+    """Render job in a worker process, returning the encoded image."""
+    return embed.encodeResult(_renderJob(job))
+
+class RenderServer(SocketServer.ThreadingMixIn,
+                   SocketServer.UnixStreamServer):
+    """Server accepting render jobs on a unix domain socket.
+
+    A thread handles each connection, running its jobs in turn on the
+    next free worker process."""
+
+    daemon_threads = True
+
+    def __init__(self, address, processes=None, timeout=None,
+                 memlimit=None, unsafe=False, plugins=None):
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.jobtimeout = timeout
+        self.workerargs = (unsafe, plugins, memlimit)
+
+        # start the workers
+        self.workers = Queue.Queue()
+        for i in xrange(processes):
+            self.workers.put( self.newWorker() )
+
+        # remove socket left by an old server
+        if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+            os.unlink(address)
+
+        # only this user may connect to the socket
+        oldmask = os.umask(0077)
+        try:
+            SocketServer.UnixStreamServer.__init__(
+                self, address, RenderRequestHandler)
+        finally:
+            os.umask(oldmask)
+
+    def newWorker(self):
+        """Start a new worker process."""
+        return batch_export.WorkerProcess(_workerJob, *self.workerargs)
+
+    def runJob(self, job):
+        """Run job on a free worker, returning the reply."""
+
+        timeout = job.get('timeout', self.jobtimeout)
+        worker = self.workers.get()
+        try:
+            reply = worker.run(job, timeout)
+            if reply is None:
+                # the worker is stuck or has died, so replace it and
+                # remove any files it did not get to
+                worker.stop()
+                _removeSharedArrays(job)
+                worker = self.newWorker()
+                reply = ('error', 'Job timed out or its worker failed')
+        finally:
+            self.workers.put(worker)
+        return reply
+
+    def server_close(self):
+        """Stop the workers and remove the socket."""
+        SocketServer.UnixStreamServer.server_close(self)
+        while not self.workers.empty():
+            self.workers.get().stop()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+class RenderRequestHandler(SocketServer.BaseRequestHandler):
+    """Handle the jobs sent over a connection."""
+
+    def handle(self):
+        while True:
+            job = readMessage(self.request)
+            if job is None:
+                break
+            writeMessage(self.request, self.server.runJob(job))
+
+def readMessage(sock):
+    """Read pickled message from socket, returning None at the end."""
+    lenlen = struct.calcsize('<I')
+    data = _readLen(sock, lenlen)
+    if data is None:
+        return None
+    data = _readLen(sock, struct.unpack('<I', data)[0])
+    if data is None:
+        return None
+    return cPickle.loads(data)
+
+def _readLen(sock, length):
+    """Read length bytes from socket, or None if it is closed."""
+    s = ''
+    while len(s) < length:
+        part = sock.recv(length-len(s))
+        if not part:
+            return None
+        s += part
+    return s
+
+def writeMessage(sock, obj):
+    """Write pickled message to socket."""
+    data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack('<I', len(data)) + data)
+
+def defaultSocket():
+    """Filename of the default socket."""
+    return os.path.join(os.path.expanduser('~'), socketname)
+
+def runserver(args):
+    """Run the render server from the command line."""
+
+    parser = optparse.OptionParser(
+        usage='%prog --render-server [options]')
+    parser.add_option('--socket', metavar='FILE',
+                      help='filename of socket to listen on (default '
+                      '~/%s)' % socketname)
+    parser.add_option('--processes', type='int', metavar='N',
+                      help='number of worker processes (default is '
+                      'number of CPUs)')
+    parser.add_option('--timeout', type='float', metavar='SECS',
+                      help='default time limit for each job')
+    parser.add_option('--memory-limit', type='float', metavar='MB',
+                      help='limit on memory used by each worker')
+    parser.add_option('--unsafe-mode', action='store_true',
+                      help='disable safety checks when running documents')
+    parser.add_option('--plugin', action='append', metavar='FILE',
+                      help='load the plugin from the file given')
+    options, args = parser.parse_args(args)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        parser.error('the render server needs unix domain sockets')
+
+    address = options.socket
+    if address is None:
+        address = defaultSocket()
+
+    server = RenderServer(address, processes=options.processes,
+                          timeout=options.timeout,
+                          memlimit=options.memory_limit,
+                          unsafe=options.unsafe_mode,
+                          plugins=options.plugin)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
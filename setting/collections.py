@@ -94,6 +94,11 @@ class XYPlotLine(Line):
         self.add( setting.Bool('bezierJoin', False,
                                descr=_('Connect points with a cubic Bezier curve'),
                                usertext=_('Bezier join')), 1 )
+        self.add( setting.Bool('decimate', False,
+                               descr=_('Only draw the first, last, minimum '
+                                       'and maximum points in each pixel '
+                                       'column, for large datasets'),
+                               usertext=_('Decimate')), 2 )
 
 class ErrorBarLine(Line):
     '''A line style for error bar plotting.'''
@@ -215,6 +215,19 @@ class Settings(object):
                          for name in self.setnames] )
         return text
 
+    def fingerprint(self):
+        """Return a hashable value representing the values of the
+        settings, which changes whenever any of the values change."""
+
+        out = []
+        for name in self.setnames:
+            setn = self.setdict[name]
+            if isinstance(setn, Settings):
+                out.append( (name, setn.fingerprint()) )
+            else:
+                out.append( (name, repr(setn.val)) )
+        return tuple(out)
+
     def readDefaults(self, root, widgetname):
         """Return default values from saved text.
 
@@ -21,7 +21,7 @@
 from version import version
 from textrender import Renderer, FontMetrics
 from safe_eval import checkCode
-from fitlm import fitLM
+from fitlm import fitLM, fitLMBatch
 
 from utilfuncs import *
 from points import *
@@ -35,8 +35,10 @@ from extbrushfilling import *
 try:
     from veusz.helpers.qtloops import addNumpyToPolygonF, plotPathsToPainter, \
         plotLinesToPainter, plotClippedPolyline, polygonClip, \
-        plotClippedPolygon, plotBoxesToPainter, addNumpyPolygonToPath
+        plotClippedPolygon, plotBoxesToPainter, addNumpyPolygonToPath, \
+        decimatePolyline
 except ImportError:
     from slowfuncs import addNumpyToPolygonF, plotPathsToPainter, \
         plotLinesToPainter, plotClippedPolyline, polygonClip, \
-        plotClippedPolygon, plotBoxesToPainter, addNumpyPolygonToPath
+        plotClippedPolygon, plotBoxesToPainter, addNumpyPolygonToPath, \
+        decimatePolyline
@@ -24,7 +24,7 @@ try:
     from veusz.helpers.qtloops import numpyToQImage, applyImageTransparancy
 except ImportError:
     slowfuncs = True
-    from slowfuncs import slowNumpyToQImage
+    from slowfuncs import slowColorsToQImage
 
 # Default colormaps used by widgets.
 # Each item in this dict is a colormap entry, with the key the name.
@@ -153,43 +153,152 @@ def applyScaling(data, mode, minval, maxval):
 
     return data
 
-def applyColorMap(cmap, scaling, datain, minval, maxval,
-                  trans, transimg=None):
-    """Apply a colour map to the 2d data given.
+class ColorMapLUT(object):
+    """A colormap interpolated into a lookup table of colors.
+
+    The colormap is interpolated once, so coloring data is just a
+    lookup into the table, rather than an interpolation between
+    the bands of the colormap for every value.
+    """
+
+    # number of entries in table
+    size = 1024
+
+    def __init__(self, cmap, trans=0, size=None):
+        """cmap is the color map (sequence of BGRalpha quads)
+        trans is the transparency to apply (from 0 to 100)
+        """
+
+        if size is not None:
+            self.size = size
+
+        cmap = N.array(cmap, dtype=N.float64)
+        if trans != 0:
+            cmap[:,3] *= (100-trans) / 100.
+
+        # interpolate each of the BGRA columns at the table positions
+        bandposn = N.linspace(0., 1., len(cmap))
+        posn = N.linspace(0., 1., self.size)
+        self.colors = N.column_stack(
+            [ N.interp(posn, bandposn, cmap[:,i]) for i in xrange(4) ]
+            ).astype(N.intc)
+
+        # non-finite values are looked up as the extra, transparent, entry
+        c = self.colors.astype(N.uint32)
+        self.rgba = N.zeros(self.size+1, dtype=N.uint32)
+        self.rgba[:-1] = ( (c[:,3] << 24) | (c[:,2] << 16) |
+                           (c[:,1] << 8) | c[:,0] )
+
+        self.hasalpha = bool( N.any(self.colors[:,3] != 255) )
+        self._inverted = None
+
+    def inverted(self):
+        """Return the lookup table for the inverted colormap."""
+        if self._inverted is None:
+            inv = ColorMapLUT.__new__(ColorMapLUT)
+            inv.size = self.size
+            inv.colors = self.colors[::-1].copy()
+            inv.rgba = N.concatenate( (self.rgba[-2::-1], self.rgba[-1:]) )
+            inv.hasalpha = self.hasalpha
+            inv._inverted = self
+            self._inverted = inv
+        return self._inverted
+
+    def indices(self, fracs):
+        """Convert fractions from 0 to 1 to indices into the table."""
+        fracs = N.asarray(fracs, dtype=N.float64)
+        finite = N.isfinite(fracs)
+        idx = N.clip(fracs, 0., 1.)*(self.size-1) + 0.5
+        return N.where(finite, idx, self.size).astype(N.intp)
+
+    def lookup(self, fracs):
+        """Return QRgb values (uint32) for the fractions from 0 to 1.
+        Non-finite values are transparent."""
+        return self.rgba.take( self.indices(fracs) )
+
+# number of values to color in each chunk when using threads
+colormapchunksize = 65536
+
+def applyColorMapLUT(lut, scaling, datain, minval, maxval,
+                     transimg=None, threads=1, forcetrans=False):
+    """Apply a colormap lookup table to the 2d data given.
 
-    cmap is the color map (numpy of BGRalpha quads)
+    lut is the ColorMapLUT to use
     scaling is scaling mode => 'linear', 'sqrt', 'log' or 'squared'
     data are the imaging data
     minval and maxval are the extremes of the data for the colormap
-    trans is a number from 0 to 100
     transimg is an optional image to apply transparency from
+    threads is the number of threads to scale and color the data in
+    forcetrans makes the image have an alpha channel, even if the
+      colormap is opaque (non-finite values are transparent)
     Returns a QImage
     """
 
-    cmap = N.array(cmap, dtype=N.intc)
-
     # invert colour map if min and max are swapped
     if minval > maxval:
         minval, maxval = maxval, minval
-        cmap = cmap[::-1]
+        lut = lut.inverted()
 
-    # apply transparency
-    if trans != 0:
-        cmap = cmap.copy()
-        cmap[:,3] = (cmap[:,3].astype(N.float32) * (100-trans) /
-                     100.).astype(N.intc)
+    datain = N.asarray(datain)
 
-    # apply scaling of data
-    fracs = applyScaling(datain, scaling, minval, maxval)
+    def convert(rows):
+        """Scale data for range of rows, looking up colors if needed."""
+        fracs = applyScaling(datain[rows], scaling, minval, maxval)
+        if slowfuncs:
+            return lut.lookup(fracs)
+        return fracs
+
+    # split into chunks of rows to do on separate threads
+    numrows = datain.shape[0]
+    numchunks = 1
+    if threads > 1 and datain.size > colormapchunksize:
+        numchunks = min(threads, numrows, datain.size // colormapchunksize)
+    if numchunks > 1:
+        from multiprocessing.pool import ThreadPool
+        edges = N.linspace(0, numrows, numchunks+1).astype(N.intp)
+        chunks = [ slice(a, b) for a, b in zip(edges[:-1], edges[1:]) ]
+        pool = ThreadPool(numchunks)
+        try:
+            out = N.concatenate( pool.map(convert, chunks) )
+        finally:
+            pool.close()
+    else:
+        out = convert(slice(None))
 
     if not slowfuncs:
-        img = numpyToQImage(fracs, cmap, transimg is not None)
+        # with a fine table, the interpolation in the helper is a lookup
+        img = numpyToQImage(out, lut.colors,
+                            forcetrans or transimg is not None)
         if transimg is not None:
             applyImageTransparancy(img, transimg)
     else:
-        img = slowNumpyToQImage(fracs, cmap, transimg)
+        forcetrans = forcetrans or N.any( (out >> 24) != 255 )
+        img = slowColorsToQImage(out, transimg, forcetrans)
     return img
 
+def applyColorMap(cmap, scaling, datain, minval, maxval,
+                  trans, transimg=None, threads=1, forcetrans=False):
+    """Apply a colour map to the 2d data given.
+
+    cmap is the color map (numpy of BGRalpha quads), or a ColorMapLUT
+      (e.g. from Document.getColormapLUT), which includes its
+      transparency, so that trans is ignored
+    scaling is scaling mode => 'linear', 'sqrt', 'log' or 'squared'
+    data are the imaging data
+    minval and maxval are the extremes of the data for the colormap
+    trans is a number from 0 to 100
+    transimg is an optional image to apply transparency from
+    threads is the number of threads to color the data in
+    forcetrans makes the image have an alpha channel
+    Returns a QImage
+    """
+
+    if not isinstance(cmap, ColorMapLUT):
+        cmap = ColorMapLUT(cmap, trans)
+    return applyColorMapLUT( cmap, scaling, datain, minval, maxval,
+                             transimg=transimg, threads=threads,
+                             forcetrans=forcetrans )
+
 def makeColorbarImage(minval, maxval, scaling, cmap, transparency,
                       direction='horz'):
     """Make a colorbar for the scaling given."""
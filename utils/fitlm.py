@@ -21,6 +21,7 @@ Numerical fitting of functions to data.
 """
 
 import sys
+from itertools import izip
 
 import numpy as N
 try:
@@ -28,9 +29,27 @@ try:
 except:
     import scipy.linalg as NLA
 
+def _numericDerivs(func, params, xvals, oldfunc, deltaderiv, pool):
+    """Evaluate func with each parameter changed by deltaderiv.
+    Returns array of (param, xvals) of changed function values.
+
+    If pool is set, the evaluations are spread over its threads."""
+
+    def evalchanged(i):
+        p = params.copy()
+        p[i] += deltaderiv
+        return func(p, xvals) + oldfunc*0.
+
+    if pool is None:
+        newfuncs = [evalchanged(i) for i in xrange(len(params))]
+    else:
+        newfuncs = pool.map(evalchanged, range(len(params)))
+    return N.array(newfuncs, dtype='float64')
+
 def fitLM(func, params, xvals, yvals, errors,
           stopdeltalambda = 1e-5,
-          deltaderiv = 1e-5, maxiters = 20, Lambda = 1e-4):
+          deltaderiv = 1e-5, maxiters = 20, Lambda = 1e-4,
+          gradfunc = None, threads = 1, callback = None):
 
     """
     Use Marquardt method as described in Bevington & Robinson to fit data
@@ -50,6 +69,13 @@ def fitLM(func, params, xvals, yvals, errors,
     deltaderiv: change to make in parameters to calculate derivative
     maxiters: maximum number of better fitting solutions before stopping
     Lambda: starting lambda value (as described in Bevington)
+    gradfunc: optional function taking the same parameters as func,
+              returning the derivatives of func with respect to each
+              parameter, as an array of shape (len(params), len(xvals)).
+              Numeric derivatives are calculated if not set.
+    threads: number of threads to calculate numeric derivatives with
+    callback: optional function called with (iteration, chi2, params)
+              for each improved solution
     """
 
     # only use finite values for fitting
@@ -67,84 +93,97 @@ def fitLM(func, params, xvals, yvals, errors,
     oldfunc = func(params, xvals)
     chi2 = ( (oldfunc - yvals)**2 * inve2 ).sum()
 
-    # initialise temporary space
-    beta = N.zeros( len(params), dtype='float64' )
-    alpha = N.zeros( (len(params), len(params)), dtype='float64' )
-    derivs = N.zeros( (len(params), len(xvals)), dtype='float64' )
+    pool = None
+    if gradfunc is None and threads > 1 and len(params) > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool( min(threads, len(params)) )
 
     done = False
     iters = 0
-    while iters < maxiters and not done:
-        # iterate over each of the parameters and calculate the derivatives
-        # of chi2 to populate the beta vector
-
-        # also calculate the derivative of the function at each of the points
-        # wrt the parameters
-
-        for i in range( len(params) ):
-            params[i] += deltaderiv
-            new_func = func(params, xvals)
-            chi2_new = ((new_func - yvals)**2 * inve2).sum()
-            params[i] -= deltaderiv
-
-            beta[i] = chi2_new - chi2
-            derivs[i] = new_func - oldfunc
-
-        # beta is now dchi2 / dparam
-        beta *= (-0.5 / deltaderiv)
-        derivs *= (1. / deltaderiv)
-
-        # calculate alpha matrix
-        # FIXME: stupid - must be a better way to avoid this iteration
-        for j in range( len(params) ):
-            for k in range(j+1):
-                v = (derivs[j]*derivs[k] * inve2).sum()
-                alpha[j][k] = v
-                alpha[k][j] = v
-
-        # twiddle alpha using lambda
-        alpha *= 1. + N.identity(len(params), dtype='float64')*Lambda
-
-        # now work out deltas on parameters to get better fit
-        epsilon = NLA.inv( alpha )
-        deltas = N.dot(beta, epsilon)
-
-        # new solution
-        new_params = params+deltas
-        new_func = func(new_params, xvals)
-        new_chi2 = ( (new_func - yvals)**2 * inve2 ).sum()
-
-        if N.isnan(new_chi2):
-            sys.stderr.write('Chi2 is NaN. Aborting fit.\n')
-            break
-
-        if new_chi2 > chi2:
-            # if solution is worse, increase lambda
-            Lambda *= 10.
-        else:
-            # better fit, so we accept this solution
-
-            # if the change is small
-            done = chi2 - new_chi2 < stopdeltalambda
-
-            chi2 = new_chi2
-            params = new_params
-            oldfunc = new_func
-            Lambda *= 0.1
-
-            # format new parameters
-            iters += 1
-            p = [iters, chi2] + params.tolist()
-            str = ("%5i " + "%8g " * (len(params)+1)) % tuple(p)
-            print str
+    try:
+        while iters < maxiters and not done:
+            # calculate the derivative of the function at each of the
+            # points wrt the parameters, and the derivatives of chi2 to
+            # populate the beta vector
+            if gradfunc is not None:
+                derivs = N.array( gradfunc(params, xvals), dtype='float64' )
+                if derivs.ndim == 0 or len(derivs) != len(params):
+                    # do not broadcast one derivative to every parameter
+                    raise ValueError('gradfunc should return a derivative'
+                                     ' for each parameter')
+                derivs = derivs + N.zeros( (len(params), len(xvals)) )
+                beta = N.dot( derivs, (yvals - oldfunc) * inve2 )
+            else:
+                newfuncs = _numericDerivs(func, params, xvals, oldfunc,
+                                          deltaderiv, pool)
+                chi2_new = ( (newfuncs - yvals)**2 * inve2 ).sum(axis=1)
+
+                # beta is dchi2 / dparam
+                beta = (chi2_new - chi2) * (-0.5 / deltaderiv)
+                derivs = (newfuncs - oldfunc) * (1. / deltaderiv)
+
+            # calculate alpha matrix
+            alpha = N.dot( derivs*inve2, derivs.T )
+
+            # twiddle alpha using lambda
+            alpha *= 1. + N.identity(len(params), dtype='float64')*Lambda
+
+            # now work out deltas on parameters to get better fit
+            epsilon = NLA.inv( alpha )
+            deltas = N.dot(beta, epsilon)
+
+            # new solution
+            new_params = params+deltas
+            new_func = func(new_params, xvals)
+            new_chi2 = ( (new_func - yvals)**2 * inve2 ).sum()
+
+            if N.isnan(new_chi2):
+                sys.stderr.write('Chi2 is NaN. Aborting fit.\n')
+                break
+
+            if new_chi2 > chi2:
+                # if solution is worse, increase lambda
+                Lambda *= 10.
+            else:
+                # better fit, so we accept this solution
+
+                # if the change is small
+                done = chi2 - new_chi2 < stopdeltalambda
+
+                chi2 = new_chi2
+                params = new_params
+                oldfunc = new_func
+                Lambda *= 0.1
+
+                iters += 1
+                if callback is not None:
+                    callback(iters, chi2, params)
+    finally:
+        if pool is not None:
+            pool.close()
 
     if not done:
         sys.stderr.write("Warning: maximum number of iterations reached\n")
 
-    # print out fit statistics at end
     dof = len(yvals) - len(params)
-    redchi2 = chi2 / dof
-    print "chi^2 = %g, dof = %i, reduced-chi^2 = %g" % (chi2, dof, redchi2)
-
     return (params, chi2, dof)
 
+def fitLMBatch(func, params, xvals, yvalslist, errorslist, **args):
+    """Fit func separately to each of the y values and errors given,
+    using fitLM, starting from the same params each time.
+
+    If a fit fails, its parameters and chi2 are NaN.
+    Other arguments are passed to fitLM.
+    Returns a list of (params, chi2, dof) for each fit.
+    """
+
+    results = []
+    for i, (yvals, errors) in enumerate(izip(yvalslist, errorslist)):
+        try:
+            res = fitLM(func, params.copy(), xvals, yvals, errors, **args)
+        except Exception, e:
+            sys.stderr.write('Fit %i failed: %s\n' % (i, e))
+            res = ( N.zeros(len(params)) + N.nan, N.nan,
+                    len(yvals) - len(params) )
+        results.append(res)
+    return results
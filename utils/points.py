@@ -409,7 +409,8 @@ def plotMarkers(painter, xpos, ypos, markername, markersize, scaling=None,
     markersize: size of marker to plot
     scaling: scale size of markers by array, or don't in None
     clip: rectangle if clipping wanted
-    cmap: colormap to use if colorvals is set
+    cmap: colormap to use if colorvals is set (or ColorMapLUT, which
+      includes its own transparency)
     colorvals: color values 0-1 of each point if used
     """
 
@@ -444,6 +445,49 @@ def plotMarkers(painter, xpos, ypos, markername, markersize, scaling=None,
 
     painter.restore()
 
+def plotMarkersDensity(painter, xpos, ypos, clip, cmap, trans=0):
+    """Plot the density of an array of points as an image, rather than
+    plotting individual markers.
+
+    painter: QPainter
+    xpos, ypos: numpy arrays of positions
+    clip: rectangle to plot density within
+    cmap: colormap to color number of points in each pixel
+      (or ColorMapLUT, which includes its own transparency)
+    trans: transparency of image (0-100)
+
+    Pixels containing no points are left transparent.
+    """
+
+    x1 = int(N.floor(clip.left()))
+    y1 = int(N.floor(clip.top()))
+    width = int(N.ceil(clip.right())) - x1
+    height = int(N.ceil(clip.bottom())) - y1
+    if width <= 0 or height <= 0:
+        return
+
+    # bin points into pixels within clipping rectangle
+    xi = N.floor(xpos - x1)
+    yi = N.floor(ypos - y1)
+    inside = (xi >= 0) & (xi < width) & (yi >= 0) & (yi < height)
+    index = (yi[inside]*width + xi[inside]).astype(N.intp)
+    if len(index) == 0:
+        return
+    counts = N.zeros(width*height)
+    binned = N.bincount(index)
+    counts[:len(binned)] = binned
+    counts = counts.reshape( (height, width) )
+
+    # empty pixels are made transparent
+    maxcount = counts.max()
+    counts[counts == 0] = N.nan
+
+    # the colormap puts the first row at the bottom of the image, so
+    # flip the rows, and keep the alpha channel for the empty pixels
+    img = colormap.applyColorMap(cmap, 'log', counts[::-1], 1., maxcount,
+                                 trans, forcetrans=True)
+    painter.drawImage( qt4.QRectF(x1, y1, width, height), img )
+
 def plotMarker(painter, xpos, ypos, markername, markersize):
     """Function to plot a marker on a painter, posn xpos, ypos, type and size
     """
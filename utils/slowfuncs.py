@@ -22,7 +22,6 @@ These are slow versions of routines also implemented in C++
 
 from itertools import izip, count
 import sys
-import struct
 
 import veusz.qtall as qt4
 import numpy as N
@@ -136,6 +135,30 @@ def plotClippedPolyline(painter, cliprect, pts, autoexpand=True):
         
     painter.drawPolyline(ptsout)
 
+def decimatePolyline(poly, x, y):
+    """Add points in x and y to poly, keeping only the first, last,
+    minimum and maximum y points in each pixel column."""
+
+    minlen = min(x.shape[0], y.shape[0])
+    x = x[:minlen]
+    y = y[:minlen]
+    if minlen == 0:
+        return
+
+    # label runs of points falling in the same pixel column
+    cols = N.floor(x)
+    runs = N.concatenate( ([0], N.cumsum(cols[1:] != cols[:-1])) )
+    starts = N.concatenate( ([0], N.nonzero(runs[1:] != runs[:-1])[0]+1) )
+    ends = N.concatenate( (starts[1:], [minlen]) ) - 1
+
+    # sorting by run then y gives the extreme points as the first and
+    # last entries of each run
+    order = N.lexsort( (y, runs) )
+    keep = N.unique( N.concatenate(
+            (starts, order[starts], order[ends], ends)) )
+
+    addNumpyToPolygonF(poly, x[keep], y[keep])
+
 def polygonClip(inpoly, rect, outpoly):
     """Clip a polygon to the rectangle given, writing to outpoly
     
@@ -176,56 +199,31 @@ def plotBoxesToPainter(painter, x1, y1, x2, y2, clip=None, autoexpand=True):
     if rects:
         painter.drawRects(rects)
 
-def slowNumpyToQImage(img, cmap, transparencyimg):
-    """Slow version of routine to convert numpy array to QImage
-    This is hard work in Python, but it was like this originally.
+def slowColorsToQImage(colors, transparencyimg, forcetrans):
+    """Slow version of routine to convert numpy array of colors to QImage
 
-    img: numpy array to convert to QImage
-    cmap: 2D array of colors (BGRA rows)
+    colors: 2D numpy array of QRgb values (uint32), as produced by
+      ColorMapLUT.lookup
+    transparencyimg: optional array to scale the alpha of each pixel by
     forcetrans: force image to have alpha component."""
 
-    if struct.pack("h", 1) == "\000\001":
-        # have to swap colors for big endian architectures
-        cmap2 = cmap.copy()
-        cmap2[:,0] = cmap[:,3]
-        cmap2[:,1] = cmap[:,2]
-        cmap2[:,2] = cmap[:,1]
-        cmap2[:,3] = cmap[:,0]
-        cmap = cmap2
-
-    fracs = N.clip(N.ravel(img), 0., 1.)
-
-    # Work out which is the minimum colour map. Assumes we have <255 bands.
-    numbands = cmap.shape[0]-1
-    bands = (fracs*numbands).astype(N.uint8)
-    bands = N.clip(bands, 0, numbands-1)
-
-    # work out fractional difference of data from band to next band
-    deltafracs = (fracs - bands * (1./numbands)) * numbands
-
-    # need to make a 2-dimensional array to multiply against triplets
-    deltafracs.shape = (deltafracs.shape[0], 1)
-
-    # calculate BGRalpha quadruplets
-    # this is a linear interpolation between the band and the next band
-    quads = (deltafracs*cmap[bands+1] +
-             (1.-deltafracs)*cmap[bands]).astype(N.uint8)
+    colors = N.array(colors, dtype=N.uint32)
 
     # apply transparency if a transparency image is set
-    if transparencyimg is not None and transparencyimg.shape == img.shape:
-        quads[:,3] = ( N.clip(N.ravel(transparencyimg), 0., 1.) *
-                       quads[:,3] ).astype(N.uint8)
-
-    # convert 32bit quads to a Qt QImage
-    s = quads.tostring()
+    if transparencyimg is not None and transparencyimg.shape == colors.shape:
+        alpha = ( N.clip(transparencyimg, 0., 1.) *
+                  (colors >> 24) ).astype(N.uint32)
+        colors = (colors & 0xffffff) | (alpha << 24)
 
     fmt = qt4.QImage.Format_RGB32
-    if N.any(cmap[:,3] != 255) or transparencyimg is not None:
+    if forcetrans or transparencyimg is not None:
         # any transparency
         fmt = qt4.QImage.Format_ARGB32
 
-    img = qt4.QImage(s, img.shape[1], img.shape[0], fmt)
-    img = img.mirrored()
+    # direction of images is different for qt and numpy image, so
+    # flip rows before converting 32bit values to a Qt QImage
+    s = N.ascontiguousarray(colors[::-1]).tostring()
+    img = qt4.QImage(s, colors.shape[1], colors.shape[0], fmt)
 
     # hack to ensure string isn't freed before QImage
     img.veusz_string = s
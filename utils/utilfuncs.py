@@ -352,11 +352,15 @@ class UnicodeCSVReader:
     """
     A CSV reader which will iterate over lines in the CSV file "f",
     which is encoded in the given encoding.
+    filename can also be an already opened (binary) file object.
     """
 
     def __init__(self, filename, dialect=csv.excel, encoding='utf-8', **kwds):
 
-        if filename != '{clipboard}':
+        if not isinstance(filename, basestring):
+            # recode the already opened file
+            f = UTF8Recoder(filename, encoding)
+        elif filename != '{clipboard}':
             # recode the opened file as utf-8
             f = UTF8Recoder(open(filename), encoding)
         else:
@@ -220,6 +220,16 @@ def run():
         runremote()
         return
 
+    # batch export starts worker processes with their own applications
+    if len(sys.argv) > 1 and sys.argv[1] == '--export-batch':
+        from veusz.batch_export import runbatch
+        sys.exit( runbatch(sys.argv[2:]) )
+
+    # as does the render server
+    if len(sys.argv) > 1 and sys.argv[1] == '--render-server':
+        from veusz.render_server import runserver
+        sys.exit( runserver(sys.argv[2:]) )
+
     # this function is spaghetti-like and has nasty code paths.
     # the idea is to postpone the imports until the splash screen
     # is shown
@@ -247,6 +257,14 @@ def run():
     parser.add_option('--export', action='append', metavar='FILE',
                       help='export the next document to this'
                       ' output image file, exiting when finished')
+    parser.add_option('--export-batch', action='store_true',
+                      help='export the documents listed in a JSON manifest'
+                      ' using several processes (must be the first option;'
+                      ' see --export-batch --help)')
+    parser.add_option('--render-server', action='store_true',
+                      help='render documents for clients on a local socket'
+                      ' (must be the first option; see --render-server'
+                      ' --help)')
     parser.add_option('--embed-remote', action='store_true',
                       help=optparse.SUPPRESS_HELP)
     parser.add_option('--plugin', action='append', metavar='FILE',
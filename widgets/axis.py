@@ -468,6 +468,22 @@ class Axis(widget.Widget):
             self._computePlottedRange()
         return (self.plottedrange[0], self.plottedrange[1])
 
+    def getAxisFingerprint(self):
+        """Return a value which changes if the coordinate conversion
+        of the axis changes (used by widgets plotting on the axis)."""
+        return (self.settings.fingerprint(), self.getPlottedRange())
+
+    def getLayerFingerprint(self, parentposn, painthelper, outerbounds):
+        """Axes depend on their range, and plotters if using labels."""
+
+        fp = ( self.baseLayerFingerprint(parentposn, painthelper,
+                                         outerbounds),
+               self.getPlottedRange() )
+        if self.settings.mode == 'labels':
+            plotters = painthelper.axisplottermap.get(self, [])
+            fp += tuple([p.settings.fingerprint() for p in plotters])
+        return fp
+
     def _updateAxisLocation(self, bounds, otherposition=None):
         """Calculate coordinates on plotter of axis."""
 
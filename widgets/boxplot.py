@@ -18,7 +18,6 @@
 
 """For making box plots."""
 
-import math
 from itertools import izip
 import numpy as N
 
@@ -34,20 +33,6 @@ def _(text, disambiguation=None, context='BoxPlot'):
     return unicode( 
         qt4.QCoreApplication.translate(context, text, disambiguation))
 
-def percentile(sortedds, perc):
-    """Given a sorted dataset, get the percentile perc.
-
-    Interpolates between data points."""
-
-    index = perc * 0.01 * (sortedds.shape[0]-1)
-
-    # interpolate between indices
-    frac, index = math.modf(index)
-    index = int(index)
-    indexplus1 = min(index+1, sortedds.shape[0]-1)
-    interpol = (1-frac)*sortedds[index] + frac*sortedds[indexplus1]
-    return interpol
-
 def swapline(painter, x1, y1, x2, y2, swap):
     """Draw line, swapping x and y coordinates if swap is True."""
     if swap:
@@ -65,45 +50,46 @@ def swapbox(painter, x1, y1, x2, y2, swap):
 class _Stats(object):
     """Store statistics about box."""
 
-    def calculate(self, data, whiskermode):
-        """Calculate statistics for data."""
-        cleaned = data[ N.isfinite(data) ]
-        cleaned.sort()
+    def calculate(self, dsstats, whiskermode):
+        """Calculate statistics from dsstats, the DatasetStats of
+        the data."""
 
-        if len(cleaned) == 0:
+        if dsstats.numFinite() == 0:
             self.median = self.botquart = self.topquart = self.mean = \
                 self.botwhisker = self.topwhisker = N.nan
             return
 
-        self.median = percentile(cleaned, 50)
-        self.botquart = percentile(cleaned, 25)
-        self.topquart = percentile(cleaned, 75)
-        self.mean = N.mean(cleaned)
+        self.median = dsstats.percentile(50)
+        self.botquart = dsstats.percentile(25)
+        self.topquart = dsstats.percentile(75)
+        self.mean = dsstats.mean()
         
         if whiskermode == 'min/max':
-            self.botwhisker = cleaned.min()
-            self.topwhisker = cleaned.max()
+            self.botwhisker, self.topwhisker = dsstats.dataRange()
         elif whiskermode == '1.5IQR':
             iqr = self.topquart - self.botquart
-            eltop = N.searchsorted(cleaned, self.topquart+1.5*iqr)-1
-            self.topwhisker = cleaned[eltop]
-            elbot = max(N.searchsorted(cleaned, self.botquart-1.5*iqr)-1, 0)
-            self.botwhisker = cleaned[elbot]
+            minval, maxval = dsstats.dataRange()
+            self.topwhisker = dsstats.lastBelow(self.topquart+1.5*iqr)
+            if self.topwhisker is None:
+                self.topwhisker = maxval
+            self.botwhisker = dsstats.lastBelow(self.botquart-1.5*iqr)
+            if self.botwhisker is None:
+                self.botwhisker = minval
         elif whiskermode == '1 stddev':
-            stddev = N.std(cleaned)
+            stddev = dsstats.std()
             self.topwhisker = self.mean+stddev
             self.botwhisker = self.mean-stddev
         elif whiskermode == '9/91 percentile':
-            self.topwhisker = percentile(cleaned, 91)
-            self.botwhisker = percentile(cleaned, 9)
+            self.topwhisker = dsstats.percentile(91)
+            self.botwhisker = dsstats.percentile(9)
         elif whiskermode == '2/98 percentile':
-            self.topwhisker = percentile(cleaned, 98)
-            self.botwhisker = percentile(cleaned, 2)
+            self.topwhisker = dsstats.percentile(98)
+            self.botwhisker = dsstats.percentile(2)
         else:
             raise RuntimeError, "Invalid whisker mode"
 
-        self.outliers = cleaned[ (cleaned < self.botwhisker) |
-                                 (cleaned > self.topwhisker) ]
+        self.outliers = dsstats.valuesOutside(self.botwhisker,
+                                              self.topwhisker)
 
 class BoxPlot(GenericPlotter):
     """Plot bar charts."""
@@ -290,8 +276,10 @@ class BoxPlot(GenericPlotter):
                 values = s.get('values').getData(doc)
                 if values:
                     for v in values:
-                        axrange[0] = min(axrange[0], N.nanmin(v.data))
-                        axrange[1] = max(axrange[1], N.nanmax(v.data))
+                        drange = v.stats().dataRange()
+                        if drange is not None:
+                            axrange[0] = min(axrange[0], drange[0])
+                            axrange[1] = max(axrange[1], drange[1])
             else:
                 # update from manual entries
                 drange = self.rangeManual()
@@ -451,7 +439,7 @@ class BoxPlot(GenericPlotter):
             # calculated boxes
             for vals, plotpos in izip(values, plotposns):
                 stats = _Stats()
-                stats.calculate(vals.data, s.whiskermode)
+                stats.calculate(vals.stats(), s.whiskermode)
                 self.plotBox(painter, axes, plotpos, widgetposn, width,
                              clip, stats)
         else:
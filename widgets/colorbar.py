@@ -109,6 +109,14 @@ class ColorBar(axis.Axis):
         # override axis naming of x and y
         return widget.Widget.chooseName(self)
 
+    def getLayerFingerprint(self, parentposn, painthelper, outerbounds):
+        """Colorbars depend on the widget they show the scale of."""
+
+        imgwidget = self.settings.get('widgetName').findWidget()
+        return ( widget.Widget.baseLayerFingerprint(
+                self, parentposn, painthelper, outerbounds),
+                 imgwidget and imgwidget.settings.fingerprint() )
+
     def draw(self, parentposn, phelper, outerbounds = None):
         '''Update the margins before drawing.'''
 
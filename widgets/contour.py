@@ -244,12 +244,9 @@ class Contour(plotters.GenericPlotter):
         minval, maxval = 0., 1.
         if s.data in d.data:
             # scan data
-            data = d.data[s.data].data
-            minval, maxval = N.nanmin(data), N.nanmax(data)
-            if not N.isfinite(minval):
-                minval = 0.
-            if not N.isfinite(maxval):
-                maxval = 1.
+            drange = d.data[s.data].stats().dataRange()
+            if drange is not None:
+                minval, maxval = drange
 
         # override if not auto
         if s.min != 'Auto':
@@ -29,7 +29,7 @@ import veusz.setting as setting
 import veusz.utils as utils
 import veusz.qtall as qt4
 
-from function import FunctionPlotter
+from function import FunctionPlotter, FunctionChecker
 import widget
 
 try:
@@ -120,6 +120,9 @@ class Fit(FunctionPlotter):
         if type(self) == Fit:
             self.readDefaults()
 
+        # for checking the derivatives expression
+        self.derivchecker = FunctionChecker()
+
         self.addAction( widget.Action('fit', self.actionFit,
                                       descr = _('Fit function'),
                                       usertext = _('Fit function')) )
@@ -145,29 +148,37 @@ class Fit(FunctionPlotter):
                                       'the function variable'),
                             usertext=_('Fit only range')),
                4 )
+        s.add( setting.Str('derivatives', '',
+                           descr = _('Optional expression giving a list of '
+                                     'the derivatives of the function with '
+                                     'respect to each parameter, in '
+                                     'alphabetical order of parameter '
+                                     '(e.g. [1, x] for a + b*x)'),
+                           usertext=_('Derivatives')),
+               5 )
         s.add( setting.WidgetChoice(
                 'outLabel', '',
                 descr=_('Write best fit parameters to this text label '
                         'after fitting'),
                 widgettypes=('label',),
                 usertext=_('Output label')),
-               5 )
+               6 )
         s.add( setting.Str('outExpr', '',
                            descr = _('Output best fitting expression'),
                            usertext=_('Output expression')),
-               6, readonly=True )
+               7, readonly=True )
         s.add( setting.Float('chi2', -1,
                              descr = 'Output chi^2 from fitting',
                              usertext=_('Fit &chi;<sup>2</sup>')),
-               7, readonly=True )
+               8, readonly=True )
         s.add( setting.Int('dof', -1,
                            descr = _('Output degrees of freedom from fitting'),
                            usertext=_('Fit d.o.f.')),
-               8, readonly=True )
+               9, readonly=True )
         s.add( setting.Float('redchi2', -1,
                              descr = _('Output reduced-chi-squared from fitting'),
                              usertext=_('Fit reduced &chi;<sup>2</sup>')),
-               9, readonly=True )
+               10, readonly=True )
 
         f = s.get('function')
         f.newDefault('a + b*x')
@@ -233,6 +244,16 @@ class Fit(FunctionPlotter):
             self.logEvalError(e)
             return
 
+        # use derivatives given by user, if any
+        gradfunc = None
+        if s.derivatives.strip():
+            try:
+                self.derivchecker.check(s.derivatives, s.variable)
+            except RuntimeError, e:
+                self.logEvalError(e)
+                return
+            gradfunc = self.evalderivs
+
         # populate the input parameters
         names = s.values.keys()
         names.sort()
@@ -315,9 +336,18 @@ class Fit(FunctionPlotter):
             vals, chi2, dof = minuitFit(self.evalfunc, params, names, s.values, xvals, yvals, yserr)
         else:
             print _('Minuit not available, falling back to simple L-M fitting:')
-            retn, chi2, dof = utils.fitLM(self.evalfunc, params,
-                                          xvals,
-                                          yvals, yserr)
+
+            def printiter(iters, chi2, params):
+                p = [iters, chi2] + params.tolist()
+                print ("%5i " + "%8g " * (len(params)+1)) % tuple(p)
+
+            retn, chi2, dof = utils.fitLM(
+                self.evalfunc, params, xvals, yvals, yserr,
+                gradfunc=gradfunc,
+                threads=setting.settingdb['plot_numthreads'],
+                callback=printiter)
+            print "chi^2 = %g, dof = %i, reduced-chi^2 = %g" % (
+                chi2, dof, chi2/dof)
             vals = {}
             for i, v in zip(names, retn):
                 vals[i] = float(v)
@@ -366,6 +396,33 @@ class Fit(FunctionPlotter):
         except:
             return N.nan
 
+    def evalderivs(self, params, xvals):
+        """Evaluate derivatives of function with respect to params."""
+
+        env = self.initEnviron()
+        s = self.settings
+        env[s.variable] = xvals
+
+        names = s.values.keys()
+        names.sort()
+        for name, val in zip(names, params):
+            env[name] = val
+
+        failed = N.zeros( (len(params), len(xvals)) ) + N.nan
+        try:
+            derivs = eval(self.derivchecker.compiled, env)
+            derivs = [N.zeros(xvals.shape) + d for d in derivs]
+        except:
+            return failed
+
+        # the NaN values stop the fit
+        if len(derivs) != len(params):
+            self.logEvalError(
+                _('%i derivatives given for %i parameters') %
+                (len(derivs), len(params)) )
+            return failed
+        return derivs
+
     def generateOutputExpr(self, vals):
         """Try to generate text form of output expression.
         
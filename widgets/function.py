@@ -50,7 +50,9 @@ class FunctionChecker(object):
         """
         fn = fn.strip()
         if self.cachedfunc != fn or self.cachedvar != var:
-            checked = utils.checkCode(fn)
+            # compiled code is shared between widgets
+            comp = document.exprcache.compile(fn, securityonly=False)
+            checked = comp.checked
             if checked is not None:
                 try:
                     msg = checked[0][0]
@@ -61,11 +63,9 @@ class FunctionChecker(object):
             self.cachedfunc = fn
             self.cachedvar = var
 
-            try:
-                # compile code
-                self.compiled = compile(fn, '<string>', 'eval')
-            except Exception, e:
-                raise RuntimeError(e)
+            if comp.code is None:
+                raise RuntimeError(comp.error)
+            self.compiled = comp.code
 
 class FunctionPlotter(GenericPlotter):
     """Function plotting class."""
@@ -73,6 +73,15 @@ class FunctionPlotter(GenericPlotter):
     typename='function'
     allowusercreation=True
     description=_('Plot a function')
+
+    # in adaptive mode, intervals are split where the curve is further
+    # than this from a straight line (in plotter coordinates)
+    adaptivetol = 0.5
+    # do not split intervals smaller than this along the axis
+    adaptivemindelta = 0.05
+    # maximum number of times to split intervals and points to plot
+    adaptivedepth = 12
+    adaptivemaxpoints = 100000
     
     def __init__(self, parent, name=None):
         """Initialise plotter."""
@@ -83,6 +92,7 @@ class FunctionPlotter(GenericPlotter):
             self.readDefaults()
 
         self.checker = FunctionChecker()
+        self.pointscache = None
 
     @classmethod
     def addSettings(klass, s):
@@ -102,6 +112,11 @@ class FunctionPlotter(GenericPlotter):
         s.add( setting.Str('function', 'x',
                            descr=_('Function expression'),
                            usertext=_('Function')), 0 )
+        s.add( setting.Bool('adaptive', False,
+                            descr=_('Add steps where the function is not '
+                                    'a straight line between steps'),
+                            usertext=_('Adaptive steps'),
+                            formatting=True), 3 )
 
         s.add(setting.FloatOrAuto('min', 'Auto',
                                   descr=_('Minimum value at which to plot function'),
@@ -376,14 +391,82 @@ class FunctionPlotter(GenericPlotter):
 
         return results, resultpts
 
+    def refinePoints(self, axes, posn, ipts, pipts, dpts, pdpts):
+        """Add points between the independent and dependent points given
+        (and their plotter coordinates) where the plotted function is
+        not close to a straight line. The new points are evaluated in a
+        batch for each level of splitting.
+        """
+
+        s = self.settings
+        axis1 = axes[0] if s.variable == 'x' else axes[1]
+
+        # intervals to check, given by the indices of their first points
+        check = N.arange(len(pipts)-1)
+        for depth in xrange(self.adaptivedepth):
+            check = check[ N.abs(pipts[check+1]-pipts[check]) >
+                           self.adaptivemindelta ]
+            if len(check) == 0 or len(pipts) >= self.adaptivemaxpoints:
+                break
+
+            # evaluate function at middle of intervals
+            midp = 0.5*(pipts[check] + pipts[check+1])
+            midi = axis1.plotterToDataCoords(posn, midp)
+            midd, midpd = self.calcDependentPoints(midi, axes, posn)
+            if midd is None:
+                break
+
+            # split where middle is away from line, or where the function
+            # becomes undefined within the interval
+            pd1, pd2 = pdpts[check], pdpts[check+1]
+            finm = N.isfinite(midpd)
+            split = N.nonzero( (N.abs(midpd - 0.5*(pd1+pd2)) >
+                                self.adaptivetol) |
+                               (N.isfinite(pd1) != finm) |
+                               (N.isfinite(pd2) != finm) )[0]
+            if len(split) == 0:
+                break
+
+            ins = check[split]+1
+            ipts = N.insert(ipts, ins, midi[split])
+            pipts = N.insert(pipts, ins, midp[split])
+            dpts = N.insert(dpts, ins, midd[split])
+            pdpts = N.insert(pdpts, ins, midpd[split])
+
+            # check both halves of the split intervals next time
+            newmid = ins + N.arange(len(ins))
+            check = N.sort( N.concatenate((newmid-1, newmid)) )
+
+        return ipts, pipts, dpts, pdpts
+
     def calcFunctionPoints(self, axes, posn):
+        """Return ((xpts, ypts), (plotter xpts, plotter ypts)) for the
+        function.
+
+        The points are kept until the function, axes, plot position
+        or document data change.
+        """
+
+        s = self.settings
+        d = self.document
+        key = ( tuple(posn), s.fingerprint(),
+                tuple([a and a.getAxisFingerprint() for a in axes]),
+                d.datachangeset, d.customchangeset )
+        if self.pointscache is not None and self.pointscache[0] == key:
+            return self.pointscache[1]
+
         ipts, pipts = self.getIndependentPoints(axes, posn)
         dpts, pdpts = self.calcDependentPoints(ipts, axes, posn)
-        
-        if self.settings.variable == 'x':
-            return (ipts, dpts), (pipts, pdpts)
+        if s.adaptive and dpts is not None and len(pipts) > 1:
+            ipts, pipts, dpts, pdpts = self.refinePoints(
+                axes, posn, ipts, pipts, dpts, pdpts)
+
+        if s.variable == 'x':
+            retn = (ipts, dpts), (pipts, pdpts)
         else:
-            return (dpts, ipts), (pdpts, pipts)
+            retn = (dpts, ipts), (pdpts, pipts)
+        self.pointscache = (key, retn)
+        return retn
 
     def _pickable(self, posn):
         s = self.settings
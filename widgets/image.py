@@ -18,6 +18,8 @@
 
 """Image plotting from 2d datasets."""
 
+import math
+
 import veusz.qtall as qt4
 import numpy as N
 
@@ -32,6 +34,53 @@ def _(text, disambiguation=None, context='Image'):
     return unicode( 
         qt4.QCoreApplication.translate(context, text, disambiguation))
 
+def reduceImage(data, reduction, stripsize=512):
+    """Halve the resolution of the 2D array data, by taking the mean or
+    max (given by reduction) of each 2x2 block of pixels, ignoring
+    non-finite values. Odd sizes are padded with NaN.
+
+    The array is reduced in strips of rows, so that large memory-mapped
+    arrays are not read into memory at once.
+    """
+
+    ny, nx = data.shape
+    out = N.empty( ((ny+1)//2, (nx+1)//2) )
+    for row in xrange(0, ny, stripsize):
+        strip = N.array(data[row:row+stripsize], dtype=N.float64)
+        h, w = strip.shape
+        if h % 2 or w % 2:
+            padded = N.empty( (h + h%2, w + w%2) ) + N.nan
+            padded[:h, :w] = strip
+            strip = padded
+
+        blocks = strip.reshape(strip.shape[0]//2, 2, strip.shape[1]//2, 2)
+        if reduction == 'max':
+            reduced = N.fmax( N.fmax(blocks[:,0,:,0], blocks[:,0,:,1]),
+                              N.fmax(blocks[:,1,:,0], blocks[:,1,:,1]) )
+        else:
+            finite = N.isfinite(blocks)
+            total = N.where(finite, blocks, 0.).sum(axis=3).sum(axis=1)
+            num = finite.sum(axis=3).sum(axis=1)
+            reduced = total / N.where(num == 0, N.nan, num)
+
+        out[row//2:row//2+reduced.shape[0]] = reduced
+    return out
+
+class ImagePyramid(object):
+    """Versions of a 2D array at successively halved resolutions.
+    Level 0 is the array itself. Levels are computed when first used."""
+
+    def __init__(self, data, reduction):
+        self.reduction = reduction
+        self.levels = [data]
+
+    def level(self, num):
+        """Get array for level num."""
+        while len(self.levels) <= num:
+            self.levels.append( reduceImage(self.levels[-1],
+                                            self.reduction) )
+        return self.levels[num]
+
 class Image(plotters.GenericPlotter):
     """A class which plots an image on a graph with a specified
     coordinate system."""
@@ -49,6 +98,12 @@ class Image(plotters.GenericPlotter):
         self.lastdataset = None
         self.schangeset = -1
 
+        # ImagePyramids of data and transparency data, with keys
+        # saying which data they were made from
+        self.pyramids = {}
+        # last colored part of image, with key
+        self.imagecache = None
+
         # this is the range of data plotted, computed when plot is changed
         # the ColorBar object needs this later
         self.cacheddatarange = (0, 1)
@@ -111,6 +166,12 @@ class Image(plotters.GenericPlotter):
                              descr = _('Smooth image to display resolution'),
                              usertext = _('Smooth'),
                              formatting = True ) )
+        s.add( setting.Choice( 'reduction', ['mean', 'max'], 'mean',
+                               descr = _('How to combine data pixels if '
+                                         'the image is displayed at a '
+                                         'lower resolution than the data'),
+                               usertext = _('Reduction'),
+                               formatting = True ) )
 
     def _getUserDescription(self):
         """User friendly description."""
@@ -123,32 +184,87 @@ class Image(plotters.GenericPlotter):
     userdescription = property(_getUserDescription)
 
     def updateImage(self):
-        """Update the image with new contents."""
+        """Update the range of data and colormap for the image.
+        The image itself is colored when drawn."""
 
         s = self.settings
         d = self.document
         data = d.data[s.data]
 
-        transimg = None
-        if s.transparencyData in d.data:
-            transimg = d.data[s.transparencyData].data
+        # range of data is cached by dataset
+        drange = data.stats().dataRange()
+        if drange is None:
+            drange = (N.nan, N.nan)
 
         minval = s.min
         if minval == 'Auto':
-            minval = N.nanmin(data.data)
+            minval = drange[0]
         maxval = s.max
         if maxval == 'Auto':
-            maxval = N.nanmax(data.data)
+            maxval = drange[1]
 
         # this is used currently by colorbar objects
         self.cacheddatarange = (minval, maxval)
 
-        # get color map
-        cmap = self.document.getColormap(s.colorMap, s.colorInvert)
+        # get lookup table for color map
+        self.lastcolormap = self.document.getColormapLUT(
+            s.colorMap, s.colorInvert, s.transparency)
 
-        self.image = utils.applyColorMap(
-            cmap, s.colorScaling, data.data, minval, maxval,
-            s.transparency, transimg=transimg)
+    def getPyramid(self, name, data, reduction):
+        """Get ImagePyramid of 2D dataset data, reusing the existing one
+        named name if the values of data have not changed."""
+
+        key = (data.statschangeset, reduction)
+        array = data.data
+        cached = self.pyramids.get(name)
+        if cached is None or cached[0] is not array or cached[1] != key:
+            cached = self.pyramids[name] = ( array, key,
+                                             ImagePyramid(array, reduction) )
+        return cached[2]
+
+    def makeImage(self, data, level, region):
+        """Color the part of the image at level of the pyramid in region
+        (x1, y1, x2, y2), in pixels of that level.
+
+        The colored image is reused if nothing has changed since the
+        last call."""
+
+        s = self.settings
+        d = self.document
+
+        pyramid = self.getPyramid('data', data, s.reduction)
+        pyramids = [pyramid]
+        transpyramid = None
+        if s.transparencyData in d.data:
+            transdata = d.data[s.transparencyData]
+            if transdata.dimensions == 2:
+                transpyramid = self.getPyramid('trans', transdata, 'mean')
+                pyramids.append(transpyramid)
+
+        # the lookup table is replaced if the colormap is redefined
+        key = ( tuple([id(p) for p in pyramids]), level, tuple(region),
+                self.cacheddatarange, s.colorScaling,
+                id(self.lastcolormap) )
+        if self.imagecache is not None and self.imagecache[0] == key:
+            return self.imagecache[1]
+
+        x1, y1, x2, y2 = region
+        values = N.array( pyramid.level(level)[y1:y2, x1:x2],
+                          dtype=N.float64 )
+        transimg = None
+        if transpyramid is not None:
+            transimg = N.array( transpyramid.level(level)[y1:y2, x1:x2],
+                                dtype=N.float64 )
+
+        minval, maxval = self.cacheddatarange
+        image = utils.applyColorMapLUT(
+            self.lastcolormap, s.colorScaling, values, minval, maxval,
+            transimg=transimg, threads=setting.settingdb['plot_numthreads'])
+
+        # keep pyramids and lookup table referenced so their ids are
+        # not reused
+        self.imagecache = (key, image, pyramids, self.lastcolormap)
+        return image
 
     def providesAxesDependency(self):
         """Range information provided by widget."""
@@ -180,53 +296,6 @@ class Image(plotters.GenericPlotter):
             axrange[0] = min( axrange[0], dyrange[0] )
             axrange[1] = max( axrange[1], dyrange[1] )
 
-    def cutImageToFit(self, pltx, plty, posn):
-        x1, y1, x2, y2 = posn
-        pltx1, pltx2 = pltx
-        pltw = pltx2-pltx1
-        plty2, plty1 = plty
-        plth = plty2-plty1
-
-        imw = self.image.width()
-        imh = self.image.height()
-        pixw = pltw / float(imw)
-        pixh = plth / float(imh)
-        cutr = [0, 0, imw-1, imh-1]
-
-        # work out where image intercepts posn, and make sure image
-        # fills at least that area
-
-        # need to chop left
-        if pltx1 < x1:
-            d = int((x1-pltx1) / pixw)
-            cutr[0] += d
-            pltx[0] += d*pixw
-
-        # need to chop right
-        if pltx2 > x2:
-            d = max(0, int((pltx2-x2) / pixw) - 1)
-            cutr[2] -= d
-            pltx[1] -= d*pixw
-
-        # chop top
-        if plty1 < y1:
-            d = int((y1-plty1) / pixh)
-            cutr[1] += d
-            plty[1] += d*pixh
-            
-        # chop bottom
-        if plty2 > y2:
-            d = max(0, int((plty2-y2) / pixh) - 1)
-            cutr[3] -= d
-            plty[0] -= d*pixh
-
-        # create chopped-down image
-        newimage = self.image.copy(cutr[0], cutr[1],
-                                   cutr[2]-cutr[0]+1, cutr[3]-cutr[1]+1)
-
-        # return new image coordinates and image
-        return pltx, plty, newimage
-
     def makeColorbarImage(self, direction='horz'):
         """Make a QImage colorbar for the current plot.
 
@@ -246,7 +315,8 @@ class Image(plotters.GenericPlotter):
         s = self.settings
 
         # get colormap
-        cmap = self.document.getColormap(s.colorMap, s.colorInvert)
+        cmap = self.document.getColormapLUT(
+            s.colorMap, s.colorInvert, s.transparency)
 
         return utils.makeColorbarImage(
             minval, maxval, s.colorScaling, cmap, s.transparency,
@@ -277,6 +347,54 @@ class Image(plotters.GenericPlotter):
         else:
             return None
     
+    def visibleRegion(self, shape, coordsx, coordsy, posn):
+        """Work out which part of an image of shape (ny, nx) with plotter
+        coordinates coordsx and coordsy is within posn, and which
+        level of the image pyramid to use.
+
+        Returns None if nothing visible, or (coordsx, coordsy, level,
+        region), where coordsx and coordsy are the plotter coordinates
+        of the part, and region is (x1, y1, x2, y2) in pixels of that
+        level.
+        """
+
+        ny, nx = shape
+        if nx == 0 or ny == 0:
+            return None
+
+        # size of data pixels in plotter coordinates
+        pixw = (coordsx[1]-coordsx[0]) / float(nx)
+        pixh = (coordsy[1]-coordsy[0]) / float(ny)
+        if pixw == 0 or pixh == 0 or not N.isfinite([pixw, pixh]).all():
+            return None
+
+        def pixrange(c1, c2, start, pix, num):
+            t1, t2 = (c1-start) / pix, (c2-start) / pix
+            return ( int(max(0, math.floor(min(t1, t2)))),
+                     int(min(num, math.ceil(max(t1, t2)))) )
+
+        ix1, ix2 = pixrange(posn[0], posn[2], coordsx[0], pixw, nx)
+        iy1, iy2 = pixrange(posn[1], posn[3], coordsy[0], pixh, ny)
+        if ix2 <= ix1 or iy2 <= iy1:
+            return None
+
+        # use level where pixels are about the size of plotter pixels
+        perpix = 1. / max(abs(pixw), abs(pixh))
+        level = 0
+        if perpix >= 2:
+            level = int(math.log(perpix, 2))
+        # the highest level is a single pixel
+        level = min( level, int(math.ceil(math.log(max(nx, ny), 2))) )
+        scale = 2**level
+
+        region = ( ix1 // scale, iy1 // scale,
+                   -(-ix2 // scale), -(-iy2 // scale) )
+        coordsx = [ coordsx[0] + region[0]*scale*pixw,
+                    coordsx[0] + region[2]*scale*pixw ]
+        coordsy = [ coordsy[0] + region[1]*scale*pixh,
+                    coordsy[0] + region[3]*scale*pixh ]
+        return coordsx, coordsy, level, region
+
     def draw(self, parentposn, phelper, outerbounds = None):
         """Draw the image."""
 
@@ -306,15 +424,14 @@ class Image(plotters.GenericPlotter):
         coordsx = axes[0].dataToPlotterCoords(posn, N.array(rangex))
         coordsy = axes[1].dataToPlotterCoords(posn, N.array(rangey))
 
-        # truncate image down if necessary
+        # work out the visible part of the image and the level of the
+        # pyramid matching the displayed resolution
         # This assumes linear pixels!
-        if ( coordsx[0] < x1 or coordsx[1] > x2 or
-             coordsy[0] < y1 or coordsy[1] > y2 ):
-
-            coordsx, coordsy, image = self.cutImageToFit(coordsx, coordsy,
-                                                         posn)
-        else:
-            image = self.image
+        visible = self.visibleRegion(data.data.shape, coordsx, coordsy, posn)
+        if visible is None:
+            return
+        coordsx, coordsy, level, region = visible
+        image = self.makeImage(data, level, region)
 
         # clip data within bounds of plotter
         clip = self.clipAxesBounds(axes, posn)
@@ -112,22 +112,28 @@ class NonOrthPoint(Widget):
 
         d1 = self.settings.get('data1').getData(self.document)
         if d1:
-            inrange[0] = min( N.nanmin(d1.data), inrange[0] )
-            inrange[1] = max( N.nanmax(d1.data), inrange[1] )
+            drange = d1.stats().dataRange()
+            if drange is not None:
+                inrange[0] = min( drange[0], inrange[0] )
+                inrange[1] = max( drange[1], inrange[1] )
         d2 = self.settings.get('data2').getData(self.document)
         if d2:
-            inrange[2] = min( N.nanmin(d2.data), inrange[2] )
-            inrange[3] = max( N.nanmax(d2.data), inrange[3] )
+            drange = d2.stats().dataRange()
+            if drange is not None:
+                inrange[2] = min( drange[0], inrange[2] )
+                inrange[3] = max( drange[1], inrange[3] )
+
+    def _pickable(self, bounds):
+        return pickable.cachedPickable(
+            self, bounds, lambda: pickable.DiscretePickable(
+                self, 'data1', 'data2',
+                lambda v1, v2: self.parent.graphToPlotCoords(v1, v2)) )
 
     def pickPoint(self, x0, y0, bounds, distance = 'radial'):
-        p = pickable.DiscretePickable(self, 'data1', 'data2',
-                lambda v1, v2: self.parent.graphToPlotCoords(v1, v2))
-        return p.pickPoint(x0, y0, bounds, distance)
+        return self._pickable(bounds).pickPoint(x0, y0, bounds, distance)
 
     def pickIndex(self, oldindex, direction, bounds):
-        p = pickable.DiscretePickable(self, 'data1', 'data2',
-                lambda v1, v2: self.parent.graphToPlotCoords(v1, v2))
-        return p.pickIndex(oldindex, direction, bounds)
+        return self._pickable(bounds).pickIndex(oldindex, direction, bounds)
 
     def plotMarkers(self, painter, plta, pltb, scaling, markersize, clip):
         '''Draw markers in widget.'''
@@ -176,6 +182,9 @@ class NonOrthPoint(Widget):
         posn = Widget.draw(self, parentposn, phelper,
                            outerbounds=outerbounds)
 
+        # screen positions of points may change
+        pickable.clearPickableCache(self)
+
         s = self.settings
         d = self.document
 
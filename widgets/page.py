@@ -47,6 +47,10 @@ class _AxisDependHelper(object):
     versa, in terms of ranges of the axes.
 
     It then works out the ranges for each of the axes from the plotters.
+
+    The dependency graph is solved once into a list of actions, which
+    can be repeated each time the page is drawn while the widgets are
+    unchanged.
     """
 
     def __init__(self, root):
@@ -54,6 +58,7 @@ class _AxisDependHelper(object):
         self.nodes = {}
         self.axes = []
         self.axis_plotter_map = {}
+        self.actions = []
 
     def recursivePlotterSearch(self, widget):
         """Find a list of plotters below widget.
@@ -103,48 +108,94 @@ class _AxisDependHelper(object):
                 self.recursivePlotterSearch(c)
 
     def findPlotters(self):
-        """Construct a list of plotters associated with each axis.
-        Returns nodes:
+        """Construct a list of plotters associated with each axis,
+        then work out the order to evaluate the dependencies in."""
+
+        self.recursivePlotterSearch(self.root)
+        self.solveDepends()
 
-        {axisobject: [plotterobject, plotter2...]),
-         ...}
+    def addActions(self, widget, depends):
+        """Add actions for the dependencies of widget.
+
+        If a dependency is a plotter, it updates the range of the axis
+        widget. If it is an axis, its range is set, as it no longer
+        has any dependencies.
         """
+        for dwidget, dwidget_dep in depends:
+            if hasattr(dwidget, 'isplotter'):
+                self.actions.append( (widget, dwidget, dwidget_dep) )
+            elif hasattr(dwidget, 'isaxis'):
+                self.actions.append( (dwidget, None, None) )
 
-        self.recursivePlotterSearch(self.root)
-        self.ranges = dict( [(a, list(defaultrange)) for a in self.axes] )
+    def solveDepends(self):
+        """Work out the order of actions to evaluate the dependencies in.
 
-    def processDepends(self, widget, depends):
-        """Go through dependencies of widget.
-        If the dependency has no dependency itself, then update the
-        axis with the widget or vice versa
+        Nodes are evaluated once the nodes they depend on have been
+        evaluated. Nodes for unknown axes are never evaluated.
         """
-        modified = False
-        i = 0
-        while i < len(depends):
-            dep = depends[i]
-            if dep not in self.nodes:
-                dwidget, dwidget_dep = dep
-                if hasattr(dwidget, 'isplotter'):
-                    # update range of axis with (dwidget, dwidget_dep)
-                    # do not do this if the widget is hidden
-                    if ( not dwidget.settings.isSetting('hide') or
-                         not dwidget.settings.hide ):
-                        dwidget.updateAxisRange(widget, dwidget_dep,
-                                                self.ranges[widget])
-                elif hasattr(dwidget, 'isaxis'):
-                    # set actual range on axis, as axis no longer has a
-                    # dependency
-                    if dwidget in self.ranges:
-                        axrange = self.ranges[dwidget]
-                        if axrange == defaultrange:
-                            axrange = None
-                        dwidget.setAutoRange(axrange)
-                        del self.ranges[dwidget]
-                del depends[i]
-                modified = True
+
+        nodes = self.nodes
+
+        # number of dependencies of each node which are nodes
+        # themselves, and the nodes depending on each node
+        waiting = {}
+        dependents = {}
+        for node, depends in nodes.iteritems():
+            waiting[node] = 0
+            for dep in depends:
+                if dep in nodes:
+                    waiting[node] += 1
+                    dependents.setdefault(dep, []).append(node)
+
+        worklist = [n for n, num in waiting.iteritems() if num == 0]
+        while worklist:
+            node = worklist.pop()
+            if node[0] is None:
                 continue
-            i += 1
-        return modified
+            del waiting[node]
+            self.addActions(node[0], nodes[node])
+            for dependent in dependents.get(node, []):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    worklist.append(dependent)
+
+        if waiting:
+            # use what we can from the nodes left over
+            for node in waiting:
+                if node[0] is not None:
+                    self.addActions(
+                        node[0], [d for d in nodes[node] if d not in waiting])
+            self.reportCycles(waiting, dependents)
+
+    def reportCycles(self, waiting, dependents):
+        """Log the widgets in any dependency cycles, given the nodes
+        which could not be evaluated."""
+
+        # remove the nodes which only wait on unknown axes (or their
+        # dependents), then those on which no remaining nodes depend
+        left = set(waiting)
+        blocked = [n for n in left if n[0] is None]
+        while blocked:
+            node = blocked.pop()
+            left.discard(node)
+            for dependent in dependents.get(node, []):
+                if ( dependent in left and
+                     not [d for d in self.nodes[dependent] if d in left] ):
+                    blocked.append(dependent)
+
+        changed = True
+        while changed:
+            changed = False
+            for node in list(left):
+                if not [d for d in dependents.get(node, []) if d in left]:
+                    left.remove(node)
+                    changed = True
+
+        if left:
+            paths = sorted( set([n[0].path for n in left]) )
+            self.root.document.log(
+                _('Circular dependency in axis ranges between %s') %
+                ', '.join(paths) )
 
     def findAxisRanges(self):
         """Find the ranges from the plotters and set the axis ranges.
@@ -152,29 +203,24 @@ class _AxisDependHelper(object):
         Follows the dependencies calculated above.
         """
 
-        # probaby horribly inefficient
-        nodes = self.nodes
-        while nodes:
-            # iterate over dependencies for each widget
-            inloop = True
-
-            for (widget, widget_depname), depends in nodes.iteritems():
-                # go through dependencies of widget
-                if widget and self.processDepends(widget, depends):
-                    # if modified, we keep looping
-                    inloop = False
-
-                # delete dependencies for widget if none remaining
-                if not depends:
-                    del nodes[(widget, widget_depname)]
-                    break
-
-            # prevent infinite loops, break out if we do nothing in an
-            # iteration
-            if inloop:
-                break
-
-        for axis, axrange in self.ranges.iteritems():
+        ranges = dict( [(a, list(defaultrange)) for a in self.axes] )
+
+        for axis, plotter, depname in self.actions:
+            if plotter is not None:
+                # update range of axis with (plotter, depname)
+                # do not do this if the widget is hidden
+                if ( not plotter.settings.isSetting('hide') or
+                     not plotter.settings.hide ):
+                    plotter.updateAxisRange(axis, depname, ranges[axis])
+            elif axis in ranges:
+                # set actual range on axis, as axis no longer has a
+                # dependency
+                axrange = ranges.pop(axis)
+                if axrange == defaultrange:
+                    axrange = None
+                axis.setAutoRange(axrange)
+
+        for axis, axrange in ranges.iteritems():
             if axrange == defaultrange:
                 axrange = None
             axis.setAutoRange(axrange)
@@ -190,6 +236,7 @@ class Page(widget.Widget):
     def __init__(self, parent, name=None):
         """Initialise object."""
         widget.Widget.__init__(self, parent, name=name)
+        self._axisdependcache = None
         if type(self) == Page:
             self.readDefaults()
  
@@ -218,8 +265,7 @@ class Page(widget.Widget):
         x1, y1, x2, y2 = parentposn
 
         # find ranges of axes
-        axisdependhelper = _AxisDependHelper(self)
-        axisdependhelper.findPlotters()
+        axisdependhelper = self.getAxisDependHelper()
         axisdependhelper.findAxisRanges()
 
         # store axis->plotter mappings in painter too (is this nasty?)
@@ -250,6 +296,17 @@ class Page(widget.Widget):
 
         return bounds
 
+    def getAxisDependHelper(self):
+        """Return _AxisDependHelper for page, which is kept until the
+        document is modified."""
+        changeset = self.document.changeset
+        cache = self._axisdependcache
+        if cache is None or cache[0] != changeset:
+            helper = _AxisDependHelper(self)
+            helper.findPlotters()
+            cache = self._axisdependcache = (changeset, helper)
+        return cache[1]
+
     def updateControlItem(self, cgi):
         """Call helper to set page size."""
         cgi.setPageSize()
@@ -85,15 +85,180 @@ def _chooseOrderingSign(m, c, p):
     else:
         assert m is not None or p is not None
 
+def _pickDistance(xscreen, yscreen, x0, y0, distance_direction):
+    """Distance of screen points from (x0, y0) in the direction given."""
+    if distance_direction == 'vertical':
+        # measure distance along y
+        return N.abs(yscreen - y0)
+    elif distance_direction == 'horizontal':
+        # measure distance along x
+        return N.abs(xscreen - x0)
+    elif distance_direction == 'radial':
+        # measure radial distance
+        return N.sqrt((xscreen - x0)**2 + (yscreen - y0)**2)
+    else:
+        # programming error
+        assert (distance_direction == 'radial' or
+                distance_direction == 'vertical' or
+                distance_direction == 'horizontal')
+
+class PointIndex(object):
+    """A grid of buckets holding the indices of screen points, used to
+       find the closest point to a position without looking at every
+       point."""
+
+    # average number of points in each bucket
+    bucketpoints = 8
+    # maximum number of buckets along each axis
+    maxbuckets = 1024
+
+    def __init__(self, xscreen, yscreen):
+        self.xscreen = xscreen
+        self.yscreen = yscreen
+
+        valid = N.nonzero( N.isfinite(xscreen) & N.isfinite(yscreen) )[0]
+        self.empty = len(valid) == 0
+        if self.empty:
+            return
+        vx, vy = xscreen[valid], yscreen[valid]
+
+        num = int( N.sqrt(len(valid) / self.bucketpoints) ) + 1
+        self.num = min(num, self.maxbuckets)
+        self.minx, self.miny = vx.min(), vy.min()
+        self.cellw = max(vx.max() - self.minx, 1e-6) / self.num
+        self.cellh = max(vy.max() - self.miny, 1e-6) / self.num
+
+        # sort the points by bucket, keeping them in order in each
+        # bucket, and find where each bucket starts
+        cells = self._cellX(vx) + self._cellY(vy)*self.num
+        order = N.argsort(cells, kind='mergesort')
+        self.points = valid[order]
+        self.starts = N.searchsorted(cells[order],
+                                     N.arange(self.num*self.num+1))
+
+    def _cellX(self, x):
+        return N.clip( (x - self.minx) / self.cellw,
+                       0, self.num-1 ).astype(N.intc)
+
+    def _cellY(self, y):
+        return N.clip( (y - self.miny) / self.cellh,
+                       0, self.num-1 ).astype(N.intc)
+
+    def _ringCells(self, cx, cy, k, distance_direction):
+        """Return bucket x and y indices k buckets away from (cx, cy)."""
+        if distance_direction == 'horizontal':
+            # whole columns at either side
+            xs = N.unique([cx-k, cx+k])
+            ys = N.arange(self.num)
+            return N.repeat(xs, len(ys)), N.tile(ys, len(xs))
+        elif distance_direction == 'vertical':
+            # whole rows above and below
+            xs = N.arange(self.num)
+            ys = N.unique([cy-k, cy+k])
+            return N.tile(xs, len(ys)), N.repeat(ys, len(xs))
+        elif k == 0:
+            return N.array([cx]), N.array([cy])
+        else:
+            # edges of the square around the bucket
+            side = N.arange(-k, k+1)
+            inner = N.arange(-k+1, k)
+            n1, n2 = len(side), len(inner)
+            xs = N.concatenate( (cx+side, cx+side,
+                                 N.repeat(cx-k, n2), N.repeat(cx+k, n2)) )
+            ys = N.concatenate( (N.repeat(cy-k, n1), N.repeat(cy+k, n1),
+                                 cy+inner, cy+inner) )
+            return xs, ys
+
+    def nearest(self, x0, y0, bounds, distance_direction):
+        """Find closest point to (x0, y0) inside bounds.
+
+        Returns (index, distance) or None if there are no points
+        inside bounds. If points are equally distant, the one with the
+        lowest index is returned.
+        """
+
+        if self.empty:
+            return None
+
+        # limit search to the buckets overlapping the bounds
+        bx1, bx2 = self._cellX(N.array([bounds[0], bounds[2]]))
+        by1, by2 = self._cellY(N.array([bounds[1], bounds[3]]))
+        cx = min(max(self._cellX(N.array([x0]))[0], bx1), bx2)
+        cy = min(max(self._cellY(N.array([y0]))[0], by1), by2)
+
+        if distance_direction == 'horizontal':
+            maxk, cellsize = max(cx-bx1, bx2-cx), self.cellw
+        elif distance_direction == 'vertical':
+            maxk, cellsize = max(cy-by1, by2-cy), self.cellh
+        else:
+            maxk = max(cx-bx1, bx2-cx, cy-by1, by2-cy)
+            cellsize = min(self.cellw, self.cellh)
+
+        bestdist, besti = N.inf, None
+        for k in xrange(maxk+1):
+            # points in further buckets are at least this far away
+            if besti is not None and bestdist < (k-1)*cellsize:
+                break
+
+            xs, ys = self._ringCells(cx, cy, k, distance_direction)
+            sel = (xs >= bx1) & (xs <= bx2) & (ys >= by1) & (ys <= by2)
+            cells = xs[sel] + ys[sel]*self.num
+            starts, ends = self.starts[cells], self.starts[cells+1]
+            nonempty = N.nonzero(ends > starts)[0]
+            if len(nonempty) == 0:
+                continue
+            idxs = N.concatenate( [self.points[starts[i]:ends[i]]
+                                   for i in nonempty] )
+
+            # ignore points which are offscreen
+            xscreen, yscreen = self.xscreen[idxs], self.yscreen[idxs]
+            inbounds = ( (xscreen >= bounds[0]) & (xscreen <= bounds[2]) &
+                         (yscreen >= bounds[1]) & (yscreen <= bounds[3]) )
+            if not inbounds.any():
+                continue
+            idxs = idxs[inbounds]
+            dist = _pickDistance(xscreen[inbounds], yscreen[inbounds],
+                                 x0, y0, distance_direction)
+
+            m = dist.min()
+            i = idxs[dist == m].min()
+            if m < bestdist or (m == bestdist and i < besti):
+                bestdist, besti = m, i
+
+        if besti is None:
+            return None
+        return besti, bestdist
+
+def cachedPickable(widget, bounds, makefn):
+    """Return a pickable for widget, calling makefn() to make it.
+
+    The pickable (and its point index) is reused while the bounds are
+    the same, until clearPickableCache is called when the widget is
+    drawn again.
+    """
+    bounds = tuple(bounds)
+    cache = getattr(widget, '_pickablecache', None)
+    if cache is None or cache[0] != bounds:
+        cache = widget._pickablecache = (bounds, makefn())
+    return cache[1]
+
+def clearPickableCache(widget):
+    """Forget the pickable kept by cachedPickable for widget."""
+    widget._pickablecache = None
+
 class GenericPickable:
     """Utility class which abstracts the math of picking the closest point out
        of a list of points"""
 
+    # use a PointIndex to pick from at least this many points
+    indexminpoints = 4096
+
     def __init__(self, widget, labels, vals, screenvals):
         self.widget = widget
         self.labels = labels
         self.xvals, self.yvals = vals
         self.xscreen, self.yscreen = screenvals
+        self.pointindex = None
 
     def _pickSign(self, i):
         if len(self.xscreen) <= 1:
@@ -125,31 +290,32 @@ class GenericPickable:
         if len(self.xscreen) == 0 or len(self.yscreen) == 0:
             return info
 
-        # calculate distances
-        if distance_direction == 'vertical':
-            # measure distance along y
-            dist = N.abs(self.yscreen - y0)
-        elif distance_direction == 'horizontal':
-            # measure distance along x
-            dist = N.abs(self.xscreen - x0)
-        elif distance_direction == 'radial':
-            # measure radial distance
-            dist = N.sqrt((self.xscreen - x0)**2 + (self.yscreen - y0)**2)
+        if len(self.xscreen) >= self.indexminpoints:
+            # look up in the index, built when first needed
+            if self.pointindex is None:
+                self.pointindex = PointIndex(self.xscreen, self.yscreen)
+            found = self.pointindex.nearest(x0, y0, bounds,
+                                            distance_direction)
+            if found is None:
+                return info
+            i, m = found
+
         else:
-            # programming error
-            assert (distance_direction == 'radial' or
-                    distance_direction == 'vertical' or
-                    distance_direction == 'horizontal')
-
-        # ignore points which are offscreen
-        outofbounds = ( (self.xscreen < bounds[0]) | (self.xscreen > bounds[2]) |
-                        (self.yscreen < bounds[1]) | (self.yscreen > bounds[3]) )
-        dist[outofbounds] = float('inf')
-
-        m = N.min(dist)
-        # if there are multiple equidistant points, arbitrarily take
-        # the first one
-        i = N.nonzero(dist == m)[0][0]
+            # calculate distances
+            dist = _pickDistance(self.xscreen, self.yscreen, x0, y0,
+                                 distance_direction)
+
+            # ignore points which are offscreen
+            outofbounds = ( (self.xscreen < bounds[0]) |
+                            (self.xscreen > bounds[2]) |
+                            (self.yscreen < bounds[1]) |
+                            (self.yscreen > bounds[3]) )
+            dist[outofbounds] = float('inf')
+
+            m = N.min(dist)
+            # if there are multiple equidistant points, arbitrarily take
+            # the first one
+            i = N.nonzero(dist == m)[0][0]
 
         info.screenpos = self.xscreen[i], self.yscreen[i]
         info.coords = self.xvals[i], self.yvals[i]
@@ -94,6 +94,14 @@ class GenericPlotter(widget.Widget):
         """Update range variable for axis with dependency name given."""
         pass
 
+    def getLayerFingerprint(self, parentposn, painthelper, outerbounds):
+        """Plotters depend on their settings, data and axes."""
+        s = self.settings
+        axes = self.parent.getAxes( (s.xAxis, s.yAxis) )
+        return ( self.baseLayerFingerprint(parentposn, painthelper,
+                                           outerbounds),
+                 tuple([a and a.getAxisFingerprint() for a in axes]) )
+
     def getNumberKeys(self):
         """Return number of key entries."""
         if self.settings.key:
@@ -175,6 +183,15 @@ class FreePlotter(widget.Widget):
                             descr = _('Name of Y-axis to use'),
                             usertext=_('Y axis')) )
 
+    def getLayerFingerprint(self, parentposn, painthelper, outerbounds):
+        """Free plotters depend on their axes if positioned using them."""
+        s = self.settings
+        fp = self.baseLayerFingerprint(parentposn, painthelper, outerbounds)
+        if s.positioning == 'axes' and hasattr(self.parent, 'getAxes'):
+            axes = self.parent.getAxes( (s.xAxis, s.yAxis) )
+            fp = ( fp, tuple([a and a.getAxisFingerprint() for a in axes]) )
+        return fp
+
     def _getPlotterCoords(self, posn, xsetting='xPos', ysetting='yPos'):
         """Calculate coordinates from relative or axis positioning.
 
@@ -304,6 +304,22 @@ class PointPlotter(GenericPlotter):
                                    ' for each datapoint by this factor'),
                            usertext=_('Thin markers'),
                            formatting=True), 0 )
+        s.add( setting.Choice('densityMode',
+                              ('never', 'interactive', 'always'),
+                              'never',
+                              descr=_('When to plot an image of the density '
+                                      'of points instead of markers, if '
+                                      'there are more points than the '
+                                      'density threshold'),
+                              usertext=_('Density mode'),
+                              formatting=True), 1 )
+        s.add( setting.Float('densityThreshold', 1.,
+                             minval=0.,
+                             descr=_('Plot density of points instead of '
+                                     'markers if there are more than this '
+                                     'number of points per pixel'),
+                             usertext=_('Density threshold'),
+                             formatting=True), 2 )
         s.add( setting.DistancePt('markerSize',
                                   '3pt',
                                   descr = _('Size of marker to plot'),
@@ -456,7 +472,10 @@ class PointPlotter(GenericPlotter):
 
         # simple continuous line
         if steps == 'off':
-            utils.addNumpyToPolygonF(pts, xvals, yvals)
+            if s.PlotLine.decimate:
+                utils.decimatePolyline(pts, xvals, yvals)
+            else:
+                utils.addNumpyToPolygonF(pts, xvals, yvals)
 
         # stepped line, with points on left
         elif steps[:4] == 'left':
@@ -707,7 +726,7 @@ class PointPlotter(GenericPlotter):
 
         return axes
 
-    def _pickable(self, bounds):
+    def _makePickable(self, bounds):
         axes = self._fetchAxes()
 
         if axes is None:
@@ -718,6 +737,10 @@ class PointPlotter(GenericPlotter):
 
         return pickable.DiscretePickable(self, 'xData', 'yData', map_fn)
 
+    def _pickable(self, bounds):
+        return pickable.cachedPickable(
+            self, bounds, lambda: self._makePickable(bounds))
+
     def pickPoint(self, x0, y0, bounds, distance = 'radial'):
         return self._pickable(bounds).pickPoint(x0, y0, bounds, distance)
 
@@ -729,13 +752,24 @@ class PointPlotter(GenericPlotter):
 
         s = self.settings
         c = s.Color
-        cmap = self.document.getColormap(
+        cmap = self.document.getColormapLUT(
             s.MarkerFill.colorMap, s.MarkerFill.colorMapInvert)
 
         return utils.makeColorbarImage(
             c.min, c.max, c.scaling, cmap, 0,
             direction=direction)
 
+    def _useDensityPlot(self, phelper, cliprect, numpts):
+        """Should the density of points be plotted instead of markers?"""
+
+        s = self.settings
+        if ( s.marker == 'none' or s.densityMode == 'never' or
+             (s.densityMode == 'interactive' and not phelper.interactive) ):
+            return False
+
+        area = cliprect.width() * cliprect.height()
+        return area > 0 and numpts > s.densityThreshold*area
+
     def draw(self, parentposn, phelper, outerbounds=None):
         """Plot the data on a plotter."""
 
@@ -743,6 +777,9 @@ class PointPlotter(GenericPlotter):
                                    outerbounds=outerbounds)
         x1, y1, x2, y2 = posn
 
+        # screen positions of points may change
+        pickable.clearPickableCache(self)
+
         s = self.settings
 
         # exit if hidden
@@ -824,50 +861,62 @@ class PointPlotter(GenericPlotter):
             markersize = s.get('markerSize').convert(painter)
             if not s.MarkerLine.hide or not s.MarkerFill.hide:
 
-                #print "Painting marker fill"
-                if not s.MarkerFill.hide:
-                    # filling for markers
-                    painter.setBrush( s.MarkerFill.makeQBrush() )
-                else:
-                    # no-filling brush
-                    painter.setBrush( qt4.QBrush() )
-
-                #print "Painting marker lines"
-                if not s.MarkerLine.hide:
-                    # edges of markers
-                    painter.setPen( s.MarkerLine.makeQPen(painter) )
-                else:
-                    # invisible pen
-                    painter.setPen( qt4.QPen(qt4.Qt.NoPen) )
-
-                # thin datapoints as required
-                if s.thinfactor <= 1:
-                    xplt, yplt = xplotter, yplotter
+                if self._useDensityPlot(phelper, cliprect, len(xplotter)):
+                    cmap = self.document.getColormapLUT(
+                        s.MarkerFill.colorMap, s.MarkerFill.colorMapInvert,
+                        s.MarkerFill.transparency)
+                    utils.plotMarkersDensity(painter, xplotter, yplotter,
+                                             cliprect, cmap)
                 else:
-                    xplt, yplt = (xplotter[::s.thinfactor],
-                                  yplotter[::s.thinfactor])
-
-                # whether to scale markers
-                scaling = colorvals = cmap = None
-                if ptvals:
-                    scaling = ptvals.data
-                    if s.thinfactor > 1:
-                        scaling = scaling[::s.thinfactor]
-
-                # color point individually
-                if cvals:
-                    colorvals = utils.applyScaling(
-                        cvals.data, s.Color.scaling,
-                        s.Color.min, s.Color.max)
-                    if s.thinfactor > 1:
-                        colorvals = colorvals[::s.thinfactor]
-                    cmap = self.document.getColormap(
-                        s.MarkerFill.colorMap, s.MarkerFill.colorMapInvert)
-
-                # actually plot datapoints
-                utils.plotMarkers(painter, xplt, yplt, s.marker, markersize,
-                                  scaling=scaling, clip=cliprect,
-                                  cmap=cmap, colorvals=colorvals)
+                    #print "Painting marker fill"
+                    if not s.MarkerFill.hide:
+                        # filling for markers
+                        painter.setBrush( s.MarkerFill.makeQBrush() )
+                    else:
+                        # no-filling brush
+                        painter.setBrush( qt4.QBrush() )
+
+                    #print "Painting marker lines"
+                    if not s.MarkerLine.hide:
+                        # edges of markers
+                        painter.setPen( s.MarkerLine.makeQPen(painter) )
+                    else:
+                        # invisible pen
+                        painter.setPen( qt4.QPen(qt4.Qt.NoPen) )
+
+                    # thin datapoints as required
+                    if s.thinfactor <= 1:
+                        xplt, yplt = xplotter, yplotter
+                    else:
+                        xplt, yplt = (xplotter[::s.thinfactor],
+                                      yplotter[::s.thinfactor])
+
+                    # whether to scale markers
+                    scaling = colorvals = cmap = None
+                    if ptvals:
+                        scaling = ptvals.data
+                        if s.thinfactor > 1:
+                            scaling = scaling[::s.thinfactor]
+
+                    # color point individually
+                    if cvals:
+                        colorvals = utils.applyScaling(
+                            cvals.data, s.Color.scaling,
+                            s.Color.min, s.Color.max)
+                        if s.thinfactor > 1:
+                            colorvals = colorvals[::s.thinfactor]
+                        # transparency matches that of the brush
+                        trans = 0
+                        if not s.MarkerFill.hide:
+                            trans = s.MarkerFill.transparency
+                        cmap = self.document.getColormapLUT(
+                            s.MarkerFill.colorMap, s.MarkerFill.colorMapInvert,
+                            trans)
+
+                    # actually plot datapoints
+                    utils.plotMarkers(painter, xplt, yplt, s.marker, markersize,
+                                      scaling=scaling, clip=cliprect,
+                                      cmap=cmap, colorvals=colorvals)
 
             # finally plot any labels
             if tvals and not s.Label.hide:
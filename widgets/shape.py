@@ -313,6 +313,16 @@ class ImageFile(BoxShape):
         self.document.applyOperation(
             document.OperationMultiple(ops, descr=_('embed image')) )
 
+    def getLayerFingerprint(self, parentposn, painthelper, outerbounds):
+        """Image files also depend on the file on disk."""
+        fp = BoxShape.getLayerFingerprint(self, parentposn, painthelper,
+                                          outerbounds)
+        try:
+            st = os.stat(self.settings.filename)
+        except EnvironmentError:
+            return fp
+        return (fp, st.st_size, st.st_mtime)
+
     def updateCachedImage(self):
         """Update cache."""
         s = self.settings
@@ -309,11 +309,34 @@ class Widget(object):
 
             # iterate over children in reverse order
             for c in reversed(self.children):
-                c.draw(bounds, painthelper, outerbounds=outerbounds)
+                painthelper.drawWidget(c, bounds, outerbounds=outerbounds)
  
         # return our final bounds
         return bounds
 
+    def getLayerFingerprint(self, parentposn, painthelper, outerbounds):
+        """Return a hashable value which changes when the output of
+        drawing the widget changes, or None if the drawn layer of the
+        widget should not be reused between paints.
+
+        This is None by default. Widgets which can be cached should
+        extend baseLayerFingerprint with anything else (e.g. other
+        widgets) their drawing depends on.
+        """
+        return None
+
+    def baseLayerFingerprint(self, parentposn, painthelper, outerbounds):
+        """Fingerprint covering the position of the widget, the page
+        scaling, the settings of the widget and the document data."""
+
+        doc = self.document
+        if outerbounds is not None:
+            outerbounds = tuple(outerbounds)
+        return ( tuple(parentposn), outerbounds, tuple(self.position),
+                 painthelper.pagesize, painthelper.dpi, painthelper.scaling,
+                 doc.datachangeset, doc.customchangeset,
+                 self.settings.fingerprint() )
+
     def getSaveText(self, saveall = False):
         """Return text to restore object
 
@@ -269,7 +269,8 @@ class MainWindow(qt4.QMainWindow):
         else:
             # get list of vsz files dropped
             urls = [unicode(u.path()) for u in mime.urls()]
-            urls = [u for u in urls if os.path.splitext(u)[1] == '.vsz']
+            exts = ('.vsz', '.' + document.archive_extension)
+            urls = [u for u in urls if os.path.splitext(u)[1] in exts]
             return urls
 
     def setupDefaultDoc(self):
@@ -879,8 +880,12 @@ class MainWindow(qt4.QMainWindow):
             # show busy cursor
             qt4.QApplication.setOverrideCursor( qt4.QCursor(qt4.Qt.WaitCursor) )
             try:
-                ofile = open(self.filename, 'w')
-                self.document.saveToFile(ofile)
+                ext = os.path.splitext(self.filename)[1]
+                if ext == '.' + document.archive_extension:
+                    self.document.saveToArchive(self.filename)
+                else:
+                    ofile = open(self.filename, 'w')
+                    self.document.saveToFile(ofile)
                 self.updateStatusbar(_("Saved to %s") % self.filename)
             except EnvironmentError, e:
                 qt4.QApplication.restoreOverrideCursor()
@@ -905,14 +910,21 @@ class MainWindow(qt4.QMainWindow):
         text = u'•' * self.plotqueuecount
         self.plotqueuelabel.setText(text)
 
-    def _fileSaveDialog(self, filetype, filedescr, dialogtitle):
-        """A generic file save dialog for exporting / saving."""
+    def _fileSaveDialog(self, filetype, filedescr, dialogtitle,
+                        othertypes=()):
+        """A generic file save dialog for exporting / saving.
+
+        othertypes is an optional list of (filetype, filedescr) for
+        other types the user can choose."""
         
+        types = [(filetype, filedescr)] + list(othertypes)
+        filters = ["%s (*.%s)" % (d, t) for t, d in types]
+
         fd = qt4.QFileDialog(self, dialogtitle)
         fd.setDirectory(self.dirname)
         fd.setFileMode( qt4.QFileDialog.AnyFile )
         fd.setAcceptMode( qt4.QFileDialog.AcceptSave )
-        fd.setFilter( "%s (*.%s)" % (filedescr, filetype) )
+        fd.setNameFilters(filters)
 
         # okay was selected (and is okay to overwrite if it exists)
         if fd.exec_() == qt4.QDialog.Accepted:
@@ -921,19 +933,26 @@ class MainWindow(qt4.QMainWindow):
             # update the edit box
             filename = unicode( fd.selectedFiles()[0] )
             if os.path.splitext(filename)[1] == '':
+                selfilter = unicode(fd.selectedNameFilter())
+                if selfilter in filters:
+                    filetype = types[filters.index(selfilter)][0]
                 filename += '.' + filetype
 
             return filename
         return None
 
-    def _fileOpenDialog(self, filetype, filedescr, dialogtitle):
-        """Display an open dialog and return a filename."""
+    def _fileOpenDialog(self, filetype, filedescr, dialogtitle,
+                        othertypes=()):
+        """Display an open dialog and return a filename.
+
+        othertypes is an optional list of further filetypes to match."""
         
         fd = qt4.QFileDialog(self, dialogtitle)
         fd.setDirectory(self.dirname)
         fd.setFileMode( qt4.QFileDialog.ExistingFile )
         fd.setAcceptMode( qt4.QFileDialog.AcceptOpen )
-        fd.setFilter( "%s (*.%s)" % (filedescr, filetype) )
+        patterns = ' '.join(['*.%s' % t for t in [filetype]+list(othertypes)])
+        fd.setFilter( "%s (%s)" % (filedescr, patterns) )
         
         # if the user chooses a file
         if fd.exec_() == qt4.QDialog.Accepted:
@@ -955,7 +974,10 @@ class MainWindow(qt4.QMainWindow):
     def slotFileSaveAs(self):
         """Save As file."""
 
-        filename = self._fileSaveDialog('vsz', _('Veusz script files'), _('Save as'))
+        filename = self._fileSaveDialog(
+            'vsz', _('Veusz script files'), _('Save as'),
+            othertypes=[(document.archive_extension,
+                         _('Veusz document archives'))])
         if filename:
             self.filename = filename
             self.updateTitlebar()
@@ -1018,9 +1040,14 @@ class MainWindow(qt4.QMainWindow):
 
         qt4.QApplication.setOverrideCursor( qt4.QCursor(qt4.Qt.WaitCursor) )
 
-        # read script
+        # read script, which may be held in an archive
+        reader = None
         try:
-            script = open(filename, 'rU').read()
+            if document.isArchive(filename):
+                reader = document.ArchiveReader(filename)
+                script = reader.readScript()
+            else:
+                script = open(filename, 'rU').read()
         except EnvironmentError, e:
             qt4.QApplication.restoreOverrideCursor()
             qt4.QMessageBox.critical(
@@ -1080,12 +1107,16 @@ class MainWindow(qt4.QMainWindow):
         # allow import to happen relative to loaded file
         interface.AddImportPath( os.path.dirname(os.path.abspath(filename)) )
 
+        # datasets embedded in an archive are read from it
+        interface.archive = reader
+
         try:
             # actually run script text
             exec script in env
         except Exception, e:
             # need to remember to restore stdout, stderr
             sys.stdout, sys.stderr = stdout, stderr
+            interface.archive = None
             
             # display error dialog if there is an error loading
             qt4.QApplication.restoreOverrideCursor()
@@ -1098,6 +1129,9 @@ class MainWindow(qt4.QMainWindow):
 
         # need to remember to restore stdout, stderr
         sys.stdout, sys.stderr = stdout, stderr
+        interface.archive = None
+        if reader is not None:
+            reader.close()
 
         # document is loaded
         self.document.enableUpdates()
@@ -1136,7 +1170,9 @@ class MainWindow(qt4.QMainWindow):
     def slotFileOpen(self):
         """Open an existing file in a new window."""
 
-        filename = self._fileOpenDialog('vsz', _('Veusz script files'), _('Open'))
+        filename = self._fileOpenDialog(
+            'vsz', _('Veusz documents'), _('Open'),
+            othertypes=[document.archive_extension])
         if filename:
             self.openFile(filename)
         
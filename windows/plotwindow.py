@@ -262,6 +262,10 @@ class PlotWindow( qt4.QGraphicsView ):
         # state of last plot from painthelper
         self.painthelper = None
 
+        # layers of widgets kept between updates, so that unchanged
+        # widgets do not need to be redrawn
+        self.layercache = document.LayerCache()
+
         self.lastwidgetsselected = []
         self.oldzoom = -1.
         self.zoomfactor = 1.
@@ -896,7 +900,8 @@ class PlotWindow( qt4.QGraphicsView ):
                 # errors cause an exception window to pop up
                 try:
                     phelper = document.PaintHelper(
-                        size, scaling=self.zoomfactor, dpi=self.dpi)
+                        size, scaling=self.zoomfactor, dpi=self.dpi,
+                        layercache=self.layercache, interactive=True)
                     self.document.paintTo(phelper, self.pagenumber)
 
                 except Exception: